@@ -0,0 +1,174 @@
+"""Load Benchmark for the Login Flow.
+
+Starts a mock AAI server and the OIDC Client in the same process, then drives concurrent
+``/login`` -> ``/callback`` -> ``/token`` -> ``/logout`` flows and reports throughput and
+latency percentiles per endpoint::
+
+    python -m benchmarks.flow --flows 1000 --concurrency 50
+"""
+
+import sys
+import math
+import time
+import asyncio
+import logging
+import argparse
+
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from aiohttp import web
+
+from oidc_client.app import init
+from oidc_client.config import CONFIG, LOG
+
+from .mock_aai import MockAAI
+
+# Endpoint and the response status expected from it in a successful flow
+FLOW = (("/login", 303), ("/callback", 303), ("/token", 200), ("/logout", 303))
+
+
+class Results:
+    """Latencies and errors collected per endpoint."""
+
+    def __init__(self) -> None:
+        """Initialise empty results."""
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.elapsed = 0.0
+
+
+async def start_server(app: web.Application, host: str) -> web.AppRunner:
+    """Start a web application on a free port."""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+    return runner
+
+
+def server_url(runner: web.AppRunner) -> str:
+    """Return the base URL of a started web application."""
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}"
+
+
+def configure(aai_url: str, client_url: str, host: str) -> None:
+    """Point OIDC Client configuration at the mock AAI server."""
+    CONFIG.aai.update(
+        {
+            "url_auth": f"{aai_url}/authorize",
+            "url_token": f"{aai_url}/token",
+            "url_revoke": f"{aai_url}/revoke",
+            "url_callback": f"{client_url}/callback",
+            "url_redirect": f"{client_url}/",
+            "jwk_server": f"{aai_url}/jwk",
+        }
+    )
+    CONFIG.cookie.update({"domain": host, "secure": False})
+
+
+async def request(session: aiohttp.ClientSession, url: str, endpoint: str, status: int, results: Results) -> Optional[aiohttp.ClientResponse]:
+    """Time a request to the OIDC Client, returning the response if it had the expected status."""
+    start = time.perf_counter()
+    async with session.get(url, allow_redirects=False) as response:
+        await response.read()
+    results.latencies[endpoint].append(time.perf_counter() - start)
+    if response.status != status:
+        results.errors[endpoint] += 1
+        return None
+    return response
+
+
+async def login_flow(connector: aiohttp.BaseConnector, client_url: str, results: Results) -> None:
+    """Run one user through login, callback, token and logout."""
+    async with aiohttp.ClientSession(connector=connector, connector_owner=False, cookie_jar=aiohttp.CookieJar(unsafe=True)) as session:
+        response = await request(session, f"{client_url}/login", "/login", 303, results)
+        if response is None:
+            return
+        # Authentication at AAI is not timed
+        async with session.get(response.headers["Location"], allow_redirects=False) as aai_response:
+            callback_url = aai_response.headers["Location"]
+        for endpoint, status in FLOW[1:]:
+            url = callback_url if endpoint == "/callback" else f"{client_url}{endpoint}"
+            if await request(session, url, endpoint, status, results) is None:
+                return
+
+
+async def benchmark(flows: int, concurrency: int, host: str = "127.0.0.1") -> Results:
+    """Start mock AAI and OIDC Client, and run login flows against them."""
+    aai = MockAAI()
+    aai_runner = await start_server(aai.app, host)
+    aai.issuer = f"{server_url(aai_runner)}/"
+
+    # Trusted issuer and audience are read at startup, endpoint URLs are read from configuration per request,
+    # so that the URLs of the client can be set once it is started
+    CONFIG.aai.update({"iss": aai.issuer, "aud": aai.audience})
+    client_runner = await start_server(await init(), host)
+    client_url = server_url(client_runner)
+    configure(server_url(aai_runner), client_url, host)
+
+    results = Results()
+    remaining = iter(range(flows))
+
+    async def worker(connector: aiohttp.BaseConnector) -> None:
+        for _ in remaining:
+            await login_flow(connector, client_url, results)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(connector) for _ in range(concurrency)])
+        results.elapsed = time.perf_counter() - start
+    finally:
+        await connector.close()
+        await client_runner.cleanup()
+        await aai_runner.cleanup()
+    return results
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Return the nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def report(results: Results) -> str:
+    """Format throughput and latency percentiles per endpoint as a table."""
+    lines = [f"{'endpoint':<12}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    total = 0
+    for endpoint, _ in FLOW:
+        latencies = results.latencies.get(endpoint)
+        if not latencies:
+            continue
+        total += len(latencies)
+        rate = len(latencies) / results.elapsed
+        p50, p95, p99 = (percentile(latencies, p) * 1000 for p in (50, 95, 99))
+        lines.append(f"{endpoint:<12}{len(latencies):>10}{results.errors.get(endpoint, 0):>8}{rate:>10.1f}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}")
+    lines.append(f"{'total':<12}{total:>10}{sum(results.errors.values()):>8}{total / results.elapsed:>10.1f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the login flow benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--flows", type=int, default=500, help="number of login flows to run (default: 500)")
+    parser.add_argument("--concurrency", type=int, default=20, help="number of concurrent users (default: 20)")
+    parser.add_argument("--session-backend", choices=("cookie", "memory"), default="cookie", help="session storage to benchmark (default: cookie)")
+    args = parser.parse_args(argv)
+
+    # Per-request logging would dominate the measurements
+    LOG.setLevel(logging.WARNING)
+    CONFIG.app["session_backend"] = args.session_backend
+
+    results = asyncio.get_event_loop().run_until_complete(benchmark(args.flows, args.concurrency))
+    print(f"{args.flows} flows, concurrency {args.concurrency}, session backend {args.session_backend}, {results.elapsed:.2f} s")
+    print(report(results))
+    if results.errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Microbenchmark for the Login Redirect.
+
+Compares crafting the authorisation URL with its state, nonce and PKCE code challenge per request,
+as ``/login`` used to do, with appending them to the precomputed authorisation URL used now::
+
+    python -m benchmarks.login --number 100000
+"""
+
+import timeit
+import asyncio
+import secrets
+import argparse
+import urllib.parse
+
+from types import SimpleNamespace
+from typing import Callable, List, Optional, Tuple
+
+from oidc_client.config import CONFIG, DEFAULT_PROVIDER
+from oidc_client.endpoints.login import provider_authorisation_url
+from oidc_client.utils.utils import generate_state, generate_pkce
+
+# Default provider configured in the [aai] section
+PROVIDER = SimpleNamespace(name=DEFAULT_PROVIDER, aai=CONFIG.aai)
+
+
+async def legacy_state() -> Tuple[str, str, str]:
+    """Generate a state, a nonce and a PKCE code challenge in a coroutine, as before."""
+    _, code_challenge = generate_pkce()
+    return secrets.token_hex(), secrets.token_hex(), code_challenge
+
+
+def legacy_login_url(loop: asyncio.AbstractEventLoop) -> str:
+    """Craft the authorisation URL from scratch, as before."""
+    state, nonce, code_challenge = loop.run_until_complete(legacy_state())
+    params = {
+        "client_id": CONFIG.aai["client_id"],
+        "response_type": "code",
+        "state": state,
+        "redirect_uri": CONFIG.aai["url_callback"],
+        "scope": " ".join(CONFIG.aai["scope"].split(",")),
+        "nonce": nonce,
+        "code_challenge": code_challenge,
+        "code_challenge_method": "S256",
+    }
+    return f"{CONFIG.aai['url_auth']}?{urllib.parse.urlencode(params)}"
+
+
+async def precomputed_state() -> Tuple[str, str, str]:
+    """Generate a state, a nonce and a PKCE code challenge in the login coroutine."""
+    _, code_challenge = generate_pkce()
+    return generate_state(), generate_state(), code_challenge
+
+
+def login_url(loop: asyncio.AbstractEventLoop) -> str:
+    """Append a state, a nonce and a PKCE code challenge to the precomputed authorisation URL, as ``/login`` does."""
+    state, nonce, code_challenge = loop.run_until_complete(precomputed_state())
+    return f"{provider_authorisation_url(PROVIDER)}{state}&nonce={nonce}&code_challenge={code_challenge}"
+
+
+def measure(function: Callable[[asyncio.AbstractEventLoop], str], loop: asyncio.AbstractEventLoop, number: int, repeat: int) -> float:
+    """Return the best time per call in microseconds."""
+    return min(timeit.repeat(lambda: function(loop), number=number, repeat=repeat)) / number * 1e6
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the login redirect microbenchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--number", type=int, default=20000, help="number of URLs crafted per measurement (default: 20000)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of measurements, the best is reported (default: 5)")
+    args = parser.parse_args(argv)
+
+    # Both variants run one coroutine per call, so that the event loop overhead is the same,
+    # and the difference is the work done in the coroutine
+    loop = asyncio.new_event_loop()
+    try:
+        legacy = measure(legacy_login_url, loop, args.number, args.repeat)
+        precomputed = measure(login_url, loop, args.number, args.repeat)
+    finally:
+        loop.close()
+    print(f"{'variant':<14}{'us/call':>10}")
+    print(f"{'legacy':<14}{legacy:>10.2f}")
+    print(f"{'precomputed':<14}{precomputed:>10.2f}")
+    print(f"speedup {legacy / precomputed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
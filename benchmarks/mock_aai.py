@@ -0,0 +1,69 @@
+"""Mock AAI Server."""
+
+import time
+import base64
+import hashlib
+import secrets
+import urllib.parse
+
+from typing import Optional
+
+from aiohttp import web
+from authlib.jose import JsonWebKey, jwt
+
+
+class MockAAI:
+    """Local OIDC server, that authenticates every user and signs real access tokens."""
+
+    def __init__(self, audience: str = "audience1", lifetime: int = 3600) -> None:
+        """Generate a signing key and set up the AAI endpoints."""
+        self.issuer = ""
+        self.audience = audience
+        self.lifetime = lifetime
+        self.key = JsonWebKey.generate_key("RSA", 2048, is_private=True)
+        self.jwk = dict(JsonWebKey.import_key(self.key.get_public_key(), {"kty": "RSA"}).as_dict(), kid="mock", alg="RS256", use="sig")
+        self.codes: dict = {}
+        self.app = web.Application()
+        self.app.router.add_get("/authorize", self.authorize)
+        self.app.router.add_post("/token", self.token)
+        self.app.router.add_get("/jwk", self.jwks)
+        self.app.router.add_get("/revoke", self.revoke)
+
+    def sign(self, subject: str, audience: Optional[str] = None, **claims) -> str:
+        """Sign an access token for a subject, or an ID token if the audience is a client."""
+        now = int(time.time())
+        header = {"alg": "RS256", "kid": "mock"}
+        payload = dict(claims, iss=self.issuer, aud=audience or self.audience, sub=subject, iat=now, exp=now + self.lifetime)
+        return jwt.encode(header, payload, self.key).decode("utf-8")
+
+    async def authorize(self, request: web.Request) -> web.Response:
+        """Authenticate the user and redirect back to the client with a code."""
+        code = secrets.token_urlsafe(16)
+        self.codes[code] = dict(request.query)
+        params = {"code": code, "state": request.query["state"]}
+        raise web.HTTPSeeOther(f"{request.query['redirect_uri']}?{urllib.parse.urlencode(params)}")
+
+    async def token(self, request: web.Request) -> web.Response:
+        """Exchange a code for an access token."""
+        data = await request.post()
+        login = self.codes.pop(data.get("code"), None)
+        if data.get("grant_type") != "authorization_code" or login is None:
+            return web.json_response({"error": "invalid_grant"}, status=400)
+        if "code_challenge" in login:
+            # Verify PKCE, see RFC 7636
+            digest = hashlib.sha256(str(data.get("code_verifier", "")).encode()).digest()
+            if base64.urlsafe_b64encode(digest).decode().rstrip("=") != login["code_challenge"]:
+                return web.json_response({"error": "invalid_grant"}, status=400)
+        subject = f"user-{secrets.token_hex(4)}"
+        tokens = {"access_token": self.sign(subject), "token_type": "Bearer", "expires_in": self.lifetime}
+        if "nonce" in login:
+            tokens["id_token"] = self.sign(subject, login["client_id"], nonce=login["nonce"])
+        return web.json_response(tokens)
+
+    async def jwks(self, request: web.Request) -> web.Response:
+        """Return the public key set."""
+        return web.json_response({"keys": [self.jwk]})
+
+    async def revoke(self, request: web.Request) -> web.Response:
+        """Accept token revocation."""
+        return web.json_response({})
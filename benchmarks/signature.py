@@ -0,0 +1,66 @@
+"""Microbenchmark for Token Signature Verification.
+
+Compares decoding signed tokens with the generic ``jwt.decode`` of authlib, as ``decode_token`` used to do,
+with the verifier of the key cache, that parses the token once and verifies RS256, ES256 and EdDSA signatures
+with public keys prepared once per key. Claims are not validated, as they are validated the same way by both::
+
+    python -m benchmarks.signature --number 20000
+"""
+
+import timeit
+import argparse
+
+from typing import Callable, List, Optional
+
+from authlib.jose import JsonWebKey, jwt
+from authlib.jose.rfc7517.models import Key
+
+from oidc_client.utils.jws import Verifier, parse_compact
+from oidc_client.utils.utils import token_header
+
+# Keys of the algorithms used by AAI providers
+ALGORITHMS = (("RS256", "RSA", 2048), ("ES256", "EC", "P-256"), ("EdDSA", "OKP", "Ed25519"))
+
+
+def legacy_decode(token: str, keys: dict) -> None:
+    """Read the key ID, and decode the token with authlib, as before."""
+    jwt.decode(token, keys[token_header(token).get("kid")])
+
+
+def verifier_decode(token: str, verifiers: dict) -> None:
+    """Parse the token once, and decode it with the verifier of its key."""
+    jws = parse_compact(token)
+    verifiers[jws.header.get("kid")].decode(token, jws, {})
+
+
+def measure(function: Callable[..., None], args: tuple, number: int, repeat: int) -> float:
+    """Return the best rate of calls per second."""
+    return number / min(timeit.repeat(lambda: function(*args), number=number, repeat=repeat))
+
+
+def signed_token(alg: str, kty: str, crv_or_size) -> tuple:
+    """Sign a token with a new key, and return it with the public key."""
+    private = JsonWebKey.generate_key(kty, crv_or_size, is_private=True)
+    public: Key = type(private).import_key(private.get_public_key())
+    payload = {"iss": "https://aai.example.org/", "sub": "user", "aud": "audience", "iat": 1000, "exp": 9999999999}
+    return jwt.encode({"alg": alg, "kid": alg}, payload, private).decode(), public
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the signature verification microbenchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--number", type=int, default=5000, help="number of tokens decoded per measurement (default: 5000)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of measurements, the best is reported (default: 5)")
+    args = parser.parse_args(argv)
+
+    print("Tokens decoded per second")
+    print(f"{'algorithm':<12}{'authlib':>12}{'verifier':>12}{'speedup':>10}")
+    for alg, kty, crv_or_size in ALGORITHMS:
+        token, key = signed_token(alg, kty, crv_or_size)
+        legacy = measure(legacy_decode, (token, {alg: key}), args.number, args.repeat)
+        verifier = measure(verifier_decode, (token, {alg: Verifier(key)}), args.number, args.repeat)
+        print(f"{alg:<12}{legacy:>12.0f}{verifier:>12.0f}{verifier / legacy:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Startup Benchmark.
+
+Measures the cold start of a worker in fresh interpreters: the time to import ``oidc_client.app``,
+the time ``init()`` takes, and the time to the first response of the server to ``/``, counted from
+before the import. Modules, that are imported only on first use, are listed if they were not needed
+for the first response::
+
+    python -m benchmarks.startup --runs 10
+
+Only the standard library is imported here at module level, so that the child interpreters measure
+the imports of the OIDC Client and its dependencies.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess  # nosec
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Heavy modules, that the server imports when they are first used
+DEFERRED_MODULES = ("authlib.jose", "aiocache", "oidc_client.utils.jws")
+
+# Started in a fresh interpreter for each run, the clock is started before anything else is imported
+CHILD = "import time; started = time.perf_counter(); from benchmarks.startup import cold_start; cold_start(started)"
+
+STAGES = ("import", "init", "first_response")
+
+
+async def first_response(started: float) -> Dict[str, float]:
+    """Import and initialise the server, serve a request to ``/``, and return the timings since ``started``."""
+    from oidc_client.app import init
+
+    imported = time.perf_counter()
+    app = await init()
+    initialised = time.perf_counter()
+
+    from aiohttp import ClientSession
+    from aiohttp.test_utils import TestServer
+
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        async with ClientSession() as session:
+            async with session.get(server.make_url("/")) as response:
+                await response.read()
+        responded = time.perf_counter()
+    finally:
+        await server.close()
+    return {"import": imported - started, "init": initialised - imported, "first_response": responded - started}
+
+
+def cold_start(started: float) -> None:
+    """Measure a cold start in this interpreter, and print the timings as JSON."""
+    timings: dict = asyncio.get_event_loop().run_until_complete(first_response(started))
+    timings["deferred"] = [module for module in DEFERRED_MODULES if module not in sys.modules]
+    print(json.dumps(timings))
+
+
+def run_child() -> dict:
+    """Run a cold start in a fresh interpreter, and return its timings."""
+    root = Path(__file__).resolve().parent.parent
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)  # nosec
+    return json.loads(output.stdout.decode().strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the startup benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--runs", type=int, default=5, help="number of cold starts measured (default: 5)")
+    args = parser.parse_args(argv)
+
+    runs = [run_child() for _ in range(args.runs)]
+    print(f"{args.runs} cold starts, milliseconds")
+    print(f"{'stage':<16}{'best':>10}{'median':>10}")
+    for stage in STAGES:
+        values = [run[stage] * 1000 for run in runs]
+        print(f"{stage:<16}{min(values):>10.1f}{statistics.median(values):>10.1f}")
+    print(f"not imported before the first response: {', '.join(runs[-1]['deferred']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
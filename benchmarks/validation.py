@@ -0,0 +1,90 @@
+"""Microbenchmark for Token Validation.
+
+Compares validating access tokens with claims options built per token, as ``decode_token`` used to do,
+with the claims validator built once at startup. Tokens are signed by the mock AAI server, and
+validation results are not cached, so that every token is decoded. As the signature check dominates
+decoding, the claims check is also measured alone::
+
+    python -m benchmarks.validation --number 20000
+"""
+
+import timeit
+import argparse
+
+from typing import Callable, List, Optional
+
+from authlib.jose import JsonWebKey, JWTClaims, jwt
+
+from oidc_client.config import CONFIG
+from oidc_client.utils.claims import ClaimsValidator
+
+from .mock_aai import MockAAI
+
+
+def legacy_options() -> dict:
+    """Build claims options from configuration, as before."""
+    return {
+        "iss": {"essential": True, "values": CONFIG.aai["iss"].split(",")},
+        "aud": {"essential": True, "values": CONFIG.aai["aud"].split(",")},
+        "iat": {"essential": True},
+        "exp": {"essential": True},
+    }
+
+
+def legacy_validate(token: str, key: JsonWebKey) -> None:
+    """Decode and validate a token with claims options built per token, as before."""
+    jwt.decode(token, key, claims_options=legacy_options()).validate()
+
+
+def legacy_claims(claims: JWTClaims) -> None:
+    """Validate decoded claims with claims options built per token, as before."""
+    JWTClaims(claims, claims.header, options=legacy_options()).validate()
+
+
+def validator_validate(validator: ClaimsValidator, token: str, key: JsonWebKey) -> None:
+    """Decode and validate a token with a validator built once."""
+    validator.validate(jwt.decode(token, key, claims_options=validator.options))
+
+
+def validator_claims(validator: ClaimsValidator, claims: JWTClaims) -> None:
+    """Validate decoded claims with a validator built once."""
+    validator.validate(JWTClaims(claims, claims.header, options=validator.options))
+
+
+def measure(function: Callable[..., None], args: tuple, number: int, repeat: int) -> float:
+    """Return the best rate of calls per second."""
+    return number / min(timeit.repeat(lambda: function(*args), number=number, repeat=repeat))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the token validation microbenchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--number", type=int, default=5000, help="number of tokens validated per measurement (default: 5000)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of measurements, the best is reported (default: 5)")
+    parser.add_argument("--issuers", type=int, default=1, help="number of trusted issuers and audiences configured (default: 1)")
+    args = parser.parse_args(argv)
+
+    # The token is issued by the last of the trusted issuers, for the last of the audiences
+    aai = MockAAI(audience=f"audience{args.issuers}")
+    aai.issuer = f"https://aai{args.issuers}.example.org/"
+    issuers = [f"https://aai{i}.example.org/" for i in range(1, args.issuers + 1)]
+    audiences = [f"audience{i}" for i in range(1, args.issuers + 1)]
+    CONFIG.aai.update({"iss": ",".join(issuers), "aud": ",".join(audiences)})
+
+    token = aai.sign("user")
+    key = JsonWebKey.import_key(aai.jwk)
+    claims = jwt.decode(token, key)
+    validator = ClaimsValidator(issuers, audiences)
+    variants = {
+        "decode": ((legacy_validate, (token, key)), (validator_validate, (validator, token, key))),
+        "claims only": ((legacy_claims, (claims,)), (validator_claims, (validator, claims))),
+    }
+    print(f"{args.issuers} trusted issuers and audiences, RS256 tokens, validations per second")
+    print(f"{'variant':<14}{'legacy':>12}{'validator':>12}{'speedup':>10}")
+    for variant, functions in variants.items():
+        legacy, prebuilt = (measure(function, function_args, args.number, args.repeat) for function, function_args in functions)
+        print(f"{variant:<14}{legacy:>12.0f}{prebuilt:>12.0f}{prebuilt / legacy:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,5 +3,12 @@
 THE_HOST=${APP_HOST:="0.0.0.0"}
 THE_PORT=${APP_PORT:="8080"}
 
+# Number of workers, session backend `memory` is refused with more than one worker
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:="4"}
+
+# Workers share their metrics through files in this directory, stale metrics files from previous runs are removed
+export METRICS_DIR=${METRICS_DIR:="/tmp/oidc-client-metrics"}
+mkdir -p "$METRICS_DIR" && rm -f "$METRICS_DIR"/metrics_*.db
+
 echo 'Start oidc-client web server'
-exec gunicorn oidc_client.app:init --bind $THE_HOST:$THE_PORT --worker-class aiohttp.GunicornUVLoopWebWorker --workers 4
\ No newline at end of file
+exec gunicorn oidc_client.app:init --bind $THE_HOST:$THE_PORT --worker-class aiohttp.GunicornUVLoopWebWorker --workers $WEB_CONCURRENCY
@@ -4,12 +4,27 @@ import sys
 
 from aiohttp import web
 from aiohttp_session import setup as session_setup
-from aiohttp_session.cookie_storage import EncryptedCookieStorage
 
 from .endpoints.login import login_request
 from .endpoints.logout import logout_request
 from .endpoints.callback import callback_request
 from .endpoints.token import token_request
+from .endpoints.introspect import introspect_request
+from .endpoints.refresh import refresh_request
+from .endpoints.userinfo import userinfo_request
+from .endpoints.revoke import revoke_request
+from .endpoints.monitor import monitor_request
+from .utils.utils import create_client_session
+from .utils.cache import LRUCache, create_shared_cache, close_shared_cache
+from .utils.providers import Provider, setup_providers, start_providers, close_providers
+from .utils.session import create_session_storage, close_session_storage
+from .utils.offload import CryptoExecutor, close_crypto_executor
+from .utils.monitor import LoopMonitor, HandlerProfiler, start_loop_monitor, close_loop_monitor
+from .utils.revocation import RevocationQueue, start_revocation_queue, close_revocation_queue
+from .utils.renewal import TokenRenewer, start_token_renewer, close_token_renewer
+from .utils.middlewares import preserve_cookies, load_shedding, handler_profiling, request_logging
+from .utils.logs import setup_logging, add_request_id, close_log_listener
+from .utils.metrics import REGISTRY
 from .config import CONFIG, LOG
 
 routes = web.RouteTableDef()
@@ -42,6 +57,13 @@ async def callback(request: web.Request):
     await callback_request(request)
 
 
+@routes.get("/refresh")
+async def refresh(request: web.Request):
+    """Refresh access token with the refresh token in session storage."""
+    LOG.info("Received request to GET /refresh.")
+    await refresh_request(request)
+
+
 @routes.get("/token")
 async def token(request: web.Request) -> web.Response:
     """Display token from session storage or cookies."""
@@ -50,16 +72,140 @@ async def token(request: web.Request) -> web.Response:
     return web.json_response({"access_token": access_token})
 
 
+@routes.get("/userinfo")
+async def userinfo(request: web.Request) -> web.Response:
+    """Display user information from AAI for the access token in session storage."""
+    LOG.info("Received request to GET /userinfo.")
+    result = await userinfo_request(request)
+    return web.json_response(result)
+
+
+@routes.post("/introspect")
+async def introspect(request: web.Request) -> web.Response:
+    """Introspect access tokens by validating them locally."""
+    LOG.info("Received request to POST /introspect.")
+    result = await introspect_request(request)
+    return web.json_response(result)
+
+
+@routes.post("/admin/revoke")
+async def revoke(request: web.Request) -> web.StreamResponse:
+    """Revoke tokens in bulk at AAI."""
+    LOG.info("Received request to POST /admin/revoke.")
+    return await revoke_request(request)
+
+
+@routes.get("/admin/monitor")
+async def monitor(request: web.Request) -> web.Response:
+    """Display event loop lag, handler timings and slow handlers of this worker."""
+    LOG.info("Received request to GET /admin/monitor.")
+    result = await monitor_request(request)
+    return web.json_response(result)
+
+
+@routes.get("/metrics")
+async def metrics(request: web.Request) -> web.Response:
+    """Expose metrics of all workers in Prometheus text format."""
+    LOG.debug("Received request to GET /metrics.")
+    return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
 async def init() -> web.Application:
     """Initialise web server."""
+    # Write logs as configured, from a background thread with a log queue
+    log_listener = setup_logging(CONFIG.logging["log_format"], CONFIG.logging["log_queue"])
     LOG.info("Initialise web server.")
 
-    # Initialise server object
-    server = web.Application()
+    # Shed requests beyond the concurrency limits before any work is done for them
+    shedding = load_shedding(
+        CONFIG.limits["max_in_flight"],
+        CONFIG.limits["max_queued"],
+        CONFIG.limits["queue_timeout"],
+        CONFIG.limits["retry_after"],
+        CONFIG.limits["route_limits"],
+    )
+
+    # Give log lines of requests their correlation ID, and time and sample handlers of admitted requests over the threshold
+    middlewares: list = [request_logging(CONFIG.logging["log_sample_rate"]), shedding, preserve_cookies]
+    profiler = None
+    if CONFIG.monitor["slow_handler_threshold"] > 0:
+        profiler = HandlerProfiler(
+            CONFIG.monitor["slow_handler_threshold"],
+            profile=CONFIG.monitor["slow_handler_profile"],
+            records=CONFIG.monitor["slow_handler_records"],
+        )
+        middlewares.insert(2, handler_profiling(profiler))
 
-    # Create encrypted session storage
-    # Encryption key must be 32 len bytes
-    session_setup(server, EncryptedCookieStorage(CONFIG.app["session_key"].encode()))
+    # Initialise server object
+    server = web.Application(middlewares=middlewares)
+    if profiler is not None:
+        server["handler_profiler"] = profiler
+    server.on_response_prepare.append(add_request_id)
+
+    # Verify token signatures and encrypt session cookies in a thread pool, if threads are configured
+    server["crypto_executor"] = CryptoExecutor(CONFIG.offload["crypto_threads"], CONFIG.offload["crypto_offload_threshold"])
+
+    # Create session storage, encrypted cookies by default
+    server["session_storage"] = create_session_storage(server["crypto_executor"])
+    session_setup(server, server["session_storage"])
+
+    # Create cache shared by all workers, behind the caches of each worker
+    server["shared_cache"] = create_shared_cache()
+
+    # Create AAI providers, each with its own pooled client session, circuit breaker, key cache and claims validators
+    providers = {
+        name: Provider(name, aai, await create_client_session(), server["shared_cache"], server["crypto_executor"]) for name, aai in CONFIG.providers.items()
+    }
+    setup_providers(server, providers)
+    server.on_startup.append(start_providers)
+
+    # Create cache for access token validation results
+    server["token_cache"] = LRUCache(CONFIG.cache["token_cache_size"])
+
+    # Create cache for userinfo responses
+    server["userinfo_cache"] = LRUCache(CONFIG.cache["userinfo_cache_size"])
+
+    # Renew access tokens of server-side sessions in the background
+    if CONFIG.renewal["token_renewal"]:
+        server["token_renewer"] = TokenRenewer(
+            server,
+            server["session_storage"],
+            margin=CONFIG.renewal["renewal_margin"],
+            batch_size=CONFIG.renewal["renewal_batch_size"],
+            rate=CONFIG.renewal["renewal_rate"],
+        )
+        server.on_startup.append(start_token_renewer)
+        server.on_cleanup.append(close_token_renewer)
+
+    # Revoke tokens at AAI in the background, queued tokens are revoked before the providers are closed
+    server["revocation_queue"] = RevocationQueue(
+        maxsize=CONFIG.revocation["revocation_queue_size"],
+        workers=CONFIG.revocation["revocation_workers"],
+        retries=CONFIG.revocation["revocation_retries"],
+        backoff=CONFIG.revocation["revocation_backoff"],
+    )
+    server.on_startup.append(start_revocation_queue)
+    server.on_cleanup.append(close_revocation_queue)
+
+    server.on_cleanup.append(close_session_storage)
+    server.on_cleanup.append(close_providers)
+    server.on_cleanup.append(close_shared_cache)
+    server.on_cleanup.append(close_crypto_executor)
+
+    # Measure event loop lag, e.g. to compare it with and without crypto threads
+    if CONFIG.monitor["loop_lag_interval"] > 0:
+        server["loop_monitor"] = LoopMonitor(CONFIG.monitor["loop_lag_interval"])
+        server.on_startup.append(start_loop_monitor)
+        server.on_cleanup.append(close_loop_monitor)
+
+    # Logs are written from the background thread until everything else is closed
+    if log_listener is not None:
+        server["log_listener"] = log_listener
+        server.on_cleanup.append(close_log_listener)
+
+    # Share metrics with other workers through files in metrics directory
+    if CONFIG.app["metrics_dir"]:
+        REGISTRY.open(CONFIG.app["metrics_dir"])
 
     # Gather endpoints
     server.router.add_routes(routes)
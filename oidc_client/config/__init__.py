@@ -1,6 +1,7 @@
 """OIDC Client Configuration."""
 
 import os
+import re
 import secrets
 import logging
 
@@ -9,10 +10,71 @@ from configparser import ConfigParser
 from collections import namedtuple
 from distutils.util import strtobool
 
-formatting = "[%(asctime)s][%(name)s][%(process)d %(processName)s][%(levelname)-8s] (L:%(lineno)s) %(module)s | %(funcName)s: %(message)s"
-logging.basicConfig(level=logging.DEBUG if bool(strtobool(os.environ.get("DEBUG", "False"))) else logging.INFO, format=formatting)
+# Logging is set up by the server and the command line tools with `setup_logging`, not on import
 LOG = logging.getLogger("oidc")
 
+SESSION_BACKENDS = ("cookie", "memory", "redis")
+
+LOG_FORMATS = ("text", "json")
+
+# Name of the provider configured in the [aai] section
+DEFAULT_PROVIDER = "default"
+
+# Variables of an [aai:<name>] section, that are specific to the provider and are not taken from the [aai] section
+PROVIDER_VARIABLES = (
+    "client_id",
+    "client_secret",
+    "url_auth",
+    "url_token",
+    "url_userinfo",
+    "url_revoke",
+    "iss",
+    "aud",
+    "jwk_server",
+    "url_discovery",
+    "required_claims",
+)
+
+
+def parse_provider(config: ConfigParser, section: str, defaults: dict) -> dict:
+    """Parse an [aai:<name>] section, variables missing from it are taken from the [aai] section.
+
+    Variables can be overwritten with environment variables prefixed with the provider name,
+    e.g. `ELIXIR_CLIENT_SECRET` for the `client_secret` of section [aai:elixir].
+    """
+    prefix = re.sub(r"\W", "_", section.split(":", 1)[1]).upper()
+    provider = {}
+    for key, default in defaults.items():
+        value = os.environ.get(f"{prefix}_{key.upper()}", config.get(section, key, fallback=None))
+        if not value:
+            provider[key] = None if key in PROVIDER_VARIABLES else default
+        elif isinstance(default, (int, float)):
+            provider[key] = type(default)(value)
+        else:
+            provider[key] = value
+    for key in ("client_id", "client_secret", "iss"):
+        if provider[key] is None:
+            raise ValueError(f"Provider section [{section}] is missing {key}.")
+    # Endpoints and keys are taken from the discovery document, unless they are configured
+    if not provider["url_discovery"]:
+        for key in ("url_auth", "url_token", "jwk_server"):
+            if provider[key] is None:
+                raise ValueError(f"Provider section [{section}] is missing {key} or url_discovery.")
+    return provider
+
+
+def index_issuers(providers: dict) -> dict:
+    """Map each trusted issuer to the name of its provider, an issuer may be trusted by one provider only."""
+    issuers: dict = {}
+    for name, provider in providers.items():
+        for issuer in (provider["iss"] or "").split(","):
+            issuer = issuer.strip()
+            if issuer in issuers:
+                raise ValueError(f"Issuer {issuer} is trusted by providers {issuers[issuer]} and {name}.")
+            if issuer:
+                issuers[issuer] = name
+    return issuers
+
 
 def parse_config_file(path):
     """Parse configuration file."""
@@ -24,6 +86,15 @@ def parse_config_file(path):
             "port": os.environ.get("PORT", config.get("app", "port")) or 8080,
             "name": os.environ.get("NAME", config.get("app", "name")) or "oidc-client",
             "session_key": os.environ.get("SESSION_KEY", config.get("app", "session_key")) or secrets.token_hex(16),
+            "session_backend": os.environ.get("SESSION_BACKEND", config.get("app", "session_backend", fallback="cookie")) or "cookie",
+            "session_max_entries": int(os.environ.get("SESSION_MAX_ENTRIES", config.get("app", "session_max_entries", fallback="100000"))) or 100000,
+            "session_redis_url": (
+                os.environ.get("SESSION_REDIS_URL", config.get("app", "session_redis_url", fallback="redis://localhost:6379/0")) or "redis://localhost:6379/0"
+            ),
+            "metrics_dir": os.environ.get("METRICS_DIR", config.get("app", "metrics_dir", fallback="")) or None,
+            "introspect_max_tokens": int(os.environ.get("INTROSPECT_MAX_TOKENS", config.get("app", "introspect_max_tokens", fallback="100"))) or 100,
+            "introspection_token": os.environ.get("INTROSPECTION_TOKEN", config.get("app", "introspection_token", fallback="")) or None,
+            "admin_token": os.environ.get("ADMIN_TOKEN", config.get("app", "admin_token", fallback="")) or None,
         },
         "cookie": {
             "domain": os.environ.get("DOMAIN", config.get("cookie", "domain")) or "localhost",
@@ -44,10 +115,116 @@ def parse_config_file(path):
             "scope": os.environ.get("SCOPE", config.get("aai", "scope")) or "openid",
             "iss": os.environ.get("ISS", config.get("aai", "iss")) or None,
             "aud": os.environ.get("AUD", config.get("aai", "aud")) or None,
+            "token_leeway": int(os.environ.get("TOKEN_LEEWAY", config.get("aai", "token_leeway", fallback="0")) or 0),
+            "required_claims": os.environ.get("REQUIRED_CLAIMS", config.get("aai", "required_claims", fallback="")) or None,
             "jwk_server": os.environ.get("JWK_SERVER", config.get("aai", "jwk_server")) or None,
+            "jwk_lifetime": int(os.environ.get("JWK_LIFETIME", config.get("aai", "jwk_lifetime", fallback="3600"))) or 3600,
+            "jwk_refresh": int(os.environ.get("JWK_REFRESH", config.get("aai", "jwk_refresh", fallback="300"))) or 300,
+            "jwk_timeout": float(os.environ.get("JWK_TIMEOUT", config.get("aai", "jwk_timeout", fallback="2"))) or 2.0,
+            "jwk_max_stale": int(os.environ.get("JWK_MAX_STALE", config.get("aai", "jwk_max_stale", fallback="86400"))) or 86400,
+            "url_discovery": os.environ.get("URL_DISCOVERY", config.get("aai", "url_discovery", fallback="")) or None,
+            "discovery_lifetime": int(os.environ.get("DISCOVERY_LIFETIME", config.get("aai", "discovery_lifetime", fallback="3600"))) or 3600,
+            "discovery_retry": int(os.environ.get("DISCOVERY_RETRY", config.get("aai", "discovery_retry", fallback="60"))) or 60,
+            "discovery_timeout": float(os.environ.get("DISCOVERY_TIMEOUT", config.get("aai", "discovery_timeout", fallback="5"))) or 5.0,
+        },
+        "cache": {
+            "token_cache_size": int(os.environ.get("TOKEN_CACHE_SIZE", config.get("cache", "token_cache_size", fallback="4096"))) or 4096,
+            "token_cache_lifetime": int(os.environ.get("TOKEN_CACHE_LIFETIME", config.get("cache", "token_cache_lifetime", fallback="300"))) or 300,
+            "token_cache_negative_lifetime": int(
+                os.environ.get("TOKEN_CACHE_NEGATIVE_LIFETIME", config.get("cache", "token_cache_negative_lifetime", fallback="10")) or 10
+            ),
+            "userinfo_cache_size": int(os.environ.get("USERINFO_CACHE_SIZE", config.get("cache", "userinfo_cache_size", fallback="4096"))) or 4096,
+            "userinfo_cache_lifetime": int(os.environ.get("USERINFO_CACHE_LIFETIME", config.get("cache", "userinfo_cache_lifetime", fallback="3600"))) or 3600,
+            "shared_cache_url": os.environ.get("SHARED_CACHE_URL", config.get("cache", "shared_cache_url", fallback="")) or None,
+            "shared_cache_timeout": float(os.environ.get("SHARED_CACHE_TIMEOUT", config.get("cache", "shared_cache_timeout", fallback="0.05"))) or 0.05,
+        },
+        "client": {
+            "connection_limit": int(os.environ.get("CONNECTION_LIMIT", config.get("client", "connection_limit", fallback="100"))) or 100,
+            "connection_limit_per_host": int(
+                os.environ.get("CONNECTION_LIMIT_PER_HOST", config.get("client", "connection_limit_per_host", fallback="50")) or 50
+            ),
+            "keepalive_timeout": float(os.environ.get("KEEPALIVE_TIMEOUT", config.get("client", "keepalive_timeout", fallback="30"))) or 30.0,
+            "dns_cache_ttl": int(os.environ.get("DNS_CACHE_TTL", config.get("client", "dns_cache_ttl", fallback="300"))) or 300,
+            "connect_timeout": float(os.environ.get("CONNECT_TIMEOUT", config.get("client", "connect_timeout", fallback="2"))) or 2.0,
+            "read_timeout": float(os.environ.get("READ_TIMEOUT", config.get("client", "read_timeout", fallback="5"))) or 5.0,
+            "token_read_timeout": float(os.environ.get("TOKEN_READ_TIMEOUT", config.get("client", "token_read_timeout", fallback="10"))) or 10.0,
+            "aai_retries": int(os.environ.get("AAI_RETRIES", config.get("client", "aai_retries", fallback="2")) or 2),
+            "aai_retry_backoff": float(os.environ.get("AAI_RETRY_BACKOFF", config.get("client", "aai_retry_backoff", fallback="0.2"))) or 0.2,
+            "breaker_threshold": int(os.environ.get("BREAKER_THRESHOLD", config.get("client", "breaker_threshold", fallback="5"))) or 5,
+            "breaker_reset_timeout": float(os.environ.get("BREAKER_RESET_TIMEOUT", config.get("client", "breaker_reset_timeout", fallback="30"))) or 30.0,
+        },
+        "renewal": {
+            "token_renewal": bool(strtobool(os.environ.get("TOKEN_RENEWAL", config.get("renewal", "token_renewal", fallback="False")) or "False")),
+            "renewal_margin": int(os.environ.get("RENEWAL_MARGIN", config.get("renewal", "renewal_margin", fallback="300"))) or 300,
+            "renewal_batch_size": int(os.environ.get("RENEWAL_BATCH_SIZE", config.get("renewal", "renewal_batch_size", fallback="10"))) or 10,
+            "renewal_rate": float(os.environ.get("RENEWAL_RATE", config.get("renewal", "renewal_rate", fallback="5"))) or 5.0,
+        },
+        "revocation": {
+            "revocation_queue_size": int(os.environ.get("REVOCATION_QUEUE_SIZE", config.get("revocation", "revocation_queue_size", fallback="1000"))) or 1000,
+            "revocation_workers": int(os.environ.get("REVOCATION_WORKERS", config.get("revocation", "revocation_workers", fallback="4"))) or 4,
+            "revocation_retries": int(os.environ.get("REVOCATION_RETRIES", config.get("revocation", "revocation_retries", fallback="3"))) or 3,
+            "revocation_backoff": float(os.environ.get("REVOCATION_BACKOFF", config.get("revocation", "revocation_backoff", fallback="0.5"))) or 0.5,
+            "revocation_concurrency": int(os.environ.get("REVOCATION_CONCURRENCY", config.get("revocation", "revocation_concurrency", fallback="20"))) or 20,
+        },
+        "limits": {
+            "max_in_flight": int(os.environ.get("MAX_IN_FLIGHT", config.get("limits", "max_in_flight", fallback="100")) or 100),
+            "max_queued": int(os.environ.get("MAX_QUEUED", config.get("limits", "max_queued", fallback="200")) or 200),
+            "queue_timeout": float(os.environ.get("QUEUE_TIMEOUT", config.get("limits", "queue_timeout", fallback="5"))) or 5.0,
+            "retry_after": int(os.environ.get("RETRY_AFTER", config.get("limits", "retry_after", fallback="1"))) or 1,
+            "route_limits": os.environ.get("ROUTE_LIMITS", config.get("limits", "route_limits", fallback="/callback=50:100,/=0:0,/metrics=0:0")) or None,
+        },
+        "offload": {
+            "crypto_threads": int(os.environ.get("CRYPTO_THREADS", config.get("offload", "crypto_threads", fallback="0")) or 0),
+            "crypto_offload_threshold": int(os.environ.get("CRYPTO_OFFLOAD_THRESHOLD", config.get("offload", "crypto_offload_threshold", fallback="512")) or 0),
+        },
+        "monitor": {
+            "loop_lag_interval": float(os.environ.get("LOOP_LAG_INTERVAL", config.get("monitor", "loop_lag_interval", fallback="1")) or 0),
+            "slow_handler_threshold": float(os.environ.get("SLOW_HANDLER_THRESHOLD", config.get("monitor", "slow_handler_threshold", fallback="0")) or 0),
+            "slow_handler_profile": bool(
+                strtobool(os.environ.get("SLOW_HANDLER_PROFILE", config.get("monitor", "slow_handler_profile", fallback="False")) or "False")
+            ),
+            "slow_handler_records": int(os.environ.get("SLOW_HANDLER_RECORDS", config.get("monitor", "slow_handler_records", fallback="20"))) or 20,
+        },
+        "logging": {
+            "log_format": os.environ.get("LOG_FORMAT", config.get("logging", "log_format", fallback="text")) or "text",
+            "log_queue": bool(strtobool(os.environ.get("LOG_QUEUE", config.get("logging", "log_queue", fallback="False")) or "False")),
+            "log_sample_rate": float(os.environ.get("LOG_SAMPLE_RATE", config.get("logging", "log_sample_rate", fallback="1")) or 1),
         },
     }
+    # Further AAI servers are configured in [aai:<name>] sections, and chosen at login with `/login?provider=<name>`
+    config_vars["providers"] = {DEFAULT_PROVIDER: config_vars["aai"]}
+    for section in config.sections():
+        if section.startswith("aai:"):
+            config_vars["providers"][section.split(":", 1)[1]] = parse_provider(config, section, config_vars["aai"])
+    index_issuers(config_vars["providers"])
+    if config_vars["app"]["session_backend"] not in SESSION_BACKENDS:
+        raise ValueError(f"Unknown session backend {config_vars['app']['session_backend']}, expected one of: {', '.join(SESSION_BACKENDS)}.")
+    # Sessions of the memory backend are local to each worker, gunicorn starts WEB_CONCURRENCY workers by default
+    if config_vars["app"]["session_backend"] == "memory" and int(os.environ.get("WEB_CONCURRENCY", 1)) > 1:
+        raise ValueError("Session backend memory keeps sessions in each worker, use session backend redis with multiple workers.")
+    if config_vars["logging"]["log_format"] not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format {config_vars['logging']['log_format']}, expected one of: {', '.join(LOG_FORMATS)}.")
+    if config_vars["renewal"]["token_renewal"] and config_vars["app"]["session_backend"] == "cookie":
+        raise ValueError("Token renewal requires a server-side session backend: memory or redis.")
     return namedtuple("Config", config_vars.keys())(*config_vars.values())
 
 
-CONFIG = parse_config_file(os.environ.get("CONFIG_FILE", Path(__file__).resolve().parent.joinpath("config.ini")))
+class LazyConfig:
+    """Configuration, that is parsed from the configuration file on first use, once per process.
+
+    Importing the package doesn't read the configuration file, so that modules can be imported, e.g. by
+    test collection and gunicorn, before the configuration is needed.
+    """
+
+    def __init__(self) -> None:
+        """Initialise configuration, that is not parsed yet."""
+        self._config = None
+
+    def __getattr__(self, name: str):
+        """Return a section of the configuration."""
+        if self._config is None:
+            self._config = parse_config_file(os.environ.get("CONFIG_FILE", Path(__file__).resolve().parent.joinpath("config.ini")))
+        return getattr(self._config, name)
+
+
+CONFIG = LazyConfig()
@@ -4,7 +4,9 @@ import secrets
 
 from aiohttp import web
 
-from ..utils.utils import get_from_session, save_to_session, save_to_cookies, request_token, query_params, validate_token
+from ..utils.utils import get_from_session, pop_from_session, save_tokens, save_to_cookies, request_token, query_params, validate_token, validate_id_token
+from ..utils.providers import session_provider
+from ..utils.session import regenerate_session
 from ..config import CONFIG, LOG
 
 
@@ -15,6 +17,9 @@ async def callback_request(request: web.Request) -> web.HTTPSeeOther:
     # Read saved state from session storage
     state = await get_from_session(request, "oidc_state")
 
+    # The user is returning from the AAI chosen at login
+    provider = await session_provider(request)
+
     # Parse authorised state from AAI response
     params = await query_params(request)
 
@@ -22,17 +27,31 @@ async def callback_request(request: web.Request) -> web.HTTPSeeOther:
     if not secrets.compare_digest(str(state), str(params["state"])):
         raise web.HTTPForbidden(text="403 Bad user session.")
 
+    # Read nonce and PKCE code verifier from the session loaded above, they are used only once
+    nonce = await pop_from_session(request, "oidc_nonce")
+    code_verifier = await pop_from_session(request, "oidc_code_verifier")
+    if nonce is None or code_verifier is None:
+        raise web.HTTPForbidden(text="403 Bad user session.")
+
     # Request access token from AAI server
-    access_token = await request_token(params["code"])
+    tokens = await request_token(provider, params["code"], code_verifier)
+    access_token = tokens["access_token"]
 
     # Validate access token
-    await validate_token(access_token)
+    claims = await validate_token(request.app, access_token)
+
+    # Verify, that the ID token was issued for this login, logins requesting the openid scope must receive one
+    if "id_token" in tokens:
+        await validate_id_token(provider, tokens["id_token"], nonce)
+    elif "openid" in (scope.strip() for scope in provider.aai["scope"].split(",")):
+        raise web.HTTPForbidden(text="403 ID token was not received.")
 
-    # Save access token to session storage
-    await save_to_session(request, key="access_token", value=access_token)
+    # Save access token and refresh token to session storage, under a new session ID against session fixation
+    await regenerate_session(request)
+    await save_tokens(request, tokens, claims)
 
     # Prepare response
-    response = web.HTTPSeeOther(CONFIG.aai["url_redirect"])
+    response = web.HTTPSeeOther(provider.aai["url_redirect"])
 
     # Save the received access token to cookies for later use
     response = await save_to_cookies(
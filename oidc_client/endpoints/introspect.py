@@ -0,0 +1,27 @@
+"""Introspection Endpoint."""
+
+import asyncio
+
+from typing import Union
+
+from aiohttp import web
+
+from ..utils.utils import check_introspection, introspection_params, introspect_token
+from ..config import LOG
+
+
+async def introspect_request(request: web.Request) -> Union[dict, list]:
+    """Handle introspection requests."""
+    LOG.debug("Handle introspection request.")
+
+    # Only resource servers holding the introspection token may introspect tokens
+    await check_introspection(request)
+
+    # Parse tokens from request body
+    tokens, batch = await introspection_params(request)
+
+    # Validate all tokens concurrently against cached keys and validation results
+    results = await asyncio.gather(*[introspect_token(request.app, token) for token in tokens])
+
+    # A batch is answered with a list of results in the same order as the tokens
+    return list(results) if batch else results[0]
@@ -2,33 +2,64 @@
 
 import urllib.parse
 
+from typing import Dict, Tuple
+
 from aiohttp import web
 
-from ..utils.utils import generate_state, save_to_session
-from ..config import CONFIG, LOG
+from ..utils.utils import generate_state, generate_pkce, save_to_session
+from ..utils.providers import Provider, get_provider
+from ..config import LOG
+
+# Constant part of the authorisation URL of each provider, with the configuration it was built from
+AUTHORISATION_URLS: Dict[str, Tuple[tuple, str]] = {}
+
+
+def authorisation_url(url_auth: str, client_id: str, redirect_uri: str, scope: str) -> str:
+    """Craft the constant part of the authorisation URL, to which the state, nonce and PKCE challenge are appended."""
+    params = {
+        "client_id": client_id,
+        "response_type": "code",
+        "redirect_uri": redirect_uri,
+        "scope": " ".join(scope.split(",")),
+        "code_challenge_method": "S256",
+    }
+    return f"{url_auth}?{urllib.parse.urlencode(params)}&state="
+
+
+def provider_authorisation_url(provider: Provider) -> str:
+    """Return the constant part of the authorisation URL of a provider.
+
+    The URL is built once per provider and reused for as long as its configuration stays the same,
+    e.g. until discovery gives a new ``url_auth``.
+    """
+    aai = provider.aai
+    config = (aai["url_auth"], aai["client_id"], aai["url_callback"], aai["scope"])
+    cached = AUTHORISATION_URLS.get(provider.name)
+    if cached is None or cached[0] != config:
+        cached = AUTHORISATION_URLS[provider.name] = (config, authorisation_url(*config))
+    return cached[1]
 
 
 async def login_request(request: web.Request) -> web.Response:
     """Handle login requests."""
     LOG.debug("Handle login request.")
 
-    # Generate a state for callback
-    state = await generate_state()
+    # Choose the AAI to authenticate at, the default provider if none is given
+    provider = get_provider(request.app, request.query.get("provider"))
 
-    # Save state to session storage
-    await save_to_session(request, key="oidc_state", value=state)
+    # Generate a state for callback, a nonce for the ID token and a PKCE code verifier for the token request
+    state = generate_state()
+    nonce = generate_state()
+    code_verifier, code_challenge = generate_pkce()
 
-    # Create parameters for authorisation request
-    params = {
-        "client_id": CONFIG.aai["client_id"],
-        "response_type": "code",
-        "state": state,
-        "redirect_uri": CONFIG.aai["url_callback"],
-        "scope": " ".join(CONFIG.aai["scope"].split(",")),
-    }
+    # Save login values to session storage, they are stored together when the response is sent
+    await save_to_session(request, key="oidc_provider", value=provider.name)
+    await save_to_session(request, key="oidc_state", value=state)
+    await save_to_session(request, key="oidc_nonce", value=nonce)
+    await save_to_session(request, key="oidc_code_verifier", value=code_verifier)
 
-    # Craft authorisation URL
-    url = f"{CONFIG.aai['url_auth']}?{urllib.parse.urlencode(params)}"
+    # Craft authorisation URL, the appended values are hexadecimal or URL safe base64 and need no quoting
+    url = f"{provider_authorisation_url(provider)}{state}&nonce={nonce}&code_challenge={code_challenge}"
 
     # Prepare response
     response = web.HTTPSeeOther(url)
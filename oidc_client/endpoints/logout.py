@@ -2,7 +2,8 @@
 
 from aiohttp import web
 
-from ..utils.utils import get_from_cookies, revoke_token, save_to_cookies
+from ..utils.utils import get_from_cookies, pop_from_session, save_to_cookies
+from ..utils.providers import session_provider
 from ..config import CONFIG, LOG
 
 
@@ -13,11 +14,19 @@ async def logout_request(request: web.Request) -> web.HTTPSeeOther:
     # Read access token from cookies
     access_token = await get_from_cookies(request, "access_token")
 
-    # Revoke token at AAI
-    await revoke_token(access_token)
+    # Revoke token at AAI in the background, so that logout doesn't wait for AAI
+    provider = await session_provider(request)
+    request.app["revocation_queue"].submit(access_token, provider)
+
+    # Forget tokens of the session, so that the session is no longer renewed, and revoke them at AAI
+    # The access token of the session differs from the cookie once it has been renewed in the background
+    for key in ("access_token", "refresh_token"):
+        token = await pop_from_session(request, key)
+        if token is not None and token != access_token:
+            request.app["revocation_queue"].submit(token, provider)
 
     # Prepare response
-    response = web.HTTPSeeOther(CONFIG.aai["url_redirect"])
+    response = web.HTTPSeeOther(provider.aai["url_redirect"])
 
     # Overwrite status cookies made by this API with instantly expiring ones
     response = await save_to_cookies(response, key="access_token", value="token_has_been_revoked", lifetime=0, http_only=CONFIG.cookie["http_only"])
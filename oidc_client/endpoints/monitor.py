@@ -0,0 +1,25 @@
+"""Monitoring Endpoint."""
+
+import os
+
+from aiohttp import web
+
+from ..utils.utils import check_admin
+from ..config import LOG
+
+
+async def monitor_request(request: web.Request) -> dict:
+    """Handle requests for event loop lag and handler timings of the worker answering the request."""
+    LOG.debug("Handle monitoring request.")
+
+    # Only administrators may see what the server is doing
+    await check_admin(request)
+
+    # Results are kept by each worker, the monitors are left out if they are disabled
+    result: dict = {"pid": os.getpid()}
+    if "loop_monitor" in request.app:
+        result["loop_lag"] = {"last": request.app["loop_monitor"].lag, "max": request.app["loop_monitor"].max_lag}
+    if "handler_profiler" in request.app:
+        result.update(request.app["handler_profiler"].report())
+
+    return result
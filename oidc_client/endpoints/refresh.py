@@ -0,0 +1,38 @@
+"""Refresh Endpoint."""
+
+from aiohttp import web
+
+from ..utils.utils import get_from_session, save_tokens, save_to_cookies, refresh_access_token, validate_token
+from ..utils.providers import session_provider
+from ..config import CONFIG, LOG
+
+
+async def refresh_request(request: web.Request) -> web.HTTPSeeOther:
+    """Handle refresh requests."""
+    LOG.debug("Handle refresh request.")
+
+    # Read refresh token from session storage
+    refresh_token = await get_from_session(request, "refresh_token")
+
+    # Request a new access token from the AAI server the user logged in at
+    provider = await session_provider(request)
+    tokens = await refresh_access_token(provider, refresh_token)
+    access_token = tokens["access_token"]
+
+    # Validate access token
+    claims = await validate_token(request.app, access_token)
+
+    # Save new access token, and the refresh token if it was rotated, to session storage
+    await save_tokens(request, tokens, claims)
+
+    # Prepare response
+    response = web.HTTPSeeOther(provider.aai["url_redirect"])
+
+    # Replace the access token in cookies
+    response = await save_to_cookies(
+        response, key="access_token", value=access_token, lifetime=CONFIG.cookie["token_lifetime"], http_only=CONFIG.cookie["http_only"]
+    )
+    response = await save_to_cookies(response, key="logged_in", value="True", lifetime=CONFIG.cookie["token_lifetime"], http_only=False)
+
+    # Redirect user to UI, this does a 303 redirect
+    raise response
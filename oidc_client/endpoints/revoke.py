@@ -0,0 +1,46 @@
+"""Bulk Revocation Endpoint."""
+
+import json
+
+import aiohttp
+
+from aiohttp import web
+
+from ..utils.utils import check_admin, revocation_params
+from ..utils.revocation import revoke_tokens
+from ..utils.providers import get_provider
+from ..config import CONFIG, LOG
+
+
+async def revoke_request(request: web.Request) -> web.StreamResponse:
+    """Handle bulk revocation requests, results are streamed as newline delimited JSON."""
+    LOG.debug("Handle bulk revocation request.")
+
+    # Only administrators may revoke tokens of other users
+    await check_admin(request)
+
+    # Read tokens from request body, they are revoked at the default provider if none is given
+    provider = get_provider(request.app, request.query.get("provider"))
+    tokens = await revocation_params(request)
+
+    # Stream the result of each token as soon as it is known
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    summary = {"revoked": 0, "failed": 0}
+    results = revoke_tokens(provider, tokens, CONFIG.revocation["revocation_concurrency"])
+    try:
+        async for result in results:
+            summary["revoked" if result["revoked"] else "failed"] += 1
+            await response.write(json.dumps(result).encode() + b"\n")
+    except (aiohttp.ClientError, OSError, ValueError) as e:
+        # The response has started, so a broken request body is reported in the last line instead of with an error status
+        LOG.error("Bulk revocation stopped: %r", e)
+        await response.write(json.dumps({"done": False, "error": f"Revocation stopped: {e!r}", **summary}).encode() + b"\n")
+    else:
+        LOG.info("Bulk revocation revoked %s tokens, %s tokens failed.", summary["revoked"], summary["failed"])
+        await response.write(json.dumps({"done": True, **summary}).encode() + b"\n")
+    finally:
+        await results.aclose()
+    await response.write_eof()
+
+    return response
@@ -0,0 +1,19 @@
+"""Userinfo Endpoint."""
+
+from aiohttp import web
+
+from ..utils.utils import get_from_session, get_userinfo
+from ..config import LOG
+
+
+async def userinfo_request(request: web.Request) -> dict:
+    """Handle userinfo requests."""
+    LOG.debug("Handle userinfo request.")
+
+    # Get access token from session storage
+    access_token = await get_from_session(request, "access_token")
+
+    # Get user information from cache or AAI
+    userinfo = await get_userinfo(request.app, access_token)
+
+    return userinfo
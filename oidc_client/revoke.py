@@ -0,0 +1,97 @@
+"""Bulk Token Revocation Command.
+
+Revokes tokens at AAI, that are read one per line or as a JSON array from a file or standard input,
+and prints the result of each token as newline delimited JSON::
+
+    revoke_oidc_tokens tokens.txt --concurrency 50 --provider elixir
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+import itertools
+
+from typing import Iterable, Iterator, List, Optional, TextIO
+
+from .utils.utils import create_client_session
+from .utils.logs import setup_logging
+from .utils.revocation import revoke_tokens
+from .utils.providers import Provider
+from .config import CONFIG, DEFAULT_PROVIDER
+
+
+def read_tokens(f: TextIO) -> Iterable[str]:
+    """Read tokens one per line, or from a JSON array, which is validated before any token is revoked."""
+    for line in f:
+        line = line.strip()
+        if line.startswith("["):
+            tokens = json.loads(line + f.read())
+            if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+                raise ValueError("JSON array must contain only tokens.")
+            return tokens
+        if line:
+            return itertools.chain([line], read_lines(f))
+    return []
+
+
+def read_lines(f: TextIO) -> Iterator[str]:
+    """Read non-empty lines."""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield line
+
+
+async def revoke(tokens: Iterable[str], concurrency: int, out: TextIO = sys.stdout, provider_name: str = DEFAULT_PROVIDER) -> dict:
+    """Revoke tokens at a provider over a pooled client session, and print the results.
+
+    If tokens can't be read to the end, the error is printed last and returned in the summary.
+    """
+    provider = Provider(provider_name, CONFIG.providers[provider_name], await create_client_session())
+    summary = {"revoked": 0, "failed": 0}
+    results = revoke_tokens(provider, tokens, concurrency)
+    try:
+        await provider.start()
+        async for result in results:
+            summary["revoked" if result["revoked"] else "failed"] += 1
+            print(json.dumps(result), file=out, flush=True)
+    except (OSError, ValueError) as e:
+        error = f"Revocation stopped: {e!r}"
+        print(json.dumps({"done": False, "error": error, **summary}), file=out, flush=True)
+        return dict(summary, error=error)
+    finally:
+        await results.aclose()
+        await provider.close()
+    print(json.dumps({"done": True, **summary}), file=out, flush=True)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run bulk revocation from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("file", nargs="?", type=argparse.FileType("r"), default="-", help="file of tokens (default: standard input)")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONFIG.revocation["revocation_concurrency"],
+        help=f"number of concurrent requests to AAI (default: {CONFIG.revocation['revocation_concurrency']})",
+    )
+    parser.add_argument(
+        "--provider", choices=list(CONFIG.providers), default=DEFAULT_PROVIDER, help=f"AAI provider of the tokens (default: {DEFAULT_PROVIDER})"
+    )
+    args = parser.parse_args(argv)
+    setup_logging(CONFIG.logging["log_format"])
+
+    try:
+        tokens = read_tokens(args.file)
+    except ValueError as e:
+        parser.error(f"{args.file.name} is not a JSON array of tokens: {e}")
+
+    summary = asyncio.get_event_loop().run_until_complete(revoke(tokens, args.concurrency, provider_name=args.provider))
+    if summary["failed"] or "error" in summary:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Circuit Breaker."""
+
+import math
+import time
+
+from .metrics import AAI_CIRCUIT_OPEN, AAI_CIRCUIT_OPENED
+from ..config import LOG
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Stops requests to AAI while it is failing, so that callers fail fast instead of waiting for timeouts."""
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        """Initialise a closed circuit.
+
+        The circuit opens after ``threshold`` consecutive failures. While it is open, requests are refused
+        for ``reset_timeout`` seconds, after which a single request is let through to probe the AAI.
+        The circuit closes when a request succeeds, and opens again when the probe fails.
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0.0
+
+    def allow(self) -> bool:
+        """Tell if a request may be sent to AAI."""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self.opened >= self.reset_timeout:
+            # Let one request through to probe the AAI, others are refused until it completes or times out
+            self.state = HALF_OPEN
+            self.opened = now
+            return True
+        return False
+
+    def retry_after(self) -> int:
+        """Return seconds until requests are let through again."""
+        return max(math.ceil(self.reset_timeout - (time.monotonic() - self.opened)), 1)
+
+    def success(self) -> None:
+        """Record a successful request, closing the circuit."""
+        if self.state != CLOSED:
+            LOG.info("AAI has recovered, circuit is closed.")
+            AAI_CIRCUIT_OPEN.inc(-1)
+        self.state = CLOSED
+        self.failures = 0
+
+    def failure(self) -> None:
+        """Record a failed request, opening the circuit after too many failures."""
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+            if self.state == CLOSED:
+                LOG.error("AAI failed %s times in a row, circuit is open.", self.failures)
+                AAI_CIRCUIT_OPENED.inc()
+                AAI_CIRCUIT_OPEN.inc()
+            self.state = OPEN
+            self.opened = time.monotonic()
@@ -0,0 +1,134 @@
+"""In-Process and Shared Caches."""
+
+import time
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Hashable, Optional
+
+from aiohttp import web
+
+from .metrics import SHARED_CACHE_HITS, SHARED_CACHE_MISSES, SHARED_CACHE_ERRORS
+from ..config import CONFIG, LOG
+
+if TYPE_CHECKING:  # pragma: no cover
+    from aiocache.base import BaseCache
+
+
+class LRUCache:
+    """Bounded cache, that evicts the least recently used entry and expires entries after their own lifetime."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        """Initialise an empty cache, which holds up to ``maxsize`` entries."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of entries, including expired ones not yet evicted."""
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a value, or the default if the key is missing or expired."""
+        try:
+            value, expires = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, lifetime: float) -> None:
+        """Store a value for ``lifetime`` seconds, values without lifetime left are not stored."""
+        if lifetime <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + lifetime)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """Remove a value, if it exists."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all values."""
+        self._entries.clear()
+
+
+class SharedCache:
+    """Cache shared by all workers of a node, kept in a Redis compatible store through aiocache.
+
+    The shared cache is a second tier behind the in-process caches, so that a value computed by one
+    worker is found by the others. Values are serialised as JSON. A failing or slow store is treated
+    as a miss, and requests wait on it for at most the timeout of the aiocache backend.
+    """
+
+    def __init__(self, cache: "BaseCache") -> None:
+        """Initialise shared cache on an aiocache backend."""
+        self.cache = cache
+
+    async def get(self, key: str) -> Any:
+        """Return a value, or None if the key is missing or the store could not be reached."""
+        try:
+            value = await self.cache.get(key)
+        except Exception as e:
+            SHARED_CACHE_ERRORS.inc()
+            LOG.warning("Could not read from shared cache: %r", e)
+            return None
+        if value is None:
+            SHARED_CACHE_MISSES.inc()
+        else:
+            SHARED_CACHE_HITS.inc()
+        return value
+
+    async def set(self, key: str, value: Any, lifetime: float) -> None:
+        """Store a value for ``lifetime`` seconds, rounded down to whole seconds as the store expires keys."""
+        if lifetime < 1:
+            return
+        try:
+            await self.cache.set(key, value, ttl=int(lifetime))
+        except Exception as e:
+            SHARED_CACHE_ERRORS.inc()
+            LOG.warning("Could not write to shared cache: %r", e)
+
+    async def close(self) -> None:
+        """Close connections to the store."""
+        await self.cache.close()
+
+
+def create_shared_cache() -> Optional[SharedCache]:
+    """Create the shared cache from its configured URL, or return None if no shared cache is configured."""
+    url = CONFIG.cache["shared_cache_url"]
+    if not url:
+        return None
+
+    # Only the scheme is logged, the URL can contain a password
+    scheme = url.split(":", 1)[0]
+    LOG.debug("Create %s shared cache.", scheme)
+    # aiocache is imported only when a shared cache is configured
+    from aiocache import Cache
+    from aiocache.exceptions import InvalidCacheType
+    from aiocache.serializers import JsonSerializer
+
+    try:
+        cache = Cache.from_url(url)
+    except InvalidCacheType:
+        raise RuntimeError(f"Shared cache {scheme} is not available, a redis cache requires: pip install oidc_client[shared_cache]")
+    cache.serializer = JsonSerializer()
+    cache.namespace = "oidc_client:"
+    cache.timeout = CONFIG.cache["shared_cache_timeout"]
+    return SharedCache(cache)
+
+
+async def close_shared_cache(app: web.Application) -> None:
+    """Close shared cache on server shutdown."""
+    LOG.debug("Close shared cache.")
+
+    if app["shared_cache"] is not None:
+        await app["shared_cache"].close()
@@ -0,0 +1,58 @@
+"""Token Claims Validation."""
+
+from typing import TYPE_CHECKING, Iterable, Optional, Tuple
+
+if TYPE_CHECKING:  # pragma: no cover
+    from authlib.jose import JWTClaims
+
+# Claims that must exist in every token
+REQUIRED_CLAIMS = ("iss", "aud", "iat", "exp")
+
+
+def split_values(values: Optional[str]) -> Tuple[str, ...]:
+    """Split a comma separated configuration value, an empty value gives no values."""
+    return tuple(value.strip() for value in values.split(",") if value.strip()) if values else ()
+
+
+def invalid_claim(claim: str) -> Exception:
+    """Return the error of authlib for an invalid claim, authlib.jose is imported only once tokens are decoded."""
+    from authlib.jose.errors import InvalidClaimError
+
+    return InvalidClaimError(claim)
+
+
+class ClaimsValidator:
+    """Validator of token claims, built once from the trusted issuers and audiences.
+
+    Issuers and audiences are kept in sets, so that the claims of a token are looked up
+    instead of being compared with each trusted value.
+    """
+
+    def __init__(self, issuers: Iterable[str], audiences: Iterable[str], leeway: int = 0, required: Iterable[str] = ()) -> None:
+        """Initialise validator."""
+        self.issuers = frozenset(issuers)
+        self.audiences = frozenset(audiences)
+        self.leeway = leeway
+        # Options for authlib, which checks that the claims exist and that the token is in date
+        self.options = {claim: {"essential": True} for claim in REQUIRED_CLAIMS + tuple(required)}
+
+    def validate(self, claims: "JWTClaims") -> None:
+        """Validate the claims of a decoded token, raising the errors of authlib."""
+        claims.validate(leeway=self.leeway)
+        issuer = claims["iss"]
+        if not isinstance(issuer, str) or issuer not in self.issuers:
+            raise invalid_claim("iss")
+        audience = claims["aud"]
+        audiences = [audience] if isinstance(audience, str) else audience
+        if not isinstance(audiences, list) or not all(isinstance(value, str) for value in audiences) or self.audiences.isdisjoint(audiences):
+            raise invalid_claim("aud")
+
+
+def access_token_validator(aai: dict) -> ClaimsValidator:
+    """Build the validator of access token claims from the configuration of a provider."""
+    return ClaimsValidator(split_values(aai["iss"]), split_values(aai["aud"]), leeway=aai["token_leeway"], required=split_values(aai["required_claims"]))
+
+
+def id_token_validator(aai: dict) -> ClaimsValidator:
+    """Build the validator of ID token claims from the configuration of a provider, ID tokens are issued to this client."""
+    return ClaimsValidator(split_values(aai["iss"]), (aai["client_id"],), leeway=aai["token_leeway"], required=("nonce",))
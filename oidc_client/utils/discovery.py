@@ -0,0 +1,83 @@
+"""OpenID Connect Discovery."""
+
+import asyncio
+
+from typing import TYPE_CHECKING, Optional
+
+from aiohttp import web
+
+from .utils import get_discovery
+from .claims import split_values
+from ..config import LOG
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .providers import Provider
+
+# Provider metadata and the configuration variables they replace
+ENDPOINTS = {
+    "authorization_endpoint": "url_auth",
+    "token_endpoint": "url_token",
+    "userinfo_endpoint": "url_userinfo",
+    "revocation_endpoint": "url_revoke",
+    "jwks_uri": "jwk_server",
+}
+
+
+class Discovery:
+    """OpenID Provider metadata, that keeps the AAI endpoints in the configuration of a provider up to date."""
+
+    def __init__(self, provider: "Provider", url: str, lifetime: int = 3600, retry: int = 60, timeout: float = 5.0) -> None:
+        """Initialise discovery from the ``.well-known/openid-configuration`` document at ``url``.
+
+        The document is refreshed in the background when the lifetime given by its Cache-Control header ends,
+        or after ``lifetime`` seconds if it has none, but never more often than every ``retry`` seconds.
+        A document, whose issuer is not trusted by the provider, is rejected.
+        If the document can't be fetched within ``timeout`` seconds, the current endpoints are kept and
+        fetching is retried after ``retry`` seconds.
+        """
+        self.provider = provider
+        self.url = url
+        self.lifetime = lifetime
+        self.retry = retry
+        self.timeout = timeout
+        self.metadata: dict = {}
+        self._task: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def load(self) -> None:
+        """Fetch the discovery document, apply it to configuration and schedule the next refresh."""
+        try:
+            metadata, lifetime = await asyncio.wait_for(get_discovery(self.provider, self.url), self.timeout)
+        except (asyncio.TimeoutError, web.HTTPException) as e:
+            LOG.warning("Could not refresh discovery document, using current endpoints: %r", e)
+            self._schedule(self.retry)
+            return
+
+        # The document must be issued by a trusted issuer, OpenID Connect Discovery 1.0 section 4.3
+        if metadata.get("issuer") not in split_values(self.provider.aai["iss"]):
+            LOG.error("Discovery document of provider %s has untrusted issuer %s, using current endpoints.", self.provider.name, metadata.get("issuer"))
+            self._schedule(self.retry)
+            return
+
+        self.metadata = metadata
+        for field, key in ENDPOINTS.items():
+            if metadata.get(field) and metadata[field] != self.provider.aai[key]:
+                LOG.info("AAI %s of provider %s is %s.", field, self.provider.name, metadata[field])
+                self.provider.aai[key] = metadata[field]
+        self._schedule(max(self.lifetime if lifetime is None else lifetime, self.retry))
+
+    async def close(self) -> None:
+        """Stop background refreshing."""
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._task is not None:
+            self._task.cancel()
+
+    def _schedule(self, delay: float) -> None:
+        """Schedule the next background refresh."""
+        self._timer = asyncio.get_event_loop().call_later(delay, self._refresh)
+
+    def _refresh(self) -> None:
+        """Refresh the discovery document in the background."""
+        LOG.debug("Refreshing discovery document in the background.")
+        self._task = asyncio.ensure_future(self.load())
@@ -0,0 +1,201 @@
+"""JSON Web Key Cache."""
+
+import time
+import asyncio
+
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from aiohttp import web
+
+from .cache import SharedCache
+from .utils import get_jwk
+from ..config import LOG
+
+if TYPE_CHECKING:  # pragma: no cover
+    from authlib.jose.rfc7517.models import Key
+    from .jws import Verifier
+    from .providers import Provider
+
+
+class KeyCache:
+    """Public keys of an AAI provider, imported once and indexed by key ID."""
+
+    def __init__(
+        self,
+        provider: "Provider",
+        lifetime: int = 3600,
+        refresh: int = 300,
+        cooldown: int = 10,
+        timeout: float = 2.0,
+        max_stale: int = 86400,
+        shared: Optional[SharedCache] = None,
+    ) -> None:
+        """Initialise an empty key cache.
+
+        Keys are kept for ``lifetime`` seconds and are refreshed in the background ``refresh`` seconds
+        before they expire. A token signed with an unknown key ID triggers a refetch at most once per
+        ``cooldown`` seconds, so that key rotation at the AAI is picked up without waiting for expiry.
+
+        All fetches are shared by concurrent callers. If a fetch fails, or takes longer than ``timeout``
+        seconds, the last known good keys are served for up to ``max_stale`` seconds past their expiry.
+
+        With a ``shared`` cache, keys fetched by one worker are used by the others until they are due
+        for refresh. Keys are taken from the shared cache only if they were fetched after the keys of
+        this worker, so that an unknown key ID is still looked up at the AAI.
+        """
+        self.provider = provider
+        self.lifetime = lifetime
+        self.refresh = refresh
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.max_stale = max_stale
+        self.shared = shared
+        self.keys: dict = {}
+        self.verifiers: dict = {}
+        # Wall clock time, at which the keys were fetched from AAI by any worker
+        self.fetched = 0.0
+        self.attempted = float("-inf")
+        self.expires = 0.0
+        self._fetch: Optional[asyncio.Future] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def get_key(self, kid: Optional[str]) -> "Key":
+        """Return the imported key for a key ID."""
+        now = asyncio.get_event_loop().time()
+        if not self.keys:
+            # Nothing to fall back to, wait for the AAI
+            await self.fetch()
+        elif now >= self.expires or kid not in self.keys:
+            LOG.debug("JWK cache has expired or has no key ID %s.", kid)
+            if self._fetch is not None or now - self.attempted >= self.cooldown:
+                await self.revalidate()
+            if asyncio.get_event_loop().time() - self.expires > self.max_stale:
+                LOG.error("Cached JWK are too old to be used.")
+                raise web.HTTPInternalServerError(text="Could not retrieve public key.")
+
+        try:
+            return self.keys[kid]
+        except KeyError:
+            LOG.error("No JWK found for key ID %s.", kid)
+            raise web.HTTPForbidden(text=f"Could not validate access token: Token signature could not be verified: Unknown key ID {kid}")
+
+    async def get_verifier(self, kid: Optional[str]) -> "Verifier":
+        """Return the verifier of the key for a key ID, verifiers are created once per imported key."""
+        from .jws import Verifier
+
+        key = await self.get_key(kid)
+        verifier = self.verifiers.get(kid)
+        if verifier is None or verifier.key is not key:
+            verifier = self.verifiers[kid] = Verifier(key)
+        return verifier
+
+    async def revalidate(self) -> None:
+        """Fetch keys, keeping the last known good keys if the AAI is slow or unavailable."""
+        try:
+            await asyncio.wait_for(self.fetch(), self.timeout)
+        except (asyncio.TimeoutError, web.HTTPException) as e:
+            LOG.warning("Could not refresh JWK, using cached keys: %r", e)
+
+    async def fetch(self) -> None:
+        """Fetch and import keys from AAI, concurrent callers wait on the same request."""
+        # Shield the shared request from the cancellation of a single waiter
+        await asyncio.shield(self._start())
+
+    async def close(self) -> None:
+        """Stop background refreshing."""
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._fetch is not None:
+            self._fetch.cancel()
+
+    async def _load(self) -> None:
+        """Retrieve the key set and replace the cached keys with it."""
+        try:
+            self.keys, age = await self._retrieve()
+            self.verifiers = {}
+        except Exception:
+            # Retry soon, cached keys are kept until then
+            if self.keys:
+                self._schedule(self.cooldown)
+            raise
+        else:
+            # Keys fetched by another worker expire as long after their fetch as the keys fetched here
+            self.expires = self.attempted + self.lifetime - age
+            self._schedule(self.lifetime - age - self.refresh)
+        finally:
+            self._fetch = None
+
+    async def _retrieve(self) -> Tuple[dict, float]:
+        """Return imported keys and their age in seconds, from the shared cache if another worker fetched newer keys, or from AAI."""
+        key = f"jwks:{self.provider.aai['jwk_server']}"
+        if self.shared is not None:
+            entry = await self.shared.get(key)
+            if entry is not None and entry["fetched"] > self.fetched and time.time() - entry["fetched"] < self.lifetime - self.refresh:
+                LOG.debug("JWK found in shared cache.")
+                keys = import_keys(entry["jwk"])
+                self.fetched = entry["fetched"]
+                return keys, time.time() - self.fetched
+
+        fetched = time.time()
+        jwk = await get_jwk(self.provider)
+        keys = import_keys(jwk)
+        self.fetched = fetched
+        # Share keys with other workers until they are due for refresh, keys that could not be imported are not shared
+        if self.shared is not None:
+            await self.shared.set(key, {"jwk": jwk, "fetched": fetched}, self.lifetime - self.refresh)
+        return keys, 0.0
+
+    def _schedule(self, delay: float) -> None:
+        """Schedule the next background refresh."""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_event_loop().call_later(max(delay, 0), self._refresh)
+
+    def _start(self) -> asyncio.Future:
+        """Start fetching keys, unless a fetch is already in flight."""
+        if self._fetch is None:
+            self.attempted = asyncio.get_event_loop().time()
+            self._fetch = asyncio.ensure_future(self._load())
+            self._fetch.add_done_callback(_log_fetch)
+        return self._fetch
+
+    def _refresh(self) -> None:
+        """Refresh keys in the background before they expire."""
+        LOG.debug("Refreshing JWK in the background.")
+        self._start()
+
+
+def import_keys(jwk) -> dict:
+    """Import a single key or a key set, and index the keys by key ID.
+
+    Keys that can't be imported, e.g. of a key type not supported yet, are skipped so that the other keys of the set can be used.
+    """
+    # authlib.jose is imported when keys are first needed, not at startup
+    from authlib.jose import JsonWebKey
+
+    if isinstance(jwk, dict):
+        jwk = jwk.get("keys", [jwk])
+    keys = {}
+    for raw in jwk if isinstance(jwk, list) else []:
+        try:
+            key = JsonWebKey.import_key(raw)
+        except Exception as e:
+            LOG.warning("Skipping JWK that could not be imported: %r", e)
+            continue
+        keys[key.get("kid")] = key
+
+    if not keys:
+        LOG.error("Could not import JWK: no usable keys.")
+        raise web.HTTPInternalServerError(text="Could not retrieve public key.")
+
+    # Tokens without a key ID can be verified if there is only one key to choose from
+    if len(keys) == 1:
+        keys[None] = next(iter(keys.values()))
+
+    return keys
+
+
+def _log_fetch(future: asyncio.Future) -> None:
+    """Log failed fetches, including those no caller waited for."""
+    if not future.cancelled() and future.exception() is not None:
+        LOG.error("Fetching JWK failed: %s", future.exception())
@@ -0,0 +1,108 @@
+"""JWS Signature Verification.
+
+Tokens signed with RS256, ES256 or EdDSA, the algorithms used by AAI providers, are verified
+directly with the public keys of cryptography. The compact JWS is parsed once, and the public
+keys are prepared once per key. Other algorithms, malformed tokens and bad signatures are left
+to authlib, so that the errors raised for them stay the same.
+"""
+
+from typing import NamedTuple, Optional
+
+from authlib.common.encoding import json_loads, to_bytes, urlsafe_b64decode
+from authlib.jose import ECKey, OKPKey, RSAKey, JWTClaims, jwt
+from authlib.jose.rfc7517.models import Key
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ec import ECDSA, SECP256R1
+from cryptography.hazmat.primitives.asymmetric.ed448 import Ed448PublicKey
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from cryptography.hazmat.primitives.hashes import SHA256
+
+# Parameters of the algorithms, created once as they hold no state
+PKCS1 = PKCS1v15()
+ECDSA_SHA256 = ECDSA(SHA256())
+
+
+class CompactJWS(NamedTuple):
+    """Segments of a compact JWS, with the header and signature decoded."""
+
+    header: dict
+    signing_input: bytes
+    payload: bytes
+    signature: bytes
+
+
+def parse_compact(token: str) -> Optional[CompactJWS]:
+    """Split a compact JWS and decode its header and signature, None is returned for malformed tokens."""
+    try:
+        signing_input, signature = to_bytes(token).rsplit(b".", 1)
+        header, payload = signing_input.split(b".", 1)
+        jws = CompactJWS(json_loads(urlsafe_b64decode(header)), signing_input, payload, urlsafe_b64decode(signature))
+    except Exception:
+        return None
+    # Encrypted tokens have more segments, and are left to authlib
+    if not isinstance(jws.header, dict) or b"." in payload:
+        return None
+    return jws
+
+
+def verify_rs256(public_key, signing_input: bytes, signature: bytes) -> None:
+    """Verify a RSASSA-PKCS1-v1_5 signature using SHA-256."""
+    public_key.verify(signature, signing_input, PKCS1, SHA256())
+
+
+def verify_es256(public_key, signing_input: bytes, signature: bytes) -> None:
+    """Verify an ECDSA signature using P-256 and SHA-256, JWS has the signature as R and S of 32 bytes each."""
+    if len(signature) != 64:
+        raise InvalidSignature()
+    der_signature = encode_dss_signature(int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big"))
+    public_key.verify(der_signature, signing_input, ECDSA_SHA256)
+
+
+def verify_eddsa(public_key, signing_input: bytes, signature: bytes) -> None:
+    """Verify an Edwards-curve signature."""
+    public_key.verify(signature, signing_input)
+
+
+VERIFIERS = {"RS256": verify_rs256, "ES256": verify_es256, "EdDSA": verify_eddsa}
+
+
+def public_keys(key: Key) -> dict:
+    """Return the public keys of cryptography by the algorithm they verify, keys not allowed to verify are left to authlib."""
+    key_ops = key.get("key_ops")
+    if (key_ops is not None and "verify" not in key_ops) or key.get("use", "sig") != "sig":
+        return {}
+
+    public_key = key.get_public_key()
+    if isinstance(key, RSAKey):
+        return {"RS256": public_key}
+    if isinstance(key, ECKey) and isinstance(public_key.curve, SECP256R1):
+        return {"ES256": public_key}
+    if isinstance(key, OKPKey) and isinstance(public_key, (Ed25519PublicKey, Ed448PublicKey)):
+        return {"EdDSA": public_key}
+    return {}
+
+
+class Verifier:
+    """Verifier of tokens signed with one key, the public keys of cryptography are prepared when it is created."""
+
+    def __init__(self, key: Key) -> None:
+        """Initialise verifier of an imported key."""
+        self.key = key
+        self.public_keys = public_keys(key)
+
+    def decode(self, token: str, jws: Optional[CompactJWS], claims_options: dict) -> JWTClaims:
+        """Decode a JWT parsed with ``parse_compact``, and verify its signature."""
+        if jws is not None and jws.header.get("alg") in self.public_keys:
+            alg = jws.header["alg"]
+            try:
+                VERIFIERS[alg](self.public_keys[alg], jws.signing_input, jws.signature)
+                payload = json_loads(urlsafe_b64decode(jws.payload))
+            except (InvalidSignature, ValueError):
+                payload = None
+            if isinstance(payload, dict):
+                return JWTClaims(payload, jws.header, options=claims_options)
+
+        # Other algorithms and all failures are decoded by authlib, which raises the errors
+        return jwt.decode(token, self.key, claims_options=claims_options)
@@ -0,0 +1,122 @@
+"""Structured and Non-Blocking Logging.
+
+Log lines of a request carry its correlation ID, and debug and info lines are logged for a sampled fraction
+of requests. Lines are written as text or as JSON objects, optionally from a background thread, so that a slow
+stderr doesn't hold up the event loop. Messages are given as ``%`` arguments, so that lines dropped by level
+or sampling are never formatted.
+"""
+
+import os
+import json
+import queue
+import logging
+
+from contextvars import ContextVar
+from distutils.util import strtobool
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
+
+from aiohttp import web
+
+from ..config import LOG
+
+# Correlation ID of the request being handled, and whether its debug and info lines are logged
+REQUEST_ID: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+REQUEST_SAMPLED: ContextVar[bool] = ContextVar("request_sampled", default=True)
+
+TEXT_FORMAT = "[%(asctime)s][%(name)s][%(process)d %(processName)s][%(levelname)-8s] (L:%(lineno)s) %(module)s | %(funcName)s: %(message)s"
+
+# Handler of the root logger, that is replaced when logging is set up again
+_handler: Optional[logging.Handler] = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the correlation ID of the request to log records, and drops debug and info lines of requests not sampled."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Tell if a record is logged."""
+        # Records written by the listener thread already have the ID of the request they were logged in
+        if not hasattr(record, "request_id"):
+            setattr(record, "request_id", REQUEST_ID.get())
+        return record.levelno >= logging.WARNING or REQUEST_SAMPLED.get()
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats log records as JSON objects, one per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format a record as a JSON object."""
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.process,
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+class LocalQueueHandler(QueueHandler):
+    """Queue handler for a listener thread in the same process, that formats and writes the records."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge the arguments to the message, as they may change before the listener gets to the record."""
+        record.msg = record.getMessage()
+        record.args = ()
+        return record
+
+
+def _replace_handler(handler: logging.Handler) -> None:
+    """Replace the handler of the root logger set up before."""
+    global _handler
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+    root.addHandler(handler)
+    _handler = handler
+
+
+def setup_logging(log_format: str = "text", log_queue: bool = False, stream: Optional[TextIO] = None) -> Optional[QueueListener]:
+    """Write logs to stderr, or ``stream``, as text or JSON, from a background thread with ``log_queue``, whose listener is returned.
+
+    Debug lines are written if the ``DEBUG`` environment variable is set.
+    """
+    logging.getLogger().setLevel(logging.DEBUG if strtobool(os.environ.get("DEBUG", "False")) else logging.INFO)
+    handler: logging.Handler = logging.StreamHandler(stream)
+    handler.setFormatter(JSONFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    handler.addFilter(RequestContextFilter())
+
+    listener = None
+    if log_queue:
+        records: queue.Queue = queue.Queue()
+        listener = QueueListener(records, handler, respect_handler_level=True)
+        handler = LocalQueueHandler(records)
+        handler.addFilter(RequestContextFilter())
+        listener.start()
+    _replace_handler(handler)
+    return listener
+
+
+async def add_request_id(request: web.Request, response: web.StreamResponse) -> None:
+    """Return the correlation ID of a request in the ``X-Request-ID`` header of its response."""
+    if "request_id" in request:
+        response.headers["X-Request-ID"] = request["request_id"]
+
+
+async def close_log_listener(app: web.Application) -> None:
+    """Write the remaining logs and stop the background thread on server shutdown, later logs are written directly."""
+    LOG.debug("Close log listener.")
+
+    listener = app["log_listener"]
+    listener.stop()
+    _replace_handler(listener.handlers[0])
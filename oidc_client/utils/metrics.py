@@ -0,0 +1,241 @@
+"""Prometheus Metrics.
+
+Metric values are kept in one flat array of doubles per worker. When a metrics directory is configured,
+the array is a memory-mapped file in that directory, and ``/metrics`` sums the files of all gunicorn workers,
+so that a scrape reaching any worker reports the whole server.
+"""
+
+import os
+import time
+import mmap
+import array
+import bisect
+import functools
+
+from typing import Any, Callable, Dict, List, Optional
+
+from ..config import LOG
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    """Collection of metrics sharing one array of values."""
+
+    def __init__(self) -> None:
+        """Initialise an empty in-process registry."""
+        self.metrics: list = []
+        self.size = 0
+        # Memoryview of doubles, typeshed only knows memoryviews of bytes
+        self.values: Any = memoryview(bytearray()).cast("d")
+        self.path: Optional[str] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    def register(self, metric, slots: int) -> int:
+        """Reserve ``slots`` values for a metric, and return the offset of its first value."""
+        if self._mmap is not None:
+            raise RuntimeError("Metrics must be registered before the registry is opened.")
+        offset = self.size
+        self.size += slots
+        values = memoryview(bytearray(self.size * 8)).cast("d")
+        values[:offset] = self.values
+        self.values = values
+        self.metrics.append(metric)
+        return offset
+
+    def open(self, directory: str) -> None:
+        """Move values to a memory-mapped file of this worker, so that other workers can read them."""
+        self.close()
+        self.path = os.path.join(directory, f"metrics_{os.getpid()}.db")
+        LOG.debug("Open metrics file %s.", self.path)
+        with open(self.path, "wb+") as f:
+            f.truncate(self.size * 8)
+            self._mmap = mmap.mmap(f.fileno(), self.size * 8)
+        values = memoryview(self._mmap).cast("d")
+        values[:] = self.values
+        self.values = values
+
+    def close(self) -> None:
+        """Move values back to process memory."""
+        if self._mmap is None:
+            return
+        values = memoryview(bytearray(self.values.tobytes())).cast("d")
+        self.values.release()
+        self.values = values
+        self._mmap.close()
+        self._mmap = None
+        self.path = None
+
+    def collect(self) -> array.array:
+        """Return values summed over all workers writing to the metrics directory.
+
+        Counters and histograms of workers, that have exited, are kept in the sums, so that they don't
+        decrease when a worker is restarted, but their gauges are left out.
+        """
+        total = array.array("d", self.values.tobytes())
+        if self.path is None:
+            return total
+        gauges = [metric.offset for metric in self.metrics if metric.kind == "gauge"]
+        directory = os.path.dirname(self.path)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not name.startswith("metrics_") or path == self.path:
+                continue
+            values = array.array("d")
+            with open(path, "rb") as f:
+                values.frombytes(f.read())
+            if len(values) != self.size:
+                # Written by a different version of the application
+                continue
+            if not worker_alive(name):
+                for offset in gauges:
+                    values[offset] = 0.0
+            for i, value in enumerate(values):
+                total[i] += value
+        return total
+
+    def render(self) -> str:
+        """Format all metrics in Prometheus text exposition format, the samples of a metric name are kept together."""
+        values = self.collect()
+        families: Dict[str, list] = {}
+        for metric in self.metrics:
+            families.setdefault(metric.name, []).append(metric)
+        lines: List[str] = []
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {metrics[0].documentation}")
+            lines.append(f"# TYPE {name} {metrics[0].kind}")
+            for metric in metrics:
+                lines.extend(metric.samples(values))
+        return "\n".join(lines) + "\n"
+
+
+def worker_alive(name: str) -> bool:
+    """Return whether the worker, that writes to the metrics file of the given name, is still running."""
+    try:
+        pid = int(os.path.splitext(name)[0].split("_", 1)[1])
+        # Process IDs below one would signal process groups
+        if pid < 1:
+            return False
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        # Running as another user
+        return True
+    return True
+
+
+REGISTRY = Registry()
+
+
+def format_labels(labels: dict) -> str:
+    """Format labels for exposition."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class Counter:
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Optional[dict] = None, registry: Registry = REGISTRY) -> None:
+        """Register the counter."""
+        self.name = name
+        self.documentation = documentation
+        self.labels = format_labels(labels or {})
+        self.registry = registry
+        self.offset = registry.register(self, 1)
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increase the counter."""
+        self.registry.values[self.offset] += amount
+
+    def samples(self, values: array.array) -> List[str]:
+        """Return exposition lines."""
+        return [f"{self.name}{self.labels} {values[self.offset]}"]
+
+
+class Gauge(Counter):
+    """Value that can go up and down, values of all workers are summed."""
+
+    kind = "gauge"
+
+    def set(self, value: float) -> None:
+        """Set the gauge."""
+        self.registry.values[self.offset] = value
+
+
+class Histogram:
+    """Distribution of observed values in fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Optional[dict] = None, buckets: tuple = BUCKETS, registry: Registry = REGISTRY) -> None:
+        """Register the histogram, which keeps a count per bucket, a count above all buckets and a sum."""
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels or {}
+        self.registry = registry
+        self.offset = registry.register(self, len(buckets) + 2)
+        self.sum = self.offset + len(buckets) + 1
+
+    def observe(self, value: float) -> None:
+        """Count a value in its bucket and add it to the sum."""
+        values = self.registry.values
+        values[self.offset + bisect.bisect_left(self.buckets, value)] += 1
+        values[self.sum] += value
+
+    def samples(self, values: array.array) -> List[str]:
+        """Return exposition lines with cumulative bucket counts."""
+        lines = []
+        count = 0.0
+        for i, bound in enumerate(self.buckets + (float("inf"),)):
+            count += values[self.offset + i]
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{format_labels(dict(self.labels, le=le))} {count}")
+        labels = format_labels(self.labels)
+        lines.append(f"{self.name}_sum{labels} {values[self.sum]}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def instrument(stage: str) -> Callable:
+    """Record duration and errors of a coroutine function as a stage of request processing."""
+    duration = Histogram("oidc_stage_duration_seconds", "Duration of request processing stages in seconds.", {"stage": stage})
+    errors = Counter("oidc_stage_errors_total", "Number of request processing stages that raised an error.", {"stage": stage})
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                duration.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+TOKEN_CACHE_HITS = Counter("oidc_token_cache_hits_total", "Number of access token validations answered from cache.")
+TOKEN_CACHE_MISSES = Counter("oidc_token_cache_misses_total", "Number of access token validations that verified the token.")
+SHARED_CACHE_HITS = Counter("oidc_shared_cache_hits_total", "Number of lookups answered by the cache shared by all workers.")
+SHARED_CACHE_MISSES = Counter("oidc_shared_cache_misses_total", "Number of lookups not found in the cache shared by all workers.")
+SHARED_CACHE_ERRORS = Counter("oidc_shared_cache_errors_total", "Number of failed or timed out operations on the cache shared by all workers.")
+REVOCATION_QUEUE_DEPTH = Gauge("oidc_revocation_queue_depth", "Number of tokens waiting to be revoked at AAI.")
+REVOCATION_FAILURES = Counter("oidc_revocation_failures_total", "Number of tokens that could not be revoked after all retries.", {"reason": "retries"})
+REVOCATION_REJECTED = Counter("oidc_revocation_failures_total", "Number of tokens that could not be revoked.", {"reason": "rejected"})
+REVOCATION_DROPPED = Counter("oidc_revocation_failures_total", "Number of tokens that could not be revoked.", {"reason": "queue_full"})
+AAI_CIRCUIT_OPEN = Gauge("oidc_aai_circuit_open", "Number of circuits to AAI providers, that are open or half-open, in all workers.")
+AAI_CIRCUIT_OPENED = Counter("oidc_aai_circuit_opened_total", "Number of times the circuit to AAI has opened.")
+CRYPTO_OFFLOADED = Counter("oidc_crypto_offloaded_total", "Number of signature verifications and session encryptions done in the crypto thread pool.")
+SLOW_HANDLERS = Counter("oidc_slow_handlers_total", "Number of request handlers, that ran longer than the slow handler threshold.")
+LOOP_LAG = Histogram("oidc_event_loop_lag_seconds", "Delay of callbacks scheduled on the event loop past their due time in seconds.")
+REQUESTS_SHED = Counter("oidc_requests_shed_total", "Number of requests answered with 503, because too many requests were being processed.")
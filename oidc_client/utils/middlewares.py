@@ -0,0 +1,182 @@
+"""Web Server Middlewares."""
+
+import re
+import asyncio
+import secrets
+
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from aiohttp import web
+
+from .logs import REQUEST_ID, REQUEST_SAMPLED
+from .metrics import REQUESTS_SHED
+from .monitor import HandlerProfiler
+from ..config import LOG
+
+# Correlation IDs accepted from the X-Request-ID header of requests
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# Resolution of log sampling rates
+SAMPLE_SCALE = 1000000
+
+
+def request_logging(sample_rate: float = 1.0) -> Callable:
+    """Create a middleware, that gives log lines of a request its correlation ID, and samples the requests whose debug and info lines are logged.
+
+    The correlation ID is taken from the ``X-Request-ID`` header, or generated for requests without a valid one.
+    A ``sample_rate`` fraction of requests is sampled.
+    """
+    threshold = int(sample_rate * SAMPLE_SCALE)
+
+    @web.middleware
+    async def middleware(request: web.Request, handler) -> web.StreamResponse:
+        request_id = request.headers.get("X-Request-ID", "")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = secrets.token_hex(8)
+        request["request_id"] = request_id
+        id_token = REQUEST_ID.set(request_id)
+        sampled_token = REQUEST_SAMPLED.set(secrets.randbelow(SAMPLE_SCALE) < threshold)
+        try:
+            return await handler(request)
+        finally:
+            REQUEST_SAMPLED.reset(sampled_token)
+            REQUEST_ID.reset(id_token)
+
+    return middleware
+
+
+@web.middleware
+async def preserve_cookies(request: web.Request, handler) -> web.StreamResponse:
+    """Return raised HTTP exceptions as responses, so that cookies set on them are sent.
+
+    Endpoints redirect by raising ``web.HTTPSeeOther`` with session and token cookies set on it.
+    aiohttp<3.8 rebuilds raised exceptions into new responses from their headers only, which drops the cookies.
+    """
+    try:
+        return await handler(request)
+    except web.HTTPException as exc:
+        if not exc.cookies:
+            raise
+        LOG.debug("Return raised HTTP exception as response to preserve cookies.")
+        response = web.Response(status=exc.status, reason=exc.reason, text=exc.text, headers=exc.headers)
+        for name, morsel in exc.cookies.items():
+            response.cookies[name] = morsel
+        return response
+
+
+def expire(waiter: asyncio.Future) -> None:
+    """End the wait of a request, that was not given a turn in time."""
+    if not waiter.done():
+        waiter.set_exception(asyncio.TimeoutError())
+
+
+class ConcurrencyLimiter:
+    """Limit of requests processed at once, with a bounded queue of requests waiting for their turn."""
+
+    def __init__(self, limit: int, max_queued: int, timeout: float) -> None:
+        """Initialise a limiter of ``limit`` requests at once, and at most ``max_queued`` requests waiting up to ``timeout`` seconds."""
+        self.limit = limit
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> bool:
+        """Wait for a turn, and tell if one was given before the queue filled up or the wait timed out."""
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return True
+        if len(self.waiters) >= self.max_queued:
+            return False
+
+        loop = asyncio.get_event_loop()
+        waiter = loop.create_future()
+        self.waiters.append(waiter)
+        # The wait is timed out here rather than with asyncio.wait_for, which lets a request cancelled
+        # right after it was given a turn keep the turn on some Python versions
+        timer = loop.call_later(self.timeout, expire, waiter)
+        try:
+            await waiter
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            # A turn handed to a cancelled request is passed on
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release()
+            raise
+        finally:
+            timer.cancel()
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+        return True
+
+    def release(self) -> None:
+        """End a turn, handing it to the next waiting request if there is one."""
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+def parse_route_limits(value: Optional[str]) -> Dict[str, Tuple[int, int]]:
+    """Parse route specific limits from ``route=max_in_flight:max_queued`` pairs separated by commas."""
+    limits = {}
+    for item in (value or "").split(","):
+        if item.strip():
+            route, _, limit = item.strip().rpartition("=")
+            max_in_flight, _, max_queued = limit.partition(":")
+            limits[route] = (int(max_in_flight), int(max_queued or 0))
+    return limits
+
+
+def load_shedding(max_in_flight: int, max_queued: int, timeout: float, retry_after: int, route_limits: Optional[str] = None) -> Callable:
+    """Create a middleware, that limits the requests processed at once per route, and sheds requests beyond the limits.
+
+    Requests beyond ``max_in_flight`` wait in a queue of at most ``max_queued`` requests for up to ``timeout`` seconds.
+    Requests, that don't fit in the queue or time out in it, are answered right away with 503 and ``Retry-After``,
+    so that latency of admitted requests stays low when traffic exceeds what the AAI can take.
+    A limit of 0 leaves a route unlimited.
+    """
+    limits = parse_route_limits(route_limits)
+    limiters: Dict[str, Optional[ConcurrencyLimiter]] = {}
+
+    def limiter(route: str) -> Optional[ConcurrencyLimiter]:
+        if route not in limiters:
+            limit, queued = limits.get(route, (max_in_flight, max_queued))
+            limiters[route] = ConcurrencyLimiter(limit, queued, timeout) if limit else None
+        return limiters[route]
+
+    @web.middleware
+    async def middleware(request: web.Request, handler) -> web.StreamResponse:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else None
+        route_limiter = limiter(route) if route is not None else None
+        if route_limiter is None:
+            return await handler(request)
+
+        if not await route_limiter.acquire():
+            LOG.warning("Too many requests to %s, request is shed.", route)
+            REQUESTS_SHED.inc()
+            raise web.HTTPServiceUnavailable(text="Server is busy, try again later.", headers={"Retry-After": str(retry_after)})
+        try:
+            return await handler(request)
+        finally:
+            route_limiter.release()
+
+    return middleware
+
+
+def handler_profiling(profiler: HandlerProfiler) -> Callable:
+    """Create a middleware, that times every handler, and samples handlers running over the threshold of ``profiler``."""
+    run = profiler.run
+
+    @web.middleware
+    async def middleware(request: web.Request, handler) -> web.StreamResponse:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "unmatched"
+        return await run(f"{request.method} {route}", handler, request)
+
+    return middleware
@@ -0,0 +1,143 @@
+"""Event Loop Monitoring."""
+
+import io
+import sys
+import time
+import pstats
+import asyncio
+import cProfile
+
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiohttp import web
+
+from .metrics import LOOP_LAG, SLOW_HANDLERS
+from ..config import LOG
+
+
+def current_task() -> Optional[asyncio.Task]:
+    """Return the task running on the event loop, ``asyncio.current_task`` is new in Python 3.7."""
+    if sys.version_info >= (3, 7):
+        return asyncio.current_task()
+    return asyncio.Task.current_task()  # pragma: no cover
+
+
+class LoopMonitor:
+    """Measures event loop lag, the time a callback scheduled on the loop runs past its due time.
+
+    Lag is measured every ``interval`` seconds. It grows when the loop is blocked, e.g. by CPU-bound work
+    done in a request handler, and is recorded in the ``oidc_event_loop_lag_seconds`` histogram.
+    """
+
+    def __init__(self, interval: float = 1.0) -> None:
+        """Initialise monitor, that is started on server startup."""
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def start(self) -> None:
+        """Start measuring lag."""
+        loop = asyncio.get_event_loop()
+        self._timer = loop.call_later(self.interval, self._measure, loop.time() + self.interval)
+
+    def close(self) -> None:
+        """Stop measuring lag."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _measure(self, due: float) -> None:
+        """Record the lag of this callback, and schedule the next one."""
+        loop = asyncio.get_event_loop()
+        self.lag = max(loop.time() - due, 0.0)
+        self.max_lag = max(self.max_lag, self.lag)
+        LOOP_LAG.observe(self.lag)
+        self._timer = loop.call_later(self.interval, self._measure, loop.time() + self.interval)
+
+
+class HandlerProfiler:
+    """Times request handlers, and keeps a sample of what handlers running over a threshold were doing.
+
+    By default the stack of a handler is sampled once it has run for ``threshold`` seconds, which shows what a slow
+    handler is waiting for. With ``profile``, handlers are run under cProfile instead, and a profile is kept of those
+    running over the threshold. The profile covers all work done by the worker while the handler ran, which shows
+    what was blocking the event loop. Only one handler at a time is profiled, as cProfile profiles the whole thread.
+    The ``records`` latest slow handlers are kept.
+    """
+
+    def __init__(self, threshold: float, profile: bool = False, records: int = 20) -> None:
+        """Initialise profiler of handlers running over ``threshold`` seconds."""
+        self.threshold = threshold
+        self.profile = profile
+        self.handlers: Dict[str, dict] = {}
+        self.slow: Deque[dict] = deque(maxlen=records)
+        self._profiler: Optional[cProfile.Profile] = None
+
+    async def run(self, route: str, handler: Callable[..., Awaitable], *args) -> web.StreamResponse:
+        """Run and time a handler of a route."""
+        sample: List[str] = []
+        timer = asyncio.get_event_loop().call_later(self.threshold, self._sample_stack, current_task(), sample)
+        profiler = self._start_profile()
+        started = time.perf_counter()
+        try:
+            return await handler(*args)
+        finally:
+            duration = time.perf_counter() - started
+            timer.cancel()
+            if profiler is not None:
+                profiler.disable()
+                self._profiler = None
+            self._record(route, duration, sample, profiler)
+
+    def _start_profile(self) -> Optional[cProfile.Profile]:
+        """Start profiling a handler, unless another handler is being profiled."""
+        if not self.profile or self._profiler is not None:
+            return None
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        return self._profiler
+
+    def _sample_stack(self, task: Optional[asyncio.Task], sample: List[str]) -> None:
+        """Sample the stack of a handler, that has run over the threshold."""
+        if task is not None:
+            stream = io.StringIO()
+            task.print_stack(file=stream)
+            sample.extend(stream.getvalue().splitlines())
+
+    def _record(self, route: str, duration: float, sample: List[str], profiler: Optional[cProfile.Profile]) -> None:
+        """Add the duration of a handler to the statistics of its route, and keep a record of a slow handler."""
+        stats = self.handlers.setdefault(route, {"count": 0, "total": 0.0, "max": 0.0})
+        stats["count"] += 1
+        stats["total"] += duration
+        stats["max"] = max(stats["max"], duration)
+        if duration < self.threshold:
+            return
+
+        LOG.warning("Handler of %s took %.3f seconds.", route, duration)
+        SLOW_HANDLERS.inc()
+        record = {"route": route, "duration": duration, "time": time.time(), "stack": sample}
+        if profiler is not None:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(30)
+            record["profile"] = stream.getvalue()
+        self.slow.append(record)
+
+    def report(self) -> dict:
+        """Return handler statistics and the latest slow handlers."""
+        return {"handlers": self.handlers, "slow": list(self.slow)}
+
+
+async def start_loop_monitor(app: web.Application) -> None:
+    """Start measuring event loop lag on server startup."""
+    LOG.debug("Start event loop monitor.")
+
+    app["loop_monitor"].start()
+
+
+async def close_loop_monitor(app: web.Application) -> None:
+    """Stop measuring event loop lag on server shutdown."""
+    LOG.debug("Close event loop monitor.")
+
+    app["loop_monitor"].close()
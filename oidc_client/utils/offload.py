@@ -0,0 +1,51 @@
+"""Offloading of CPU-Bound Cryptography."""
+
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from aiohttp import web
+
+from .metrics import CRYPTO_OFFLOADED
+from ..config import LOG
+
+
+class CryptoExecutor:
+    """Runs CPU-bound cryptography, such as token signature verification and session encryption, in a thread pool.
+
+    cryptography releases the GIL while OpenSSL works, so a slow RSA verification in a thread no longer holds up
+    the other requests of the worker. Work on inputs smaller than ``threshold`` bytes stays on the event loop,
+    where it is done in less time than it takes to hand it to a thread. Without threads, all work stays on the event loop.
+    """
+
+    def __init__(self, threads: int = 0, threshold: int = 0) -> None:
+        """Initialise executor with a pool of ``threads`` threads, or none."""
+        self.threshold = threshold
+        self.executor: Optional[ThreadPoolExecutor] = None
+        if threads > 0:
+            self.executor = ThreadPoolExecutor(threads, thread_name_prefix="oidc-crypto")
+
+    @property
+    def offloading(self) -> bool:
+        """Return True if work can be offloaded to threads."""
+        return self.executor is not None
+
+    async def run(self, size: int, func: Callable, *args) -> Any:
+        """Call a function on inputs of ``size`` bytes, in the thread pool or on the event loop."""
+        if self.executor is None or size < self.threshold:
+            return func(*args)
+        CRYPTO_OFFLOADED.inc()
+        return await asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+
+    def close(self) -> None:
+        """Shut down the thread pool, work already started is finished by the threads."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+async def close_crypto_executor(app: web.Application) -> None:
+    """Close crypto executor on server shutdown."""
+    LOG.debug("Close crypto executor.")
+
+    app["crypto_executor"].close()
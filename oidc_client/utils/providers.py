@@ -0,0 +1,108 @@
+"""AAI Providers."""
+
+import asyncio
+
+from typing import Optional
+
+import aiohttp
+
+from aiohttp import web
+from aiohttp_session import get_session
+
+from .breaker import CircuitBreaker
+from .cache import SharedCache
+from .offload import CryptoExecutor
+from .claims import access_token_validator, id_token_validator
+from .discovery import Discovery
+from .jwks import KeyCache
+from ..config import CONFIG, DEFAULT_PROVIDER, LOG, index_issuers
+
+
+class Provider:
+    """An AAI server, with its own connection pool, circuit breaker, key cache and claims validators.
+
+    Nothing is shared between providers, so that a slow or failing AAI doesn't hold up requests to the others.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        aai: dict,
+        client_session: aiohttp.ClientSession,
+        shared_cache: Optional[SharedCache] = None,
+        executor: Optional[CryptoExecutor] = None,
+    ) -> None:
+        """Initialise a provider from its configuration section.
+
+        Keys are shared with other workers through ``shared_cache``, and token signatures are verified with ``executor``.
+        """
+        self.name = name
+        self.executor = executor or CryptoExecutor()
+        self.aai = aai
+        self.client_session = client_session
+        self.breaker = CircuitBreaker(CONFIG.client["breaker_threshold"], CONFIG.client["breaker_reset_timeout"])
+        self.jwks = KeyCache(
+            self,
+            lifetime=aai["jwk_lifetime"],
+            refresh=aai["jwk_refresh"],
+            timeout=aai["jwk_timeout"],
+            max_stale=aai["jwk_max_stale"],
+            shared=shared_cache,
+        )
+        # Validators are built once from the trusted issuers and audiences
+        self.claims = access_token_validator(aai)
+        self.id_claims = id_token_validator(aai)
+        # Keep AAI endpoints up to date from the discovery document
+        self.discovery: Optional[Discovery] = None
+        if aai["url_discovery"]:
+            self.discovery = Discovery(
+                self, aai["url_discovery"], lifetime=aai["discovery_lifetime"], retry=aai["discovery_retry"], timeout=aai["discovery_timeout"]
+            )
+
+    async def start(self) -> None:
+        """Fetch the discovery document of the provider."""
+        if self.discovery is not None:
+            await self.discovery.load()
+
+    async def close(self) -> None:
+        """Stop background refreshing, and close the connection pool."""
+        if self.discovery is not None:
+            await self.discovery.close()
+        await self.jwks.close()
+        await self.client_session.close()
+
+
+def get_provider(app: web.Application, name: Optional[str] = None) -> Provider:
+    """Return a provider by name, or the default provider."""
+    try:
+        return app["providers"][name or DEFAULT_PROVIDER]
+    except KeyError:
+        LOG.error("Unknown provider %s.", name)
+        raise web.HTTPBadRequest(text=f"Unknown provider {name}.")
+
+
+async def session_provider(request: web.Request) -> Provider:
+    """Return the provider the user logged in with, sessions from before providers were configured use the default provider."""
+    session = await get_session(request)
+    return get_provider(request.app, session.get("oidc_provider"))
+
+
+def setup_providers(app: web.Application, providers: dict) -> None:
+    """Add providers to the application, with an index of providers by the issuers they trust."""
+    app["providers"] = providers
+    app["provider"] = providers[DEFAULT_PROVIDER]
+    app["issuers"] = {issuer: providers[name] for issuer, name in index_issuers({name: provider.aai for name, provider in providers.items()}).items()}
+
+
+async def start_providers(app: web.Application) -> None:
+    """Fetch the discovery documents of all providers on server startup."""
+    LOG.debug("Start AAI providers.")
+
+    await asyncio.gather(*[provider.start() for provider in app["providers"].values()])
+
+
+async def close_providers(app: web.Application) -> None:
+    """Close all providers on server shutdown."""
+    LOG.debug("Close AAI providers.")
+
+    await asyncio.gather(*[provider.close() for provider in app["providers"].values()])
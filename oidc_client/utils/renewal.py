@@ -0,0 +1,122 @@
+"""Background Token Renewal."""
+
+import time
+import heapq
+import asyncio
+
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from .utils import refresh_access_token, validate_token
+from .providers import get_provider
+from ..config import LOG
+
+
+class TokenRenewer:
+    """Refreshes access tokens of server-side sessions before they expire."""
+
+    def __init__(self, app: web.Application, storage, margin: int = 300, batch_size: int = 10, rate: float = 5.0) -> None:
+        """Initialise a renewer for sessions kept in ``storage``.
+
+        Access tokens are refreshed ``margin`` seconds before they expire. At most ``batch_size`` tokens are
+        refreshed at once, and at most ``rate`` tokens per second, so that sessions started at the same time
+        reach the AAI as steady traffic instead of a spike.
+        """
+        self.app = app
+        self.storage = storage
+        self.margin = margin
+        self.batch_size = batch_size
+        self.rate = rate
+        # Heap of renewal times and session IDs, a session may have outdated entries in the heap
+        self.queue: List[Tuple[float, str]] = []
+        self.scheduled: Dict[str, float] = {}
+        self._task: Optional[asyncio.Future] = None
+
+    def schedule(self, key: str, expires: float) -> None:
+        """Schedule renewal of the access token of a session, that expires at ``expires`` epoch seconds."""
+        due = expires - self.margin
+        self.scheduled[key] = due
+        heapq.heappush(self.queue, (due, key))
+
+    def due(self, now: float) -> List[str]:
+        """Take the next batch of sessions due for renewal."""
+        batch: List[str] = []
+        while self.queue and self.queue[0][0] <= now and len(batch) < self.batch_size:
+            due, key = heapq.heappop(self.queue)
+            # Skip entries replaced by a later schedule
+            if self.scheduled.get(key) == due:
+                del self.scheduled[key]
+                batch.append(key)
+        return batch
+
+    async def renew(self, key: str) -> None:
+        """Refresh the access token of a session, and save the new tokens to its session data."""
+        try:
+            data = await self.storage.load(key)
+            if data is None or "refresh_token" not in data["session"]:
+                LOG.debug("Session has ended or has no refresh token, renewal is cancelled.")
+                return
+            provider = get_provider(self.app, data["session"].get("oidc_provider"))
+            refresh_token = data["session"]["refresh_token"]
+            tokens = await refresh_access_token(provider, refresh_token)
+            claims = await validate_token(self.app, tokens["access_token"])
+            if not await self.save(key, refresh_token, tokens):
+                return
+        except web.HTTPException as e:
+            LOG.warning("Could not renew access token: %s", e.text)
+            return
+        except Exception as e:
+            LOG.error("Renewing access token failed: %r", e)
+            return
+        self.schedule(key, claims["exp"])
+
+    async def save(self, key: str, refresh_token: str, tokens: dict) -> bool:
+        """Save renewed tokens to the current session data, unless the session has ended or changed meanwhile.
+
+        The session is loaded again after the AAI has answered, so that a logout during the renewal
+        is not undone by saving the session data loaded before it.
+        """
+        data = await self.storage.load(key)
+        if data is None or data["session"].get("refresh_token") != refresh_token:
+            LOG.debug("Session has ended or changed during renewal, renewed tokens are discarded.")
+            return False
+        data["session"]["access_token"] = tokens["access_token"]
+        data["session"]["refresh_token"] = tokens.get("refresh_token", refresh_token)
+        await self.storage.store(key, data)
+        return True
+
+    async def run(self) -> None:
+        """Renew due sessions one batch at a time, at the configured rate."""
+        interval = self.batch_size / self.rate
+        while True:
+            batch = self.due(time.time())
+            if batch:
+                LOG.debug("Renewing access tokens of %s sessions.", len(batch))
+                await asyncio.gather(*[self.renew(key) for key in batch])
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        """Start renewing in the background."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def close(self) -> None:
+        """Stop renewing."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+async def start_token_renewer(app: web.Application) -> None:
+    """Start the token renewer on server startup."""
+    LOG.debug("Start token renewer.")
+
+    app["token_renewer"].start()
+
+
+async def close_token_renewer(app: web.Application) -> None:
+    """Stop the token renewer on server shutdown."""
+    LOG.debug("Close token renewer.")
+
+    await app["token_renewer"].close()
@@ -0,0 +1,193 @@
+"""Background Token Revocation."""
+
+import random
+import asyncio
+
+from typing import TYPE_CHECKING, AsyncGenerator, AsyncIterable, Iterable, List, Union
+
+import aiohttp
+
+from aiohttp import web
+
+from .utils import revoke_token
+from .metrics import REVOCATION_QUEUE_DEPTH, REVOCATION_FAILURES, REVOCATION_REJECTED, REVOCATION_DROPPED
+from ..config import LOG
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .providers import Provider
+
+# Failures of the AAI or of the connection to it, that may pass, unlike tokens or clients rejected by the AAI
+TRANSIENT_ERRORS = (web.HTTPServerError, asyncio.TimeoutError, aiohttp.ClientError)
+
+
+class RevocationQueue:
+    """Bounded queue of tokens, that are revoked at their AAI provider by a pool of background workers."""
+
+    def __init__(self, maxsize: int = 1000, workers: int = 4, retries: int = 3, backoff: float = 0.5, drain_timeout: float = 5.0) -> None:
+        """Initialise a queue of at most ``maxsize`` tokens.
+
+        A revocation failed by an AAI or connection error is retried up to ``retries`` times, waiting ``backoff`` seconds before the first retry and
+        doubling the wait with jitter after each further failure. On shutdown, queued tokens are revoked for up to
+        ``drain_timeout`` seconds before the workers are stopped.
+        """
+        self.maxsize = maxsize
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.drain_timeout = drain_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._tasks: List[asyncio.Future] = []
+
+    def start(self) -> None:
+        """Start the worker pool."""
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    def submit(self, token: str, provider: "Provider") -> bool:
+        """Queue a token for revocation at a provider without waiting, and tell if it was accepted."""
+        try:
+            self.queue.put_nowait((token, provider))
+        except asyncio.QueueFull:
+            LOG.error("Token revocation queue is full, token is not revoked.")
+            REVOCATION_DROPPED.inc()
+            return False
+        REVOCATION_QUEUE_DEPTH.set(self.queue.qsize())
+        return True
+
+    async def revoke(self, token: str, provider: "Provider") -> None:
+        """Revoke a token at AAI, retrying transient failures with exponential backoff.
+
+        Each attempt is a single request, so that the retries of the queue are the only ones made for a token.
+        Tokens rejected by the AAI, e.g. already invalid tokens, are not retried.
+        """
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                await revoke_token(provider, token, retry=False)
+                return
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.retries:
+                    LOG.error("Token revocation failed after %s attempts: %r", attempt + 1, e)
+                    REVOCATION_FAILURES.inc()
+                    return
+                LOG.warning("Token revocation failed, retrying: %r", e)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOG.error("Token revocation was rejected: %r", e)
+                REVOCATION_REJECTED.inc()
+                return
+            # Full jitter keeps retries of many tokens from reaching the AAI at the same time
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))  # nosec
+            delay *= 2
+
+    async def close(self) -> None:
+        """Revoke queued tokens, and stop the worker pool."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            LOG.error("Token revocation queue was not drained, %s tokens are not revoked.", self.queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        REVOCATION_QUEUE_DEPTH.set(0)
+
+    async def _work(self) -> None:
+        """Revoke queued tokens one at a time."""
+        while True:
+            token, provider = await self.queue.get()
+            REVOCATION_QUEUE_DEPTH.set(self.queue.qsize())
+            try:
+                await self.revoke(token, provider)
+            finally:
+                self.queue.task_done()
+
+
+async def revoke_tokens(provider: "Provider", tokens: Union[Iterable[str], AsyncIterable[str]], concurrency: int = 20) -> AsyncGenerator[dict, None]:
+    """Revoke tokens at a provider with at most ``concurrency`` requests at a time, and yield the result of each token when it is known.
+
+    Tokens are read from ``tokens`` only as fast as they are revoked, so that a long stream of tokens is not held in memory.
+    Results are not in the same order as the tokens, the ``index`` of each result tells which token it belongs to.
+    Errors reading tokens are raised once the tokens read so far are revoked.
+    """
+    pending: asyncio.Queue = asyncio.Queue(concurrency)
+    results: asyncio.Queue = asyncio.Queue()
+    reader = asyncio.ensure_future(_read_tokens(tokens, pending, concurrency))
+    workers = [asyncio.ensure_future(_revoke_pending(provider, pending, results)) for _ in range(concurrency)]
+    try:
+        finished = 0
+        while finished < concurrency:
+            result = await results.get()
+            if result is None:
+                finished += 1
+            else:
+                yield result
+        # Raise errors from reading tokens
+        await reader
+    finally:
+        # Stop reading and revoking when the consumer stops early, before the event loop may be closed
+        for task in [reader, *workers]:
+            task.cancel()
+        await asyncio.gather(reader, *workers, return_exceptions=True)
+
+
+async def _read_tokens(tokens: Union[Iterable[str], AsyncIterable[str]], pending: asyncio.Queue, workers: int) -> None:
+    """Put numbered tokens in the queue, followed by an end marker for each worker, also if reading tokens fails."""
+    try:
+        index = 0
+        if isinstance(tokens, AsyncIterable):
+            async for token in tokens:
+                await pending.put((index, token))
+                index += 1
+        else:
+            for token in tokens:
+                await pending.put((index, token))
+                index += 1
+    except asyncio.CancelledError:
+        # The workers are cancelled together with the reader, and wait for no end marker
+        raise
+    except Exception:
+        await _stop_workers(pending, workers)
+        raise
+    await _stop_workers(pending, workers)
+
+
+async def _stop_workers(pending: asyncio.Queue, workers: int) -> None:
+    """Put an end marker in the queue for each worker."""
+    for _ in range(workers):
+        await pending.put(None)
+
+
+async def _revoke_pending(provider: "Provider", pending: asyncio.Queue, results: asyncio.Queue) -> None:
+    """Revoke tokens from the queue until the end marker, and put their results in the result queue."""
+    while True:
+        item = await pending.get()
+        if item is None:
+            await results.put(None)
+            return
+        index, token = item
+        try:
+            await revoke_token(provider, token)
+            await results.put({"index": index, "revoked": True})
+        except asyncio.CancelledError:
+            raise
+        except web.HTTPException as e:
+            await results.put({"index": index, "revoked": False, "error": e.text})
+        except Exception as e:
+            await results.put({"index": index, "revoked": False, "error": repr(e)})
+
+
+async def start_revocation_queue(app: web.Application) -> None:
+    """Start the revocation queue on server startup."""
+    LOG.debug("Start token revocation queue.")
+
+    app["revocation_queue"].start()
+
+
+async def close_revocation_queue(app: web.Application) -> None:
+    """Revoke queued tokens and stop the revocation queue on server shutdown."""
+    LOG.debug("Close token revocation queue.")
+
+    await app["revocation_queue"].close()
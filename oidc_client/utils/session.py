@@ -0,0 +1,222 @@
+"""Session Storage Backends."""
+
+import abc
+import secrets
+
+from typing import Any, Mapping, Optional
+
+from aiohttp import web
+from aiohttp_session import AbstractStorage, Session, SESSION_KEY, STORAGE_KEY, get_session
+from aiohttp_session.cookie_storage import EncryptedCookieStorage
+from cryptography.fernet import InvalidToken
+
+from .cache import LRUCache
+from .offload import CryptoExecutor
+from .metrics import instrument
+from ..config import CONFIG, LOG
+
+# Loading and saving sessions are timed as stages of request processing for all session backends
+timed_load = instrument("session_load")
+timed_save = instrument("session_save")
+
+
+class ServerSideStorage(AbstractStorage):
+    """Session storage, that keeps session data on the server and only an opaque session ID in the cookie."""
+
+    def __init__(self, *, lifetime: int = 3600, **kwargs) -> None:
+        """Initialise storage, session data is kept for ``lifetime`` seconds after it was last saved."""
+        super().__init__(**kwargs)
+        self.lifetime = lifetime
+
+    @timed_load
+    async def load_session(self, request: web.Request) -> Session:
+        """Load session data for the session ID in cookies."""
+        key = self.load_cookie(request)
+        if key is not None:
+            data = await self.load(key)
+            if data is not None:
+                return Session(key, data=data, new=False, max_age=self.max_age)
+        return Session(None, data=None, new=True, max_age=self.max_age)
+
+    @timed_save
+    async def save_session(self, request: web.Request, response: web.StreamResponse, session: Session) -> None:
+        """Save session data, and set the session ID to cookies for new sessions."""
+        key = session.identity
+        if key is not None and session.empty:
+            self.save_cookie(response, "", max_age=session.max_age)
+            await self.delete(key)
+            return
+        if key is None:
+            key = secrets.token_urlsafe(32)
+        if session.new:
+            self.save_cookie(response, key, max_age=session.max_age)
+        await self.store(key, self._get_session_data(session))
+
+    async def regenerate(self, request: web.Request, session: Session) -> Session:
+        """Move session data to a new session ID, and remove the data kept for the old one.
+
+        The new session ID is set to cookies when the session is saved, so that a session ID
+        known before login does not give access to the logged in session.
+        """
+        if session.identity is not None:
+            await self.delete(session.identity)
+        regenerated = Session(secrets.token_urlsafe(32), data={"session": dict(session)}, new=True, max_age=session.max_age)
+        regenerated.changed()
+        request[SESSION_KEY] = regenerated
+        return regenerated
+
+    @abc.abstractmethod
+    async def load(self, key: str):
+        """Return session data for a session ID, or None if there is no such session."""
+
+    @abc.abstractmethod
+    async def store(self, key: str, data: Mapping[str, Any]) -> None:
+        """Store session data for a session ID."""
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove session data for a session ID."""
+
+    async def close(self) -> None:
+        """Release resources held by the storage."""
+
+
+class MemoryStorage(ServerSideStorage):
+    """Bounded in-process session storage, sessions are local to each worker."""
+
+    def __init__(self, *, maxsize: int = 100000, **kwargs) -> None:
+        """Initialise storage, the least recently used sessions are evicted above ``maxsize`` sessions."""
+        super().__init__(**kwargs)
+        self.sessions = LRUCache(maxsize)
+
+    async def load(self, key: str):
+        """Return session data for a session ID."""
+        return self.sessions.get(key)
+
+    async def store(self, key: str, data: Mapping[str, Any]) -> None:
+        """Store session data for a session ID."""
+        self.sessions.set(key, data, self.lifetime)
+
+    async def delete(self, key: str) -> None:
+        """Remove session data for a session ID."""
+        self.sessions.delete(key)
+
+
+class RedisStorage(ServerSideStorage):
+    """Session storage in a Redis compatible key-value store, sessions are shared by all workers."""
+
+    def __init__(self, redis, **kwargs) -> None:
+        """Initialise storage with an asyncio Redis client, such as ``redis.asyncio.Redis``."""
+        super().__init__(**kwargs)
+        self.redis = redis
+
+    async def load(self, key: str):
+        """Return session data for a session ID."""
+        data = await self.redis.get(f"{self.cookie_name}_{key}")
+        if data is None:
+            return None
+        try:
+            return self._decoder(data.decode("utf-8") if isinstance(data, bytes) else data)
+        except ValueError:
+            LOG.error("Session data in Redis could not be decoded.")
+            return None
+
+    async def store(self, key: str, data: Mapping[str, Any]) -> None:
+        """Store session data for a session ID."""
+        await self.redis.set(f"{self.cookie_name}_{key}", self._encoder(data), ex=self.lifetime)
+
+    async def delete(self, key: str) -> None:
+        """Remove session data for a session ID."""
+        await self.redis.delete(f"{self.cookie_name}_{key}")
+
+    async def close(self) -> None:
+        """Close connections to Redis."""
+        await self.redis.close()
+
+
+class CookieStorage(EncryptedCookieStorage):
+    """Encrypted cookie storage, whose loading and saving of sessions are timed."""
+
+    @timed_load
+    async def load_session(self, request: web.Request) -> Session:
+        """Load and decrypt session data from cookies."""
+        return await super().load_session(request)
+
+    @timed_save
+    async def save_session(self, request: web.Request, response: web.StreamResponse, session: Session) -> None:
+        """Encrypt and save session data to cookies."""
+        await super().save_session(request, response, session)
+
+
+class OffloadedCookieStorage(CookieStorage):
+    """Encrypted cookie storage, that encrypts and decrypts session cookies with a crypto executor."""
+
+    def __init__(self, secret_key: bytes, *, executor: CryptoExecutor, **kwargs) -> None:
+        """Initialise storage, cookies of at least the threshold of ``executor`` are encrypted and decrypted in its threads."""
+        super().__init__(secret_key, **kwargs)
+        self.executor = executor
+
+    @timed_load
+    async def load_session(self, request: web.Request) -> Session:
+        """Load and decrypt session data from cookies."""
+        cookie = self.load_cookie(request)
+        if cookie is None:
+            return Session(None, data=None, new=True, max_age=self.max_age)
+        try:
+            data = await self.executor.run(len(cookie), self._decrypt, cookie)
+        except InvalidToken:
+            LOG.warning("Cannot decrypt cookie value, create a new fresh session.")
+            return Session(None, data=None, new=True, max_age=self.max_age)
+        return Session(None, data=data, new=False, max_age=self.max_age)
+
+    @timed_save
+    async def save_session(self, request: web.Request, response: web.StreamResponse, session: Session) -> None:
+        """Encrypt and save session data to cookies."""
+        if session.empty:
+            return self.save_cookie(response, "", max_age=session.max_age)
+        data = self._encoder(self._get_session_data(session)).encode("utf-8")
+        cookie = await self.executor.run(len(data), self._fernet.encrypt, data)
+        self.save_cookie(response, cookie.decode("utf-8"), max_age=session.max_age)
+
+    def _decrypt(self, cookie: str) -> dict:
+        """Decrypt and decode session data."""
+        return self._decoder(self._fernet.decrypt(cookie.encode("utf-8"), ttl=self.max_age).decode("utf-8"))
+
+
+async def regenerate_session(request: web.Request) -> Session:
+    """Return the session of a request, moved to a new session ID if the session is kept on the server."""
+    session = await get_session(request)
+    storage = request.get(STORAGE_KEY)
+    if isinstance(storage, ServerSideStorage):
+        LOG.debug("Regenerate session ID.")
+        return await storage.regenerate(request, session)
+    return session
+
+
+def create_session_storage(executor: Optional[CryptoExecutor] = None) -> AbstractStorage:
+    """Create session storage for the configured session backend, cookies are encrypted with ``executor`` if it offloads work."""
+    backend = CONFIG.app["session_backend"]
+    LOG.debug("Create %s session storage.", backend)
+
+    if backend == "memory":
+        return MemoryStorage(maxsize=CONFIG.app["session_max_entries"], lifetime=CONFIG.cookie["token_lifetime"])
+    if backend == "redis":
+        try:
+            from redis.asyncio import from_url  # type: ignore
+        except ImportError:  # pragma: no cover
+            raise RuntimeError("Session backend redis requires the redis package: pip install oidc_client[redis]")
+        return RedisStorage(from_url(CONFIG.app["session_redis_url"]), lifetime=CONFIG.cookie["token_lifetime"])
+
+    # Encryption key must be 32 len bytes
+    if executor is not None and executor.offloading:
+        return OffloadedCookieStorage(CONFIG.app["session_key"].encode(), executor=executor)
+    return CookieStorage(CONFIG.app["session_key"].encode())
+
+
+async def close_session_storage(app: web.Application) -> None:
+    """Close session storage on server shutdown."""
+    LOG.debug("Close session storage.")
+
+    storage = app["session_storage"]
+    if isinstance(storage, ServerSideStorage):
+        await storage.close()
@@ -1,101 +1,238 @@
 """General Utility Functions."""
 
+import time
+import random
+import asyncio
+import hashlib
 import secrets
 import urllib.parse
 
 import aiohttp
 
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional, Tuple, Union
+
 from aiohttp_session import get_session
 from aiohttp import web
-from aiocache import cached
-from aiocache.serializers import JsonSerializer
-from authlib.jose import jwt
-from authlib.jose.errors import MissingClaimError, InvalidClaimError, ExpiredTokenError, BadSignatureError
+from authlib.common.encoding import json_loads, to_bytes, to_unicode, urlsafe_b64decode, urlsafe_b64encode
 
+from .claims import ClaimsValidator
+from .metrics import instrument, TOKEN_CACHE_HITS, TOKEN_CACHE_MISSES
 from ..config import CONFIG, LOG
 
+if TYPE_CHECKING:  # pragma: no cover
+    from .providers import Provider
+
 
-async def generate_state() -> str:
+def generate_state() -> str:
     """Generate a state for authentication request and return the value for use."""
     LOG.debug("Generate a new state for authentication request.")
     return secrets.token_hex()
 
 
+def generate_pkce() -> Tuple[str, str]:
+    """Generate a PKCE code verifier, and return it with its S256 code challenge."""
+    code_verifier = secrets.token_urlsafe(32)
+    code_challenge = to_unicode(urlsafe_b64encode(hashlib.sha256(code_verifier.encode()).digest()))
+    return code_verifier, code_challenge
+
+
 async def get_from_session(request: web.Request, key: str) -> str:
     """Get a desired value from session storage."""
-    LOG.debug(f"Retrieve value for {key} from session storage.")
+    LOG.debug("Retrieve value for %s from session storage.", key)
 
     session = await get_session(request)
     try:
-        LOG.debug(f"Returning session value for: {key}.")
+        LOG.debug("Returning session value for: %s.", key)
         return session[key]
     except KeyError as e:
-        LOG.error(f"Session has no value for {key}: {e}.")
+        LOG.error("Session has no value for %s: %s.", key, e)
         raise web.HTTPUnauthorized(text="401 Uninitialised session.")
     except Exception as e:
-        LOG.error(f"Failed to retrieve {key} from session: {e}")
+        LOG.error("Failed to retrieve %s from session: %s", key, e)
         raise web.HTTPInternalServerError(text=f"500 Session has failed: {e}")
 
 
 async def save_to_session(request: web.Request, key: str = "key", value: str = "value") -> None:
     """Save a given value to a session key."""
-    LOG.debug(f"Save a value for {key} to session.")
+    LOG.debug("Save a value for %s to session.", key)
 
     session = await get_session(request)
     session[key] = value
 
 
+async def pop_from_session(request: web.Request, key: str) -> Optional[str]:
+    """Remove a value from session storage, and return it if it was set."""
+    LOG.debug("Remove value for %s from session storage.", key)
+
+    session = await get_session(request)
+    return session.pop(key, None)
+
+
 async def get_from_cookies(request: web.Request, key: str) -> str:
     """Get a desired value from cookies."""
-    LOG.debug(f"Retrieve value for {key} from cookies.")
+    LOG.debug("Retrieve value for %s from cookies.", key)
 
     try:
-        LOG.debug(f"Returning cookie value for: {key}.")
+        LOG.debug("Returning cookie value for: %s.", key)
         return request.cookies[key]
     except KeyError as e:
-        LOG.error(f"Cookies has no value for {key}: {e}.")
+        LOG.error("Cookies has no value for %s: %s.", key, e)
         raise web.HTTPUnauthorized(text="401 Uninitialised session.")
     except Exception as e:
-        LOG.error(f"Failed to retrieve cookie: {e}")
+        LOG.error("Failed to retrieve cookie: %s", e)
         raise web.HTTPInternalServerError(text=f"500 Session has failed: {e}")
 
 
 async def save_to_cookies(response: web.HTTPSeeOther, key: str = "key", value: str = "value", http_only=True, lifetime: int = 300) -> web.HTTPSeeOther:
     """Save a given value to cookies."""
-    LOG.debug(f"Save a value for {key} to cookies.")
+    LOG.debug("Save a value for %s to cookies.", key)
 
     response.set_cookie(key, value, domain=CONFIG.cookie["domain"], max_age=lifetime, secure=CONFIG.cookie["secure"], httponly=http_only)
 
     return response
 
 
-async def request_token(code: str) -> str:
-    """Request token from AAI."""
+async def create_client_session() -> aiohttp.ClientSession:
+    """Create a pooled client session, that is shared by all requests to AAI."""
+    LOG.debug("Create client session for AAI.")
+
+    connector = aiohttp.TCPConnector(
+        limit=CONFIG.client["connection_limit"],
+        limit_per_host=CONFIG.client["connection_limit_per_host"],
+        keepalive_timeout=CONFIG.client["keepalive_timeout"],
+        ttl_dns_cache=CONFIG.client["dns_cache_ttl"],
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+class AAIRequest:
+    """Request to AAI with timeouts, retries of idempotent requests, and a circuit breaker.
+
+    Used as ``async with AAIRequest(provider, "GET", url) as response:``, the response body has been read when it is returned.
+    """
+
+    def __init__(self, provider: "Provider", method: str, url: str, *, idempotent: bool = False, read_timeout: Optional[float] = None, **kwargs) -> None:
+        """Prepare a request, idempotent requests are retried after connection errors, timeouts and server errors."""
+        self.provider = provider
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.retries = CONFIG.client["aai_retries"] if idempotent else 0
+        connect_timeout = CONFIG.client["connect_timeout"]
+        read_timeout = read_timeout or CONFIG.client["read_timeout"]
+        self.timeout = aiohttp.ClientTimeout(total=connect_timeout + read_timeout, sock_connect=connect_timeout, sock_read=read_timeout)
+        self.response: Optional[aiohttp.ClientResponse] = None
+
+    async def __aenter__(self) -> aiohttp.ClientResponse:
+        """Send the request, and return the response."""
+        breaker = self.provider.breaker
+        error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # Jitter keeps retries of concurrent requests from reaching the AAI at the same time
+                await asyncio.sleep(CONFIG.client["aai_retry_backoff"] * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))  # nosec
+            if not breaker.allow():
+                LOG.error("Circuit to AAI is open, %s request is refused.", self.method)
+                raise web.HTTPServiceUnavailable(text="AAI is unavailable.", headers={"Retry-After": str(breaker.retry_after())})
+            try:
+                response = await self.provider.client_session.request(self.method, self.url, timeout=self.timeout, **self.kwargs)
+                await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                LOG.warning("%s request to AAI failed: %r", self.method, e)
+                breaker.failure()
+                error = e
+                continue
+            if response.status < 500:
+                breaker.success()
+            else:
+                breaker.failure()
+                if attempt < self.retries:
+                    response.release()
+                    continue
+            self.response = response
+            return response
+
+        LOG.error("%s request to AAI failed after %s attempts.", self.method, self.retries + 1)
+        raise web.HTTPBadGateway(text=f"Request to AAI failed: {error!r}")
+
+    async def __aexit__(self, *exc_info) -> None:
+        """Release the connection."""
+        if self.response is not None:
+            self.response.release()
+
+
+@instrument("request_token")
+async def request_token(provider: "Provider", code: str, code_verifier: Optional[str] = None) -> dict:
+    """Request token from AAI, and return the token response including a possible refresh token."""
     LOG.debug("Requesting token.")
 
-    auth = aiohttp.BasicAuth(login=CONFIG.aai["client_id"], password=CONFIG.aai["client_secret"])
-    data = {"grant_type": "authorization_code", "code": code, "redirect_uri": CONFIG.aai["url_callback"]}
+    # Set up client authentication for request
+    auth = aiohttp.BasicAuth(login=provider.aai["client_id"], password=provider.aai["client_secret"])
+    data = {"grant_type": "authorization_code", "code": code, "redirect_uri": provider.aai["url_callback"]}
+    if code_verifier is not None:
+        # Prove that the code was requested by this client, see RFC 7636
+        data["code_verifier"] = code_verifier
+
+    # Send request to AAI
+    async with AAIRequest(provider, "POST", provider.aai["url_token"], read_timeout=CONFIG.client["token_read_timeout"], data=data, auth=auth) as response:
+        LOG.debug("AAI response status: %s.", response.status)
+        # Validate response from AAI
+        if response.status == 200:
+            # Parse response
+            result = await response.json()
+            # Look for access token
+            if "access_token" in result:
+                LOG.debug("Access token received.")
+                return result
+            else:
+                LOG.error("AAI response did not contain an access token.")
+                raise web.HTTPBadRequest(text="AAI response did not contain an access token.")
+        else:
+            LOG.error("Token request to AAI failed: %s.", response)
+            LOG.error(await response.text())
+            raise web.HTTPBadRequest(text=f"Token request to AAI failed: {response.status}.")
+
+
+@instrument("refresh_token")
+async def refresh_access_token(provider: "Provider", refresh_token: str) -> dict:
+    """Request a new access token from AAI with a refresh token."""
+    LOG.debug("Refreshing token.")
 
     # Set up client authentication for request
-    async with aiohttp.ClientSession(auth=auth) as session:
-        # Send request to AAI
-        async with session.post(CONFIG.aai["url_token"], data=data) as response:
-            LOG.debug(f"AAI response status: {response.status}.")
-            # Validate response from AAI
-            if response.status == 200:
-                # Parse response
-                result = await response.json()
-                # Look for access token
-                if "access_token" in result:
-                    LOG.debug("Access token received.")
-                    return result["access_token"]
-                else:
-                    LOG.error("AAI response did not contain an access token.")
-                    raise web.HTTPBadRequest(text="AAI response did not contain an access token.")
+    auth = aiohttp.BasicAuth(login=provider.aai["client_id"], password=provider.aai["client_secret"])
+    data = {"grant_type": "refresh_token", "refresh_token": refresh_token}
+
+    # Send request to AAI
+    async with AAIRequest(provider, "POST", provider.aai["url_token"], read_timeout=CONFIG.client["token_read_timeout"], data=data, auth=auth) as response:
+        LOG.debug("AAI response status: %s.", response.status)
+        if response.status == 200:
+            result = await response.json()
+            if "access_token" in result:
+                LOG.debug("Refreshed access token received.")
+                return result
             else:
-                LOG.error(f"Token request to AAI failed: {response}.")
-                LOG.error(await response.json())
-                raise web.HTTPBadRequest(text=f"Token request to AAI failed: {response.status}.")
+                LOG.error("AAI response did not contain an access token.")
+                raise web.HTTPBadRequest(text="AAI response did not contain an access token.")
+        elif response.status in (400, 401):
+            # Refresh token has expired or has been revoked, the user must log in again
+            LOG.error("AAI rejected refresh token: %s.", response)
+            raise web.HTTPUnauthorized(text="Refresh token was rejected by AAI.")
+        else:
+            LOG.error("Token refresh at AAI failed: %s.", response)
+            raise web.HTTPBadRequest(text=f"Token refresh at AAI failed: {response.status}.")
+
+
+async def save_tokens(request: web.Request, tokens: dict, claims: dict) -> None:
+    """Save tokens to session storage, and schedule renewal of the access token if a refresh token was received."""
+    LOG.debug("Save tokens to session.")
+
+    session = await get_session(request)
+    session["access_token"] = tokens["access_token"]
+    if "refresh_token" in tokens:
+        session["refresh_token"] = tokens["refresh_token"]
+        # Only sessions with server-side data can be renewed without the user
+        if "token_renewer" in request.app and session.identity is not None:
+            request.app["token_renewer"].schedule(session.identity, claims["exp"])
 
 
 async def query_params(request: web.Request) -> dict:
@@ -107,68 +244,363 @@ async def query_params(request: web.Request) -> dict:
         LOG.debug("AAI response contained the correct params.")
         return {"state": request.query["state"], "code": request.query["code"]}
     else:
-        LOG.error(f"AAI response is missing mandatory params, received: {request.query}")
+        # Only names of the params are logged, as values may carry codes and errors of the AAI
+        LOG.error("AAI response is missing mandatory params, received params: %s", ", ".join(sorted(request.query)))
         raise web.HTTPBadRequest(text="AAI response is missing mandatory parameters.")
 
 
-@cached(ttl=3600, key="jwk", serializer=JsonSerializer())
-async def get_jwk() -> dict:
+async def introspection_params(request: web.Request) -> Tuple[list, bool]:
+    """Parse tokens from introspection request body, and tell if a batch of tokens was requested."""
+    LOG.debug("Parse tokens from introspection request.")
+
+    # Tokens are sent as form parameters as in RFC 7662, or in a JSON object or array
+    if request.content_type == "application/json":
+        try:
+            body = await request.json()
+        except ValueError:
+            LOG.error("Introspection request body is not valid JSON.")
+            raise web.HTTPBadRequest(text="Introspection request body is not valid JSON.")
+        if isinstance(body, dict):
+            batch = "tokens" in body
+            tokens = body["tokens"] if batch else [body.get("token")]
+        else:
+            batch = True
+            tokens = body
+    else:
+        form = await request.post()
+        tokens = form.getall("token", [])
+        batch = len(tokens) > 1
+
+    if not isinstance(tokens, list) or not tokens or not all(isinstance(token, str) for token in tokens):
+        LOG.error("Introspection request is missing tokens.")
+        raise web.HTTPBadRequest(text="Introspection request is missing mandatory parameter: token.")
+    if len(tokens) > CONFIG.app["introspect_max_tokens"]:
+        LOG.error("Introspection request has too many tokens: %s.", len(tokens))
+        raise web.HTTPBadRequest(text=f"Introspection request can have at most {CONFIG.app['introspect_max_tokens']} tokens.")
+
+    return tokens, batch
+
+
+def has_bearer_token(request: web.Request, secret: str) -> bool:
+    """Tell if the request carries the secret as a bearer token."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and secrets.compare_digest(token.encode(), secret.encode())
+
+
+async def check_admin(request: web.Request) -> None:
+    """Verify, that the request carries the admin token."""
+    LOG.debug("Authorise admin request.")
+
+    if not CONFIG.app["admin_token"]:
+        LOG.error("Admin request received, but admin endpoints are disabled.")
+        raise web.HTTPForbidden(text="Admin endpoints are disabled.")
+
+    if not has_bearer_token(request, CONFIG.app["admin_token"]):
+        LOG.error("Admin request is not authorised.")
+        raise web.HTTPUnauthorized(text="Admin request is not authorised.", headers={"WWW-Authenticate": "Bearer"})
+
+
+async def check_introspection(request: web.Request) -> None:
+    """Verify, that the request carries the introspection token or the admin token, RFC 7662 section 2.1."""
+    LOG.debug("Authorise introspection request.")
+
+    tokens = [token for token in (CONFIG.app["introspection_token"], CONFIG.app["admin_token"]) if token]
+    if not tokens:
+        LOG.error("Introspection request received, but introspection is disabled.")
+        raise web.HTTPForbidden(text="Introspection is disabled.")
+
+    if not any(has_bearer_token(request, token) for token in tokens):
+        LOG.error("Introspection request is not authorised.")
+        raise web.HTTPUnauthorized(text="Introspection request is not authorised.", headers={"WWW-Authenticate": "Bearer"})
+
+
+async def revocation_params(request: web.Request) -> Union[list, AsyncIterator[str]]:
+    """Parse tokens from a JSON array, or stream them from newline separated request body."""
+    LOG.debug("Parse tokens from revocation request.")
+
+    if request.content_type == "application/json":
+        try:
+            tokens = await request.json()
+        except ValueError:
+            LOG.error("Revocation request body is not valid JSON.")
+            raise web.HTTPBadRequest(text="Revocation request body is not valid JSON.")
+        if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+            LOG.error("Revocation request body is not an array of tokens.")
+            raise web.HTTPBadRequest(text="Revocation request body must be an array of tokens.")
+        return tokens
+
+    return read_lines(request.content)
+
+
+async def read_lines(stream: aiohttp.StreamReader) -> AsyncIterator[str]:
+    """Read non-empty lines from a stream."""
+    async for line in stream:
+        line = line.strip()
+        if line:
+            yield line.decode()
+
+
+@instrument("get_jwk")
+async def get_jwk(provider: "Provider") -> dict:
     """Get a key to decode access token with."""
     LOG.debug("Retrieving JWK.")
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(CONFIG.aai["jwk_server"]) as r:
-                # This can be a single key or a list of JWK
-                return await r.json()
-    except Exception as e:  # pragma: no cover
-        # cache is preventing the testing of this block. this block has been tested manually
-        LOG.error(f"Could not retrieve JWK: {e}")
+        async with AAIRequest(provider, "GET", provider.aai["jwk_server"], idempotent=True) as r:
+            r.raise_for_status()
+            # This can be a single key or a list of JWK
+            return await r.json()
+    except Exception as e:
+        LOG.error("Could not retrieve JWK: %s", e)
         raise web.HTTPInternalServerError(text="Could not retrieve public key.")
 
 
-async def validate_token(token: str) -> None:
-    """Validate JWT."""
+@instrument("get_discovery")
+async def get_discovery(provider: "Provider", url: str) -> Tuple[dict, Optional[int]]:
+    """Get OpenID Provider metadata, and the lifetime given to it by the AAI."""
+    LOG.debug("Retrieving discovery document.")
+
+    try:
+        async with AAIRequest(provider, "GET", url, idempotent=True) as r:
+            r.raise_for_status()
+            metadata = await r.json()
+            lifetime = cache_lifetime(r.headers.get("Cache-Control", ""), r.headers.get("Age", "0"))
+    except Exception as e:
+        LOG.error("Could not retrieve discovery document: %s", e)
+        raise web.HTTPInternalServerError(text="Could not retrieve discovery document.")
+
+    if not isinstance(metadata, dict):
+        LOG.error("Discovery document is not a JSON object.")
+        raise web.HTTPInternalServerError(text="Could not retrieve discovery document.")
+
+    return metadata, lifetime
+
+
+def cache_lifetime(cache_control: str, age: str = "0") -> Optional[int]:
+    """Return seconds a response may be cached according to its Cache-Control and Age headers, or None if not specified."""
+    directives = {}
+    for directive in cache_control.split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+
+    if "no-store" in directives or "no-cache" in directives:
+        return 0
+    try:
+        max_age = int(directives["max-age"])
+    except (KeyError, ValueError):
+        return None
+    try:
+        return max(max_age - int(age), 0)
+    except ValueError:
+        return max_age
+
+
+def token_header(token: str) -> dict:
+    """Read the unverified header of a JWT, an empty header is returned for malformed tokens."""
+    try:
+        header = json_loads(urlsafe_b64decode(to_bytes(token.split(".", 1)[0])))
+    except Exception:
+        return {}
+    return header if isinstance(header, dict) else {}
+
+
+def token_issuer(token: str) -> Optional[str]:
+    """Read the unverified issuer of a JWT, None is returned for malformed tokens."""
+    try:
+        issuer = json_loads(urlsafe_b64decode(to_bytes(token.split(".", 2)[1]))).get("iss")
+    except Exception:
+        return None
+    return issuer if isinstance(issuer, str) else None
+
+
+def token_provider(app: web.Application, token: str) -> "Provider":
+    """Find the provider trusting the issuer of a JWT, tokens of unknown issuers are left to the default provider to reject."""
+    return app["issuers"].get(token_issuer(token), app["provider"])
+
+
+def token_digest(token: str) -> bytes:
+    """Return the digest of a token, used as cache key instead of the token itself."""
+    return hashlib.sha256(token.encode()).digest()
+
+
+# Errors of failed validations, by status code, as they are kept in the shared cache
+VALIDATION_ERRORS = {web.HTTPUnauthorized.status_code: web.HTTPUnauthorized, web.HTTPForbidden.status_code: web.HTTPForbidden}
+
+
+async def cached_validation(app: web.Application, digest: bytes) -> Any:
+    """Look up a validation result in the cache of this worker, and then in the cache shared by all workers."""
+    result = app["token_cache"].get(digest)
+    if result is not None or app["shared_cache"] is None:
+        return result
+
+    shared = await app["shared_cache"].get(f"token:{digest.hex()}")
+    if isinstance(shared, list):
+        # Failed validation, kept as status code and error text
+        status, text = shared
+        result, lifetime = (VALIDATION_ERRORS[status], text), CONFIG.cache["token_cache_negative_lifetime"]
+    elif shared is not None:
+        result, lifetime = shared, min(shared["exp"] - time.time(), CONFIG.cache["token_cache_lifetime"])
+    else:
+        return None
+    app["token_cache"].set(digest, result, lifetime)
+    return result
+
+
+async def cache_validation(app: web.Application, digest: bytes, result: Any, lifetime: float) -> None:
+    """Store a validation result in the cache of this worker, and in the cache shared by all workers."""
+    app["token_cache"].set(digest, result, lifetime)
+    if app["shared_cache"] is not None:
+        shared = [result[0].status_code, result[1]] if isinstance(result, tuple) else result
+        await app["shared_cache"].set(f"token:{digest.hex()}", shared, lifetime)
+
+
+@instrument("validate_token")
+async def validate_token(app: web.Application, token: str) -> dict:
+    """Validate JWT and return its claims, results are cached by token digest."""
     LOG.debug("Validating access token.")
 
-    # Get JWK to decode the token with
-    jwk = await get_jwk()
+    # Look for a previous validation result of the same token
+    digest = token_digest(token)
+    result = await cached_validation(app, digest)
+    if result is not None:
+        TOKEN_CACHE_HITS.inc()
+        LOG.debug("Access token validation result found in cache.")
+        if isinstance(result, tuple):
+            # Failed validation, re-raise the same error
+            error, text = result
+            raise error(text=text)
+        return result
+
+    TOKEN_CACHE_MISSES.inc()
+    try:
+        claims = await decode_token(token_provider(app, token), token)
+    except (web.HTTPUnauthorized, web.HTTPForbidden) as e:
+        # Cache failures briefly to shed repeated attempts with the same bad token
+        await cache_validation(app, digest, (type(e), e.text), CONFIG.cache["token_cache_negative_lifetime"])
+        raise
+
+    # Cache success no longer than the token is valid
+    await cache_validation(app, digest, claims, min(claims["exp"] - time.time(), CONFIG.cache["token_cache_lifetime"]))
+    return claims
 
-    # Claims that must exist in the token, and required values if specified
-    claims_options = {
-        "iss": {"essential": True, "values": CONFIG.aai["iss"].split(",")},  # Token allowed from these issuers
-        "aud": {"essential": True, "values": CONFIG.aai["aud"].split(",")},  # Token allowed for these audiences
-        "iat": {"essential": True},
-        "exp": {"essential": True},
-    }
+
+@instrument("validate_id_token")
+async def validate_id_token(provider: "Provider", token: str, nonce: str) -> dict:
+    """Validate the ID token received at login, and that it carries the nonce of the login."""
+    LOG.debug("Validating ID token.")
+
+    # ID tokens are issued to this client, and not to the audiences of access tokens
+    claims = await decode_token(provider, token, provider.id_claims, name="ID token")
+
+    # Values of other than registered claims are not validated by authlib
+    if not secrets.compare_digest(str(claims["nonce"]), nonce):
+        raise web.HTTPForbidden(text="Could not validate ID token: Token was not issued for this login.")
+    return claims
+
+
+@instrument("request_userinfo")
+async def request_userinfo(provider: "Provider", token: str) -> dict:
+    """Request user information from AAI with an access token."""
+    LOG.debug("Requesting userinfo.")
+
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # Send request to AAI
+    async with AAIRequest(provider, "GET", provider.aai["url_userinfo"], idempotent=True, headers=headers) as response:
+        LOG.debug("AAI response status: %s.", response.status)
+        if response.status == 200:
+            return await response.json()
+        elif response.status == 401:
+            LOG.error("AAI rejected access token: %s.", response)
+            raise web.HTTPUnauthorized(text="Access token was rejected by AAI.")
+        else:
+            LOG.error("Userinfo request to AAI failed: %s.", response)
+            raise web.HTTPBadRequest(text=f"Userinfo request to AAI failed: {response.status}.")
+
+
+async def get_userinfo(app: web.Application, token: str) -> dict:
+    """Get user information for a valid access token, responses are cached until the token expires."""
+    LOG.debug("Retrieving userinfo.")
+
+    claims = await validate_token(app, token)
+    digest = token_digest(token)
+    userinfo = app["userinfo_cache"].get(digest)
+    if userinfo is not None:
+        LOG.debug("Userinfo found in cache.")
+        return userinfo
+
+    # Ask the provider, that issued the access token
+    userinfo = await request_userinfo(app["issuers"][claims["iss"]], token)
+    app["userinfo_cache"].set(digest, userinfo, min(claims["exp"] - time.time(), CONFIG.cache["userinfo_cache_lifetime"]))
+    return userinfo
+
+
+async def introspect_token(app: web.Application, token: str) -> dict:
+    """Introspect JWT locally, inactive tokens are not described further."""
+    LOG.debug("Introspecting access token.")
+    from authlib.jose.errors import JoseError
+
+    try:
+        claims = await validate_token(app, token)
+    except (web.HTTPUnauthorized, web.HTTPForbidden, JoseError, ValueError) as e:
+        # Malformed tokens and tokens, that do not fit the provider's key, are as inactive as rejected ones
+        LOG.debug("Access token is not active: %s", e)
+        return {"active": False}
+
+    return {"active": True, **claims}
+
+
+@instrument("decode_token")
+async def decode_token(provider: "Provider", token: str, validator: Optional[ClaimsValidator] = None, name: str = "access token") -> dict:
+    """Decode JWT, verify its signature and validate its claims, by default as an access token."""
+    LOG.debug("Decoding %s.", name)
+    # Token decoding imports authlib.jose and cryptography on first use, rather than at startup
+    from authlib.jose.errors import MissingClaimError, InvalidClaimError, InvalidTokenError, ExpiredTokenError, BadSignatureError
+    from .jws import parse_compact
+
+    # Parse the token once, and get the verifier of the JWK matching its key ID
+    jws = parse_compact(token)
+    verifier = await provider.jwks.get_verifier((jws.header if jws is not None else token_header(token)).get("kid"))
+
+    # Validator of the claims, built once at startup
+    validator = validator or provider.claims
     try:
         # Decode the token and validate the contents
-        decoded_data = jwt.decode(token, jwk, claims_options=claims_options)
-        decoded_data.validate()
+        decoded_data = await provider.executor.run(len(token), verifier.decode, token, jws, validator.options)
+        validator.validate(decoded_data)
     except MissingClaimError as e:
-        raise web.HTTPUnauthorized(text=f"Could not validate access token: Missing claim(s): {e}")
+        raise web.HTTPUnauthorized(text=f"Could not validate {name}: Missing claim(s): {e}")
     except ExpiredTokenError as e:
-        raise web.HTTPUnauthorized(text=f"Could not validate access token: Expired signature: {e}")
+        raise web.HTTPUnauthorized(text=f"Could not validate {name}: Expired signature: {e}")
+    except InvalidTokenError as e:
+        raise web.HTTPUnauthorized(text=f"Could not validate {name}: Token not yet valid: {e}")
     except InvalidClaimError as e:
-        raise web.HTTPForbidden(text=f"Could not validate access token: Token info not corresponding with claim: {e}")
+        raise web.HTTPForbidden(text=f"Could not validate {name}: Token info not corresponding with claim: {e}")
     except BadSignatureError as e:
-        raise web.HTTPForbidden(text=f"Could not validate access token: Token signature could not be verified: {e}")
+        raise web.HTTPForbidden(text=f"Could not validate {name}: Token signature could not be verified: {e}")
+
+    return dict(decoded_data)
 
 
-async def revoke_token(token: str) -> None:
-    """Request token revocation at AAI."""
+@instrument("revoke_token")
+async def revoke_token(provider: "Provider", token: str, retry: bool = True) -> None:
+    """Request token revocation at AAI, failed requests are retried unless ``retry`` is False.
+
+    Server errors of the AAI are raised as 502, and tokens rejected by the AAI as 400.
+    """
     LOG.debug("Revoking token.")
 
-    auth = aiohttp.BasicAuth(login=CONFIG.aai["client_id"], password=CONFIG.aai["client_secret"])
+    # Set up client authentication for request
+    auth = aiohttp.BasicAuth(login=provider.aai["client_id"], password=provider.aai["client_secret"])
     params = {"token": token}
 
-    # Set up client authentication for request
-    async with aiohttp.ClientSession(auth=auth) as session:
-        # Send request to AAI
-        async with session.get(f"{CONFIG.aai['url_revoke']}?{urllib.parse.urlencode(params)}") as response:
-            LOG.debug(f"AAI response status: {response.status}.")
-            # Validate response from AAI
-            if response.status != 200:
-                LOG.error(f"Logout failed at AAI: {response}.")
-                LOG.error(await response.json())
-                raise web.HTTPBadRequest(text=f"Logout failed at AAI: {response.status}.")
+    # Send request to AAI
+    async with AAIRequest(provider, "GET", f"{provider.aai['url_revoke']}?{urllib.parse.urlencode(params)}", idempotent=retry, auth=auth) as response:
+        LOG.debug("AAI response status: %s.", response.status)
+        # Validate response from AAI
+        if response.status != 200:
+            LOG.error("Logout failed at AAI: %s.", response)
+            LOG.error(await response.text())
+            if response.status >= 500:
+                raise web.HTTPBadGateway(text=f"Logout failed at AAI: {response.status}.")
+            raise web.HTTPBadRequest(text=f"Logout failed at AAI: {response.status}.")
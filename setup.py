@@ -14,7 +14,7 @@ setup(
     long_description="",
     packages=["oidc_client", "oidc_client/config", "oidc_client/endpoints", "oidc_client/utils"],
     package_data={"": ["*.ini"]},
-    entry_points={"console_scripts": ["start_oidc_client=oidc_client.app:main"]},
+    entry_points={"console_scripts": ["start_oidc_client=oidc_client.app:main", "revoke_oidc_tokens=oidc_client.revoke:main"]},
     platforms="any",
     classifiers=[  # Optional
         # How mature is this project? Common values are
@@ -30,7 +30,7 @@ setup(
         "License :: OSI Approved :: Apache Software License",
         "Programming Language :: Python :: 3.6",
     ],
-    install_requires=["aiohttp", "gunicorn", "uvloop", "authlib", "aiocache"],
+    install_requires=["aiohttp", "gunicorn", "uvloop", "authlib", "aiocache", "contextvars; python_version < '3.7'"],
     extras_require={
         "test": [
             "coverage==5.5",
@@ -45,5 +45,7 @@ setup(
             "aioresponses",
         ],
         "docs": ["sphinx >= 1.4", "sphinx_rtd_theme"],
+        "redis": ["redis>=4.2"],
+        "shared_cache": ["aiocache[redis]"],
     },
 )
@@ -0,0 +1,6 @@
+"""Helpers shared by tests."""
+
+
+def value(metric):
+    """Return the current value of a metric in this worker."""
+    return metric.registry.values[metric.offset]
@@ -0,0 +1,69 @@
+import io
+import asynctest
+
+from unittest import mock
+from contextlib import redirect_stdout
+
+from benchmarks.flow import benchmark, percentile, report
+from benchmarks import login, signature, startup, validation
+from oidc_client.config import CONFIG
+
+
+class TestFlowBenchmark(asynctest.TestCase):
+    """Test login flow benchmark against the mock AAI server."""
+
+    async def test_benchmark(self):
+        """Test that complete login flows pass against the mock AAI server."""
+        with mock.patch.dict(CONFIG.aai), mock.patch.dict(CONFIG.cookie):
+            results = await benchmark(flows=3, concurrency=2)
+        self.assertEqual(dict(results.errors), {})
+        for endpoint in ("/login", "/callback", "/token", "/logout"):
+            self.assertEqual(len(results.latencies[endpoint]), 3)
+        table = report(results)
+        self.assertIn("/callback", table)
+        self.assertIn("total", table)
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+
+
+class TestMicrobenchmarks(asynctest.TestCase):
+    """Test microbenchmarks of single operations."""
+
+    def test_login(self):
+        """Test login redirect microbenchmark."""
+        output = io.StringIO()
+        with redirect_stdout(output):
+            login.main(["--number", "10", "--repeat", "1"])
+        self.assertIn("precomputed", output.getvalue())
+
+    def test_validation(self):
+        """Test token validation microbenchmark."""
+        output = io.StringIO()
+        with mock.patch.dict(CONFIG.aai), redirect_stdout(output):
+            validation.main(["--number", "10", "--repeat", "1", "--issuers", "3"])
+        self.assertIn("claims only", output.getvalue())
+
+    def test_signature(self):
+        """Test signature verification microbenchmark."""
+        output = io.StringIO()
+        with redirect_stdout(output):
+            signature.main(["--number", "10", "--repeat", "1"])
+        for alg in ("RS256", "ES256", "EdDSA"):
+            self.assertIn(alg, output.getvalue())
+
+    def test_startup(self):
+        """Test cold start benchmark."""
+        output = io.StringIO()
+        with redirect_stdout(output):
+            startup.main(["--runs", "1"])
+        self.assertIn("first_response", output.getvalue())
+        self.assertIn("authlib.jose", output.getvalue())
+
+
+if __name__ == "__main__":
+    asynctest.main()
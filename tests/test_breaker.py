@@ -0,0 +1,63 @@
+import asynctest
+
+from unittest import mock
+
+from oidc_client.utils.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from oidc_client.utils.metrics import AAI_CIRCUIT_OPEN, AAI_CIRCUIT_OPENED
+from tests.helpers import value
+
+
+class TestCircuitBreaker(asynctest.TestCase):
+    """Test circuit breaker for AAI requests."""
+
+    def setUp(self):
+        """Initialise a closed circuit at a fixed time."""
+        self.breaker = CircuitBreaker(threshold=3, reset_timeout=30)
+        self.clock = mock.patch("oidc_client.utils.breaker.time.monotonic", return_value=1000.0)
+        self.now = self.clock.start()
+
+    def tearDown(self):
+        """Restore clock."""
+        self.clock.stop()
+
+    def test_open(self):
+        """Test that the circuit opens after consecutive failures."""
+        opened = value(AAI_CIRCUIT_OPENED)
+        self.breaker.failure()
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(value(AAI_CIRCUIT_OPEN), 1)
+        self.assertEqual(value(AAI_CIRCUIT_OPENED), opened + 1)
+        self.now.return_value = 1020.5
+        self.assertEqual(self.breaker.retry_after(), 10)
+
+    def test_half_open(self):
+        """Test that a single probe is let through after reset timeout."""
+        for _ in range(3):
+            self.breaker.failure()
+        # Test failed probe opens the circuit again
+        self.now.return_value = 1030.0
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        # Test successful probe closes the circuit
+        self.now.return_value = 1060.0
+        self.assertTrue(self.breaker.allow())
+        self.breaker.success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(value(AAI_CIRCUIT_OPEN), 0)
+
+
+if __name__ == "__main__":
+    asynctest.main()
@@ -0,0 +1,107 @@
+import unittest
+
+import asynctest
+
+from unittest import mock
+
+from aiohttp import web
+
+from oidc_client.config import CONFIG
+from oidc_client.utils.cache import LRUCache, SharedCache, create_shared_cache, close_shared_cache
+from oidc_client.utils.metrics import SHARED_CACHE_HITS, SHARED_CACHE_MISSES, SHARED_CACHE_ERRORS
+from tests.helpers import value
+
+
+class TestLRUCache(unittest.TestCase):
+    """Test in-process cache."""
+
+    def test_get_set(self):
+        """Test storing and reading values."""
+        cache = LRUCache()
+        cache.set("key", "value", 10)
+        self.assertEqual(cache.get("key"), "value")
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(cache.get("missing", "default"), "default")
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        # Values without lifetime left are not stored
+        cache.set("expired", "value", 0)
+        self.assertEqual(len(cache), 1)
+        # Test removing values
+        cache.delete("key")
+        cache.delete("missing")
+        self.assertIsNone(cache.get("key"))
+        cache.set("key", "value", 10)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    @mock.patch("oidc_client.utils.cache.time.monotonic")
+    def test_expiry(self, m_time):
+        """Test that values expire after their lifetime."""
+        m_time.return_value = 100
+        cache = LRUCache()
+        cache.set("short", "value", 1)
+        cache.set("long", "value", 60)
+        m_time.return_value = 101
+        self.assertIsNone(cache.get("short"))
+        self.assertEqual(cache.get("long"), "value")
+        self.assertEqual(len(cache), 1)
+
+    def test_eviction(self):
+        """Test that the least recently used value is evicted when full."""
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1, 10)
+        cache.set("b", 2, 10)
+        cache.get("a")
+        cache.set("c", 3, 10)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+
+class TestSharedCache(asynctest.TestCase):
+    """Test cache shared by all workers."""
+
+    async def setUp(self):
+        """Initialise shared cache in memory."""
+        with mock.patch.dict(CONFIG.cache, {"shared_cache_url": "memory://"}):
+            self.shared = create_shared_cache()
+        self.app = web.Application()
+        self.app["shared_cache"] = self.shared
+
+    async def tearDown(self):
+        """Close shared cache."""
+        await self.shared.cache.clear()
+        await close_shared_cache(self.app)
+
+    async def test_get_set(self):
+        """Test storing and reading values as JSON."""
+        hits, misses = value(SHARED_CACHE_HITS), value(SHARED_CACHE_MISSES)
+        await self.shared.set("key", {"claims": ["a", "b"]}, 10)
+        self.assertEqual(await self.shared.get("key"), {"claims": ["a", "b"]})
+        self.assertIsNone(await self.shared.get("missing"))
+        self.assertEqual((value(SHARED_CACHE_HITS), value(SHARED_CACHE_MISSES)), (hits + 1, misses + 1))
+        # Values with less than a second of lifetime left are not stored
+        await self.shared.set("expired", "value", 0.5)
+        self.assertIsNone(await self.shared.get("expired"))
+
+    async def test_unavailable(self):
+        """Test that failures of the store are treated as misses."""
+        errors = value(SHARED_CACHE_ERRORS)
+        cache = asynctest.MagicMock(get=asynctest.CoroutineMock(side_effect=ConnectionRefusedError), set=asynctest.CoroutineMock(side_effect=TimeoutError))
+        shared = SharedCache(cache)
+        self.assertIsNone(await shared.get("key"))
+        await shared.set("key", "value", 10)
+        self.assertEqual(value(SHARED_CACHE_ERRORS), errors + 2)
+
+    def test_create_shared_cache(self):
+        """Test that the shared cache is optional, and must be of a known type."""
+        self.assertEqual(self.shared.cache.namespace, "oidc_client:")
+        self.assertEqual(self.shared.cache.timeout, CONFIG.cache["shared_cache_timeout"])
+        self.assertIsNone(create_shared_cache())
+        with mock.patch.dict(CONFIG.cache, {"shared_cache_url": "unknown://localhost"}):
+            with self.assertRaises(RuntimeError):
+                create_shared_cache()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+from unittest import mock
+
+from authlib.jose import JWTClaims
+from authlib.jose.errors import InvalidClaimError, MissingClaimError, ExpiredTokenError
+
+from oidc_client.config import CONFIG
+from oidc_client.utils.claims import ClaimsValidator, split_values, access_token_validator, id_token_validator
+
+
+def claims(validator, **payload):
+    """Create claims of a decoded token, as jwt.decode does."""
+    payload = dict({"iss": "https://aai.example.org/", "aud": "audience1", "iat": 1000, "exp": 2000}, **payload)
+    return JWTClaims(payload, {}, options=validator.options)
+
+
+class TestClaimsValidator(unittest.TestCase):
+    """Test validator of token claims."""
+
+    def setUp(self):
+        """Initialise validator at a fixed time."""
+        self.validator = ClaimsValidator(["https://aai.example.org/"], ["audience1", "audience2"], leeway=10, required=["sub"])
+        self.clock = mock.patch("authlib.jose.rfc7519.claims.time.time", return_value=1500)
+        self.clock.start()
+
+    def tearDown(self):
+        """Restore clock."""
+        self.clock.stop()
+
+    def test_split_values(self):
+        """Test splitting of comma separated configuration values."""
+        self.assertEqual(split_values("a, b,,c"), ("a", "b", "c"))
+        self.assertEqual(split_values(None), ())
+
+    def test_validate(self):
+        """Test that trusted issuers and audiences are accepted."""
+        self.validator.validate(claims(self.validator, sub="user"))
+        self.validator.validate(claims(self.validator, sub="user", aud=["other", "audience2"]))
+
+    def test_invalid(self):
+        """Test that untrusted issuers and audiences are rejected."""
+        for payload in ({"iss": "https://evil.example.org/"}, {"iss": ["https://aai.example.org/"]}, {"aud": "other"}, {"aud": ["other"]}):
+            with self.assertRaises(InvalidClaimError):
+                self.validator.validate(claims(self.validator, sub="user", **payload))
+
+    def test_malformed_audience(self):
+        """Test that audiences, that are not strings, are rejected as invalid claims."""
+        for audience in (1, [{"aud": "audience1"}], ["audience1", 1], {"audience1": True}):
+            with self.assertRaises(InvalidClaimError):
+                self.validator.validate(claims(self.validator, sub="user", aud=audience))
+
+    def test_required(self):
+        """Test that extra required claims must exist."""
+        with self.assertRaises(MissingClaimError):
+            self.validator.validate(claims(self.validator))
+
+    def test_leeway(self):
+        """Test that expiry is allowed within the leeway."""
+        self.validator.validate(claims(self.validator, sub="user", exp=1495))
+        with self.assertRaises(ExpiredTokenError):
+            self.validator.validate(claims(self.validator, sub="user", exp=1485))
+
+    def test_from_config(self):
+        """Test validators built from configuration."""
+        validator = access_token_validator(dict(CONFIG.aai, required_claims="sub,ga4gh_passport_v1", token_leeway=5))
+        self.assertEqual(validator.issuers, frozenset(CONFIG.aai["iss"].split(",")))
+        self.assertEqual(validator.audiences, frozenset(CONFIG.aai["aud"].split(",")))
+        self.assertEqual(validator.leeway, 5)
+        self.assertIn("ga4gh_passport_v1", validator.options)
+        validator = id_token_validator(CONFIG.aai)
+        self.assertEqual(validator.audiences, frozenset([CONFIG.aai["client_id"]]))
+        self.assertIn("nonce", validator.options)
+
+
+if __name__ == "__main__":
+    unittest.main()
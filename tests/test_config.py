@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from oidc_client.config import LazyConfig, parse_config_file
+
+CONFIG_FILE = Path(__file__).resolve().parent.parent.joinpath("oidc_client", "config", "config.ini")
+
+# Configuration file of the first release, before further sections and variables were added
+OLD_CONFIG = """
+[app]
+host=0.0.0.0
+port=8080
+name=oidc-client
+session_key=
+
+[cookie]
+domain=localhost:8080
+token_lifetime=3600
+state_lifetime=300
+secure=True
+http_only=True
+
+[aai]
+client_id=public
+client_secret=secret
+url_auth=https://login.elixir-czech.org/oidc/authorize
+url_token=https://login.elixir-czech.org/oidc/token
+url_userinfo=https://login.elixir-czech.org/oidc/userinfo
+url_callback=localhost:8080/callback
+url_redirect=localhost:5000
+url_revoke=https://login.elixir-czech.org/oidc/revoke
+scope=openid,ga4gh_passport_v1
+iss=https://login.elixir-czech.org/oidc/
+aud=audience1,audience2
+jwk_server=https://login.elixir-czech.org/oidc/jwk
+"""
+
+
+class TestConfig(unittest.TestCase):
+    """Test configuration parsing."""
+
+    def test_lazy_config(self):
+        """Test that the configuration file is parsed on first use only."""
+        config = LazyConfig()
+        with mock.patch.dict(os.environ, {"CONFIG_FILE": str(CONFIG_FILE)}):
+            with mock.patch("oidc_client.config.parse_config_file", wraps=parse_config_file) as m_parse:
+                self.assertIsNone(config._config)
+                self.assertEqual(config.app["session_backend"], "cookie")
+                self.assertIs(config.cookie, config._config.cookie)
+        m_parse.assert_called_once_with(str(CONFIG_FILE))
+
+    def test_parse_old_config(self):
+        """Test that configuration files without the sections and variables added later get the shipped defaults."""
+        with tempfile.NamedTemporaryFile("w", suffix=".ini") as config_file:
+            config_file.write(OLD_CONFIG)
+            config_file.flush()
+            config = parse_config_file(config_file.name)
+        shipped = parse_config_file(CONFIG_FILE)
+        for section in shipped._fields:
+            expected = getattr(shipped, section)
+            if section == "app":
+                expected = dict(expected, session_key=config.app["session_key"])
+            if section == "providers":
+                expected = {name: provider for name, provider in expected.items() if name == "default"}
+            self.assertEqual(getattr(config, section), expected, section)
+
+
+if __name__ == "__main__":
+    unittest.main()
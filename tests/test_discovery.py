@@ -0,0 +1,117 @@
+import asyncio
+
+import asynctest
+
+from unittest import mock
+
+from aiohttp import web
+
+from oidc_client.app import init
+from oidc_client.config import CONFIG, DEFAULT_PROVIDER
+from oidc_client.utils.discovery import Discovery
+from oidc_client.utils.providers import Provider, start_providers, close_providers
+from oidc_client.utils.utils import create_client_session
+
+METADATA = {
+    "issuer": "https://aai.example.org/",
+    "authorization_endpoint": "https://aai.example.org/authorize",
+    "token_endpoint": "https://aai.example.org/token",
+    "userinfo_endpoint": "https://aai.example.org/userinfo",
+    "revocation_endpoint": "https://aai.example.org/revoke",
+    "jwks_uri": "https://aai.example.org/jwk",
+}
+
+
+async def slow_discovery(provider, url):
+    """Return discovery document after a delay."""
+    await asyncio.sleep(1)
+    return METADATA, None
+
+
+class TestDiscovery(asynctest.TestCase):
+    """Test OpenID Connect discovery."""
+
+    async def setUp(self):
+        """Initialise provider with discovery, and protect configuration from changes."""
+        self.config = mock.patch.dict(
+            CONFIG.aai,
+            {"url_discovery": "https://aai.example.org/.well-known/openid-configuration", "iss": "https://aai.example.org/", "discovery_timeout": 0.01},
+        )
+        self.config.start()
+        self.provider = Provider(DEFAULT_PROVIDER, CONFIG.aai, await create_client_session())
+
+    async def tearDown(self):
+        """Stop discovery and restore configuration."""
+        await self.provider.close()
+        self.config.stop()
+
+    @asynctest.mock.patch("oidc_client.utils.discovery.get_discovery")
+    async def test_load(self, m_discovery):
+        """Test that endpoints are updated from discovery document."""
+        m_discovery.return_value = (METADATA, None)
+        discovery = self.provider.discovery
+        with asynctest.mock.patch.object(discovery, "_schedule") as m_schedule:
+            await self.provider.start()
+        self.assertEqual(CONFIG.aai["url_auth"], "https://aai.example.org/authorize")
+        self.assertEqual(CONFIG.aai["url_token"], "https://aai.example.org/token")
+        self.assertEqual(CONFIG.aai["url_userinfo"], "https://aai.example.org/userinfo")
+        self.assertEqual(CONFIG.aai["url_revoke"], "https://aai.example.org/revoke")
+        self.assertEqual(CONFIG.aai["jwk_server"], "https://aai.example.org/jwk")
+        self.assertEqual(discovery.metadata, METADATA)
+        # Test default lifetime, lifetime from Cache-Control, and shortest lifetime
+        m_schedule.assert_called_once_with(3600)
+        for lifetime, delay in ((600, 600), (0, 60)):
+            m_discovery.return_value = ({"issuer": "https://aai.example.org/", "token_endpoint": "https://aai.example.org/token2"}, lifetime)
+            with asynctest.mock.patch.object(discovery, "_schedule") as m_schedule:
+                await discovery.load()
+            m_schedule.assert_called_once_with(delay)
+        # Test that endpoints missing from the document are kept
+        self.assertEqual(CONFIG.aai["url_token"], "https://aai.example.org/token2")
+        self.assertEqual(CONFIG.aai["url_auth"], "https://aai.example.org/authorize")
+
+    @asynctest.mock.patch("oidc_client.utils.discovery.get_discovery")
+    async def test_load_failed(self, m_discovery):
+        """Test that current endpoints are kept while AAI is unavailable."""
+        url_token = CONFIG.aai["url_token"]
+        discovery = self.provider.discovery
+        self.assertEqual(discovery.timeout, 0.01)
+        for side_effect in (web.HTTPInternalServerError(text="Could not retrieve discovery document."), slow_discovery):
+            m_discovery.side_effect = side_effect
+            with asynctest.mock.patch.object(discovery, "_schedule") as m_schedule:
+                await discovery.load()
+            m_schedule.assert_called_once_with(60)
+        self.assertEqual(CONFIG.aai["url_token"], url_token)
+
+    @asynctest.mock.patch("oidc_client.utils.discovery.get_discovery")
+    async def test_load_untrusted_issuer(self, m_discovery):
+        """Test that a discovery document of an untrusted issuer is rejected."""
+        url_token = CONFIG.aai["url_token"]
+        discovery = self.provider.discovery
+        for issuer in ("https://evil.example.org/", None):
+            m_discovery.return_value = (dict(METADATA, issuer=issuer), None)
+            with asynctest.mock.patch.object(discovery, "_schedule") as m_schedule:
+                await discovery.load()
+            m_schedule.assert_called_once_with(60)
+        self.assertEqual(CONFIG.aai["url_token"], url_token)
+        self.assertEqual(discovery.metadata, {})
+
+    @asynctest.mock.patch("oidc_client.utils.discovery.get_discovery", return_value=(METADATA, None))
+    async def test_refresh(self, m_discovery):
+        """Test that discovery document is refreshed in the background."""
+        discovery = self.provider.discovery
+        discovery._schedule(0)
+        await asyncio.sleep(0.01)
+        m_discovery.assert_called_once()
+        self.assertEqual(discovery.metadata, METADATA)
+
+    async def test_init(self):
+        """Test that web server uses discovery when configured."""
+        with mock.patch.dict(CONFIG.aai, {"url_discovery": "https://aai.example.org/.well-known/openid-configuration"}):
+            server = await init()
+        await close_providers(server)
+        self.assertIsInstance(server["provider"].discovery, Discovery)
+        self.assertIn(start_providers, server.on_startup)
+
+
+if __name__ == "__main__":
+    asynctest.main()
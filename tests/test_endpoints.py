@@ -1,11 +1,19 @@
 import asynctest
 
+from urllib.parse import urlsplit, parse_qs
+from unittest import mock
+
 from aiohttp import web
 
-from oidc_client.endpoints.login import login_request
+from oidc_client.config import CONFIG, DEFAULT_PROVIDER
+
+from oidc_client.endpoints.login import login_request, authorisation_url, AUTHORISATION_URLS
 from oidc_client.endpoints.logout import logout_request
 from oidc_client.endpoints.callback import callback_request
 from oidc_client.endpoints.token import token_request
+from oidc_client.endpoints.introspect import introspect_request
+from oidc_client.endpoints.refresh import refresh_request
+from oidc_client.endpoints.userinfo import userinfo_request
 
 from oidc_client.utils.utils import save_to_cookies
 
@@ -22,12 +30,25 @@ class MockResponse:
         self.cookies.update({key: value, "domain": domain, "max_age": max_age, "secure": secure, "httponly": httponly})
 
 
+class MockProvider:
+    """Mocked AAI provider class for testing."""
+
+    def __init__(self, name=DEFAULT_PROVIDER):
+        """Initialise object."""
+        self.name = name
+        self.aai = CONFIG.aai
+
+
+PROVIDER = MockProvider()
+
+
 class MockRequest:
     """Mocked request class for testing."""
 
     def __init__(self, query):
         """Initialise object."""
         self.query = query
+        self.app = {"providers": {DEFAULT_PROVIDER: PROVIDER}}
 
     def get(self, key):
         """For session key."""
@@ -56,41 +77,154 @@ class TestEndpoints(asynctest.TestCase):
             mock_request = MockRequest(query={})
             await login_request(mock_request)
 
-    @asynctest.mock.patch("oidc_client.endpoints.logout.revoke_token")
+    @asynctest.mock.patch("oidc_client.endpoints.login.save_to_session")
+    @asynctest.mock.patch("oidc_client.endpoints.login.generate_state", return_value="5000")
+    async def test_login_url(self, m_state, m_save):
+        """Test authorisation URL crafted at login."""
+        with self.assertRaises(web.HTTPSeeOther) as redirect:
+            await login_request(MockRequest(query={}))
+        url = urlsplit(redirect.exception.location)
+        params = parse_qs(url.query)
+        self.assertEqual(f"{url.scheme}://{url.netloc}{url.path}", CONFIG.aai["url_auth"])
+        self.assertEqual(params["state"], ["5000"])
+        self.assertEqual(params["nonce"], ["5000"])
+        self.assertEqual(params["code_challenge_method"], ["S256"])
+        self.assertEqual(len(params["code_challenge"][0]), 43)
+        saved = {call[1]["key"]: call[1]["value"] for call in m_save.call_args_list}
+        self.assertEqual(sorted(saved), ["oidc_code_verifier", "oidc_nonce", "oidc_provider", "oidc_state"])
+        self.assertEqual(params["response_type"], ["code"])
+        self.assertEqual(params["scope"], [" ".join(CONFIG.aai["scope"].split(","))])
+        # Test that a changed authorisation endpoint is used, e.g. after discovery
+        with mock.patch.dict(CONFIG.aai, {"url_auth": "https://aai.example.org/authorize"}):
+            with self.assertRaises(web.HTTPSeeOther) as redirect:
+                await login_request(MockRequest(query={}))
+        self.assertTrue(redirect.exception.location.startswith("https://aai.example.org/authorize?"))
+
+    @asynctest.mock.patch("oidc_client.endpoints.login.save_to_session")
+    async def test_login_provider(self, m_save):
+        """Test login at a chosen provider."""
+        request = MockRequest(query={"provider": "other"})
+        request.app["providers"]["other"] = MockProvider("other")
+        with self.assertRaises(web.HTTPSeeOther):
+            await login_request(request)
+        m_save.assert_any_call(request, key="oidc_provider", value="other")
+        # Test that an unknown provider is a bad request
+        with self.assertRaises(web.HTTPBadRequest):
+            await login_request(MockRequest(query={"provider": "unknown"}))
+
+    @asynctest.mock.patch("oidc_client.endpoints.login.save_to_session")
+    async def test_login_url_per_provider(self, m_save):
+        """Test that the authorisation URL of each provider is built once, when logins alternate between providers."""
+        other = MockProvider("other")
+        other.aai = dict(CONFIG.aai, url_auth="https://aai.example.org/authorize")
+        request = MockRequest(query={})
+        request.app["providers"]["other"] = other
+        AUTHORISATION_URLS.clear()
+        with mock.patch("oidc_client.endpoints.login.authorisation_url", wraps=authorisation_url) as m_url:
+            for name in ("other", DEFAULT_PROVIDER) * 3:
+                request.query = {"provider": name}
+                with self.assertRaises(web.HTTPSeeOther) as redirect:
+                    await login_request(request)
+                self.assertTrue(redirect.exception.location.startswith(f"{request.app['providers'][name].aai['url_auth']}?"))
+        self.assertEqual(m_url.call_count, 2)
+        self.assertEqual(sorted(AUTHORISATION_URLS), [DEFAULT_PROVIDER, "other"])
+
+    @asynctest.mock.patch("oidc_client.endpoints.logout.session_provider", return_value=PROVIDER)
+    @asynctest.mock.patch("oidc_client.endpoints.logout.pop_from_session")
     @asynctest.mock.patch("oidc_client.endpoints.logout.get_from_cookies")
-    async def test_logout_endpoint(self, m_cookies, m_rtoken):
+    async def test_logout_endpoint(self, m_cookies, m_pop, m_provider):
         """Test logout endpoint processor."""
         m_cookies.return_value = "token"
-        m_rtoken.return_value = True
-        # Test that logout redirects user
+        m_pop.return_value = None
+        request = MockRequest(query={})
+        request.app["revocation_queue"] = asynctest.MagicMock()
+        # Test that logout redirects user, and queues token for revocation
         with self.assertRaises(web.HTTPSeeOther):
-            await logout_request({})
+            await logout_request(request)
+        request.app["revocation_queue"].submit.assert_called_once_with("token", PROVIDER)
+        m_pop.assert_has_calls([mock.call(request, "access_token"), mock.call(request, "refresh_token")])
+        # Test that renewed access token and refresh token of the session are revoked too
+        request.app["revocation_queue"].submit.reset_mock()
+        m_pop.side_effect = ["renewed", "refresh"]
+        with self.assertRaises(web.HTTPSeeOther):
+            await logout_request(request)
+        request.app["revocation_queue"].submit.assert_has_calls([mock.call("token", PROVIDER), mock.call("renewed", PROVIDER), mock.call("refresh", PROVIDER)])
+        # Test that the access token of the cookie is revoked once
+        request.app["revocation_queue"].submit.reset_mock()
+        m_pop.side_effect = ["token", None]
+        with self.assertRaises(web.HTTPSeeOther):
+            await logout_request(request)
+        request.app["revocation_queue"].submit.assert_called_once_with("token", PROVIDER)
 
-    @asynctest.mock.patch("oidc_client.endpoints.callback.save_to_session")
+    @asynctest.mock.patch("oidc_client.endpoints.callback.regenerate_session")
+    @asynctest.mock.patch("oidc_client.endpoints.callback.session_provider", return_value=PROVIDER)
+    @asynctest.mock.patch("oidc_client.endpoints.callback.save_tokens")
+    @asynctest.mock.patch("oidc_client.endpoints.callback.pop_from_session")
     @asynctest.mock.patch("oidc_client.endpoints.callback.get_from_session")
+    @asynctest.mock.patch("oidc_client.endpoints.callback.validate_id_token")
     @asynctest.mock.patch("oidc_client.endpoints.callback.validate_token")
     @asynctest.mock.patch("oidc_client.endpoints.callback.request_token")
-    async def test_callback_endpoint(self, m_token, m_valid, m_session, m_save):
+    async def test_callback_endpoint(self, m_token, m_valid, m_valid_id, m_session, m_pop, m_save, m_provider, m_regenerate):
         """Test callback endpoint processor."""
         # Test bad request: request doesn't pass state validation
         m_session.return_value = 5000
         bad_request = MockRequest(query={"state": 9999, "code": "malicious bunnies"})
         with self.assertRaises(web.HTTPForbidden):
             await callback_request(bad_request)
-        # Test good request: request passes state validation and does a redirect
-        m_session.return_value = 5000
+        # Test bad request: session has no nonce and code verifier
+        m_pop.return_value = None
         good_request = MockRequest(query={"state": 5000, "code": "fluffy bunnies"})
-        m_valid.return_value = True
+        with self.assertRaises(web.HTTPForbidden):
+            await callback_request(good_request)
+        m_token.assert_not_called()
+        # Test good request: request passes state validation and does a redirect
+        m_pop.side_effect = ["nonce", "verifier"]
+        m_valid.return_value = {"exp": 9999999999}
         m_save.return_value = None
-        m_token.return_value = "super.secret.token"
+        m_token.return_value = {"access_token": "super.secret.token", "refresh_token": "refresh"}
+        with mock.patch.dict(CONFIG.aai, {"scope": "ga4gh_passport_v1"}):
+            with self.assertRaises(web.HTTPSeeOther):
+                await callback_request(good_request)
+        m_token.assert_called_once_with(PROVIDER, "fluffy bunnies", "verifier")
+        m_save.assert_called_once_with(good_request, m_token.return_value, m_valid.return_value)
+        m_regenerate.assert_called_once_with(good_request)
+        m_valid_id.assert_not_called()
+        # Test that logins requesting the openid scope must receive an ID token
+        m_pop.side_effect = ["nonce", "verifier"]
+        with self.assertRaises(web.HTTPForbidden):
+            await callback_request(good_request)
+        m_save.assert_called_once()
+        # Test that the ID token is validated against the nonce of the login
+        m_pop.side_effect = ["nonce", "verifier"]
+        m_token.return_value = {"access_token": "super.secret.token", "id_token": "id.token"}
         with self.assertRaises(web.HTTPSeeOther):
             await callback_request(good_request)
+        m_valid_id.assert_called_once_with(PROVIDER, "id.token", "nonce")
         # Test that access token is saved
         mock_response = MockResponse()
         expected_cookies = {"access_token": "super.secret.token", "domain": "localhost:8080", "httponly": True, "max_age": 3600, "secure": True}
-        m_response_with_cookies = await save_to_cookies(mock_response, key="access_token", value=await m_token(), lifetime=3600, http_only=True)
+        access_token = (await m_token())["access_token"]
+        m_response_with_cookies = await save_to_cookies(mock_response, key="access_token", value=access_token, lifetime=3600, http_only=True)
         assert m_response_with_cookies.cookies == expected_cookies
 
+    @asynctest.mock.patch("oidc_client.endpoints.refresh.session_provider", return_value=PROVIDER)
+    @asynctest.mock.patch("oidc_client.endpoints.refresh.save_tokens")
+    @asynctest.mock.patch("oidc_client.endpoints.refresh.get_from_session")
+    @asynctest.mock.patch("oidc_client.endpoints.refresh.validate_token")
+    @asynctest.mock.patch("oidc_client.endpoints.refresh.refresh_access_token")
+    async def test_refresh_endpoint(self, m_refresh, m_valid, m_session, m_save, m_provider):
+        """Test refresh endpoint processor."""
+        m_session.return_value = "refresh"
+        m_refresh.return_value = {"access_token": "new.secret.token"}
+        m_valid.return_value = {"exp": 9999999999}
+        request = MockRequest(query={})
+        # Test that the new access token is saved and user is redirected
+        with self.assertRaises(web.HTTPSeeOther) as redirect:
+            await refresh_request(request)
+        m_refresh.assert_called_once_with(PROVIDER, "refresh")
+        m_save.assert_called_once_with(request, {"access_token": "new.secret.token"}, {"exp": 9999999999})
+        self.assertEqual(redirect.exception.cookies["access_token"].value, "new.secret.token")
+
     @asynctest.mock.patch("oidc_client.endpoints.token.get_from_session")
     async def test_token_endpoint(self, m_session):
         """Test token endpoint processor."""
@@ -99,6 +233,32 @@ class TestEndpoints(asynctest.TestCase):
         token = await token_request(mock_request)
         self.assertEqual(token, "token")
 
+    @asynctest.mock.patch("oidc_client.endpoints.userinfo.get_userinfo")
+    @asynctest.mock.patch("oidc_client.endpoints.userinfo.get_from_session")
+    async def test_userinfo_endpoint(self, m_session, m_userinfo):
+        """Test userinfo endpoint processor."""
+        m_session.return_value = "token"
+        m_userinfo.return_value = {"sub": "smth@elixir-europe.org"}
+        mock_request = MockRequest(query={})
+        userinfo = await userinfo_request(mock_request)
+        self.assertEqual(userinfo, {"sub": "smth@elixir-europe.org"})
+        m_userinfo.assert_called_once_with(mock_request.app, "token")
+
+    @asynctest.mock.patch("oidc_client.endpoints.introspect.introspect_token")
+    @asynctest.mock.patch("oidc_client.endpoints.introspect.introspection_params")
+    @asynctest.mock.patch("oidc_client.endpoints.introspect.check_introspection")
+    async def test_introspect_endpoint(self, m_check, m_params, m_introspect):
+        """Test introspection endpoint processor."""
+        m_introspect.side_effect = lambda app, token: {"active": token == "good"}
+        mock_request = MockRequest(query={})
+        # Test single token
+        m_params.return_value = (["good"], False)
+        self.assertEqual(await introspect_request(mock_request), {"active": True})
+        # Test batch of tokens, results are in the same order
+        m_params.return_value = (["good", "bad", "good"], True)
+        self.assertEqual(await introspect_request(mock_request), [{"active": True}, {"active": False}, {"active": True}])
+        m_check.assert_called_with(mock_request)
+
 
 if __name__ == "__main__":
     asynctest.main()
@@ -0,0 +1,208 @@
+import time
+import asyncio
+
+import asynctest
+
+from aiohttp import web
+
+from oidc_client.config import CONFIG
+from oidc_client.utils.cache import create_shared_cache
+from oidc_client.utils.jwks import KeyCache, import_keys
+
+KEY = {"kty": "oct", "kid": "key1", "use": "sig", "alg": "HS256", "k": "hJtXIZ2uSN5kbQfbtTNWbpdmhkV8FJG-Onbc6mxCcYg"}
+ROTATED_KEY = {"kty": "oct", "kid": "key2", "use": "sig", "alg": "HS256", "k": "YW5vdGhlciBrZXk"}
+
+
+async def slow_jwk(provider):
+    """Return JWK after a delay."""
+    await asyncio.sleep(0.01)
+    return {"keys": [KEY]}
+
+
+class TestKeyCache(asynctest.TestCase):
+    """Test JSON Web Key cache."""
+
+    def setUp(self):
+        """Initialise a key cache of a provider."""
+        self.provider = asynctest.MagicMock()
+        self.jwks = KeyCache(self.provider)
+
+    async def tearDown(self):
+        """Stop key cache."""
+        await self.jwks.close()
+
+    def test_import_keys(self):
+        """Test importing and indexing keys."""
+        # Test single key, which can also be used for tokens without a key ID
+        keys = import_keys(KEY)
+        self.assertEqual(keys["key1"]["kid"], "key1")
+        self.assertIs(keys[None], keys["key1"])
+        # Test key set and list of keys
+        keys = import_keys({"keys": [KEY, ROTATED_KEY]})
+        self.assertEqual(set(keys), {"key1", "key2"})
+        keys = import_keys([KEY, ROTATED_KEY])
+        self.assertEqual(set(keys), {"key1", "key2"})
+        # Test that keys that can't be imported are skipped
+        keys = import_keys({"keys": [{"kty": "new", "kid": "key3"}, KEY, {"kid": "key4"}]})
+        self.assertEqual(set(keys), {"key1", None})
+        # Test bad key data, and key sets without usable keys
+        for jwk in ("not a key", {"keys": [{"kty": "new", "kid": "key3"}]}, {"keys": []}):
+            with self.assertRaises(web.HTTPInternalServerError):
+                import_keys(jwk)
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_get_key(self, m_jwk):
+        """Test key lookup, keys are fetched once and then served from cache."""
+        m_jwk.return_value = {"keys": [KEY]}
+        cache = self.jwks
+        key = await cache.get_key("key1")
+        self.assertEqual(key["kid"], "key1")
+        self.assertIs(await cache.get_key("key1"), key)
+        m_jwk.assert_called_once()
+        # Test refetch after expiry
+        cache.expires -= cache.lifetime
+        cache.attempted -= cache.lifetime
+        await cache.get_key("key1")
+        self.assertEqual(m_jwk.call_count, 2)
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_get_verifier(self, m_jwk):
+        """Test that verifiers are created once per imported key."""
+        m_jwk.return_value = {"keys": [KEY]}
+        cache = self.jwks
+        verifier = await cache.get_verifier("key1")
+        self.assertIs(verifier.key, await cache.get_key("key1"))
+        self.assertIs(await cache.get_verifier("key1"), verifier)
+        # Test that refetched keys get new verifiers
+        cache.expires -= cache.lifetime
+        cache.attempted -= cache.lifetime
+        self.assertIsNot(await cache.get_verifier("key1"), verifier)
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_get_key_concurrent(self, m_jwk):
+        """Test that concurrent misses share one request to AAI."""
+        m_jwk.side_effect = slow_jwk
+        keys = await asyncio.gather(*[self.jwks.get_key("key1") for _ in range(10)])
+        self.assertEqual(len(keys), 10)
+        m_jwk.assert_called_once()
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_get_key_rotated(self, m_jwk):
+        """Test that an unknown key ID triggers a refetch, limited by cooldown."""
+        m_jwk.return_value = {"keys": [KEY]}
+        cache = self.jwks
+        await cache.get_key("key1")
+        # Unknown key within cooldown is rejected without refetch
+        with self.assertRaises(web.HTTPForbidden):
+            await cache.get_key("key2")
+        m_jwk.assert_called_once()
+        # Unknown key after cooldown is refetched
+        cache.attempted -= cache.cooldown
+        m_jwk.return_value = {"keys": [KEY, ROTATED_KEY]}
+        key = await cache.get_key("key2")
+        self.assertEqual(key["kid"], "key2")
+        self.assertEqual(m_jwk.call_count, 2)
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_get_key_stale(self, m_jwk):
+        """Test that the last known good keys are served while AAI fails."""
+        m_jwk.return_value = {"keys": [KEY]}
+        cache = self.jwks
+        key = await cache.get_key("key1")
+        cache.expires -= cache.lifetime
+        cache.attempted -= cache.lifetime
+        # Failed refresh falls back to cached keys and schedules a retry
+        m_jwk.side_effect = web.HTTPInternalServerError()
+        self.assertIs(await cache.get_key("key1"), key)
+        self.assertEqual(m_jwk.call_count, 2)
+        self.assertIsNotNone(cache._timer)
+        # Further requests within cooldown don't wait for AAI
+        self.assertIs(await cache.get_key("key1"), key)
+        self.assertEqual(m_jwk.call_count, 2)
+        # Keys past maximum staleness are no longer used
+        cache.expires -= cache.max_stale
+        cache.attempted -= cache.cooldown
+        with self.assertRaises(web.HTTPInternalServerError):
+            await cache.get_key("key1")
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_get_key_slow(self, m_jwk):
+        """Test that a slow refresh doesn't hold requests longer than the timeout."""
+        m_jwk.return_value = {"keys": [KEY]}
+        cache = KeyCache(self.provider, timeout=0.001)
+        key = await cache.get_key("key1")
+        cache.expires -= cache.lifetime
+        cache.attempted -= cache.lifetime
+        m_jwk.side_effect = slow_jwk
+        m_jwk.return_value = None
+        self.assertIs(await cache.get_key("key1"), key)
+        # The refresh completes in the background
+        await asyncio.sleep(0.02)
+        self.assertIsNot(cache.keys["key1"], key)
+        self.assertGreater(cache.expires, asyncio.get_event_loop().time())
+        await cache.close()
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_get_key_unavailable(self, m_jwk):
+        """Test that requests fail while there are no keys at all."""
+        m_jwk.side_effect = web.HTTPInternalServerError()
+        with self.assertRaises(web.HTTPInternalServerError):
+            await self.jwks.get_key("key1")
+        self.assertIsNone(self.jwks._timer)
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_background_refresh(self, m_jwk):
+        """Test that keys are refreshed in the background before they expire."""
+        m_jwk.return_value = {"keys": [KEY]}
+        cache = KeyCache(self.provider, lifetime=0.05, refresh=0.04)
+        await cache.get_key("key1")
+        m_jwk.return_value = {"keys": [KEY, ROTATED_KEY]}
+        await asyncio.sleep(0.02)
+        await cache.close()
+        self.assertIn("key2", cache.keys)
+        self.assertEqual(m_jwk.call_count, 2)
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_background_refresh_failed(self, m_jwk):
+        """Test that a failed background refresh keeps the cached keys."""
+        m_jwk.return_value = {"keys": [KEY]}
+        cache = self.jwks
+        await cache.get_key("key1")
+        m_jwk.side_effect = web.HTTPInternalServerError()
+        cache._refresh()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertIn("key1", cache.keys)
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_get_key_shared(self, m_jwk):
+        """Test that keys fetched by one worker are used by the others, unless they need newer keys."""
+        with asynctest.mock.patch.dict(CONFIG.cache, {"shared_cache_url": "memory://"}):
+            shared = create_shared_cache()
+        self.provider.aai = {"jwk_server": "https://aai.example.org/jwk"}
+        first, second = KeyCache(self.provider, shared=shared), KeyCache(self.provider, shared=shared)
+        m_jwk.return_value = {"keys": [KEY]}
+        await first.get_key("key1")
+        self.assertEqual((await second.get_key("key1"))["kid"], "key1")
+        m_jwk.assert_called_once()
+        self.assertEqual(second.fetched, first.fetched)
+        # Test that an unknown key ID is looked up at AAI, and the rotated keys are shared
+        m_jwk.return_value = {"keys": [KEY, ROTATED_KEY]}
+        second.attempted -= second.cooldown
+        await second.get_key("key2")
+        self.assertEqual(m_jwk.call_count, 2)
+        first.attempted -= first.cooldown
+        self.assertEqual((await first.get_key("key2"))["kid"], "key2")
+        self.assertEqual(m_jwk.call_count, 2)
+        # Test that shared keys due for refresh are not used
+        await shared.set("jwks:https://aai.example.org/jwk", {"jwk": [KEY], "fetched": time.time() - first.lifetime}, 60)
+        third = KeyCache(self.provider, shared=shared)
+        self.assertEqual((await third.get_key("key2"))["kid"], "key2")
+        self.assertEqual(m_jwk.call_count, 3)
+        for cache in (first, second, third):
+            await cache.close()
+        await shared.cache.clear()
+
+
+if __name__ == "__main__":
+    asynctest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+from unittest import mock
+
+from authlib.common.encoding import json_dumps, urlsafe_b64encode, to_bytes
+from authlib.jose import JsonWebKey, JsonWebSignature, jwt
+from authlib.jose.errors import BadSignatureError, DecodeError
+
+from oidc_client.utils.jws import Verifier, parse_compact
+
+PAYLOAD = {"iss": "https://aai.example.org/", "sub": "user", "exp": 9999999999}
+
+
+def generate_key(kty, crv_or_size, **options):
+    """Generate a private key, and return it with its public key."""
+    private = JsonWebKey.generate_key(kty, crv_or_size, is_private=True)
+    public = type(private).import_key(private.get_public_key())
+    public.update(options)
+    return private, public
+
+
+def segment(data):
+    """Encode a segment of a compact JWS."""
+    return urlsafe_b64encode(to_bytes(json_dumps(data) if isinstance(data, (dict, list)) else data)).decode()
+
+
+class TestVerifier(unittest.TestCase):
+    """Test JWS signature verification."""
+
+    def test_parse_compact(self):
+        """Test splitting compact JWS."""
+        jws = parse_compact(f"{segment({'alg': 'RS256'})}.{segment(PAYLOAD)}.{segment('sig')}")
+        self.assertEqual(jws.header, {"alg": "RS256"})
+        self.assertEqual(jws.signature, b"sig")
+        self.assertTrue(jws.signing_input.startswith(segment({"alg": "RS256"}).encode()))
+        for token in ("not a token", f"{segment('[]')}.e30.sig", f"{segment({'alg': 'RS256'})}.e30.a.b.c", f"{segment({'alg': 'RS256'})}.e30.a"):
+            self.assertIsNone(parse_compact(token))
+
+    def test_fast_algorithms(self):
+        """Test that RS256, ES256 and EdDSA are verified without authlib, with the same claims."""
+        for alg, kty, crv_or_size in (("RS256", "RSA", 2048), ("ES256", "EC", "P-256"), ("EdDSA", "OKP", "Ed25519")):
+            private, public = generate_key(kty, crv_or_size)
+            token = jwt.encode({"alg": alg, "kid": "key1"}, PAYLOAD, private).decode()
+            verifier = Verifier(public)
+            self.assertEqual(list(verifier.public_keys), [alg])
+            expected = jwt.decode(token, public)
+            with mock.patch("oidc_client.utils.jws.jwt.decode") as m_decode:
+                claims = verifier.decode(token, parse_compact(token), {"exp": {"essential": True}})
+            m_decode.assert_not_called()
+            self.assertEqual(claims, expected)
+            self.assertEqual(claims.header, expected.header)
+            self.assertEqual(claims.options, {"exp": {"essential": True}})
+
+    def test_bad_signature(self):
+        """Test that bad signatures raise the same errors as authlib."""
+        for alg, kty, crv_or_size in (("RS256", "RSA", 2048), ("ES256", "EC", "P-256"), ("EdDSA", "OKP", "Ed25519")):
+            private, public = generate_key(kty, crv_or_size)
+            other, _ = generate_key(kty, crv_or_size)
+            token = jwt.encode({"alg": alg}, PAYLOAD, other).decode()
+            short = token.rsplit(".", 1)[0] + "." + segment("short")
+            for bad in (token, short):
+                with self.assertRaises(BadSignatureError) as expected:
+                    jwt.decode(bad, public)
+                with self.assertRaises(BadSignatureError) as error:
+                    Verifier(public).decode(bad, parse_compact(bad), {})
+                self.assertEqual(str(error.exception), str(expected.exception))
+
+    def test_fallback(self):
+        """Test that other algorithms, keys and malformed tokens are left to authlib."""
+        # Test algorithms and curves not verified here
+        private, public = generate_key("EC", "P-384")
+        self.assertEqual(Verifier(public).public_keys, {})
+        token = jwt.encode({"alg": "ES384"}, PAYLOAD, private).decode()
+        self.assertEqual(Verifier(public).decode(token, parse_compact(token), {}), PAYLOAD)
+        private, public = generate_key("RSA", 2048)
+        token = jwt.encode({"alg": "PS256"}, PAYLOAD, private).decode()
+        self.assertEqual(Verifier(public).decode(token, parse_compact(token), {}), PAYLOAD)
+        # Test keys, that are not for verifying signatures
+        for options in ({"use": "enc"}, {"key_ops": ["encrypt"]}):
+            _, public = generate_key("RSA", 2048, **options)
+            self.assertEqual(Verifier(public).public_keys, {})
+        # Test payloads, that are not JSON objects
+        for payload in ("[]", "not json"):
+            token = JsonWebSignature().serialize_compact({"alg": "RS256"}, payload, private).decode()
+            with self.assertRaises(DecodeError):
+                Verifier(type(private).import_key(private.get_public_key())).decode(token, parse_compact(token), {})
+        # Test malformed tokens
+        with self.assertRaises(DecodeError):
+            Verifier(public).decode("not.a", None, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
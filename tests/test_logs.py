@@ -0,0 +1,98 @@
+import io
+import os
+import json
+import logging
+import unittest
+
+import asynctest
+
+from pathlib import Path
+from unittest import mock
+
+from oidc_client.config import LOG, parse_config_file
+from oidc_client.utils.logs import REQUEST_ID, REQUEST_SAMPLED, JSONFormatter, LocalQueueHandler, RequestContextFilter, setup_logging, close_log_listener
+
+CONFIG_FILE = Path(__file__).resolve().parent.parent.joinpath("oidc_client", "config", "config.ini")
+
+
+def record(level=logging.INFO, msg="Decoding %s.", args=("token",), exc_info=None):
+    """Create a log record."""
+    return logging.LogRecord("oidc", level, "utils.py", 10, msg, args, exc_info)
+
+
+class TestLogs(asynctest.TestCase):
+    """Test structured and non-blocking logging."""
+
+    def tearDown(self):
+        """Write logs to stderr as text again."""
+        setup_logging()
+
+    def test_request_context(self):
+        """Test that records get the correlation ID, and lines of requests not sampled are dropped."""
+        context_filter = RequestContextFilter()
+        entry = record()
+        self.assertTrue(context_filter.filter(entry))
+        self.assertIsNone(entry.request_id)
+        id_token, sampled_token = REQUEST_ID.set("abc"), REQUEST_SAMPLED.set(False)
+        try:
+            entry = record()
+            self.assertFalse(context_filter.filter(entry))
+            self.assertEqual(entry.request_id, "abc")
+            self.assertTrue(context_filter.filter(record(logging.WARNING)))
+        finally:
+            REQUEST_SAMPLED.reset(sampled_token)
+            REQUEST_ID.reset(id_token)
+        # IDs set before a record was queued are kept
+        self.assertTrue(context_filter.filter(entry))
+        self.assertEqual(entry.request_id, "abc")
+
+    def test_json_formatter(self):
+        """Test that records are formatted as JSON objects."""
+        entry = record()
+        entry.request_id = "abc"
+        line = json.loads(JSONFormatter().format(entry))
+        self.assertEqual(line["message"], "Decoding token.")
+        self.assertEqual((line["level"], line["logger"], line["line"], line["request_id"]), ("INFO", "oidc", 10, "abc"))
+        try:
+            raise ValueError("broken")
+        except ValueError as e:
+            entry = record(logging.ERROR, "Failed: %s", (e,), exc_info=(type(e), e, e.__traceback__))
+        line = json.loads(JSONFormatter().format(entry))
+        self.assertNotIn("request_id", line)
+        self.assertIn("ValueError: broken", line["exception"])
+
+    def test_queue_handler(self):
+        """Test that arguments are merged to the message before the record is queued."""
+        args = ["token"]
+        entry = LocalQueueHandler(mock.MagicMock()).prepare(record(args=(args,)))
+        args.append("changed")
+        self.assertEqual(entry.getMessage(), "Decoding ['token'].")
+
+    async def test_setup_logging(self):
+        """Test that logs are written as JSON from a background thread."""
+        stream = io.StringIO()
+        listener = setup_logging("json", log_queue=True, stream=stream)
+        LOG.warning("Token request to AAI failed: %s.", 400)
+        await close_log_listener({"log_listener": listener})
+        self.assertEqual(json.loads(stream.getvalue())["message"], "Token request to AAI failed: 400.")
+        # Logs are written directly after the background thread is stopped
+        LOG.warning("Closed.")
+        self.assertIn("Closed.", stream.getvalue().splitlines()[-1])
+        # Test writing text directly
+        stream = io.StringIO()
+        self.assertIsNone(setup_logging("text", stream=stream))
+        LOG.warning("Written.")
+        self.assertIn("[WARNING ]", stream.getvalue())
+
+    def test_parse_log_format(self):
+        """Test that unknown log formats are rejected."""
+        with mock.patch.dict(os.environ, {"LOG_FORMAT": "json", "LOG_SAMPLE_RATE": "0"}):
+            config = parse_config_file(CONFIG_FILE)
+            self.assertEqual((config.logging["log_format"], config.logging["log_sample_rate"]), ("json", 0))
+        with mock.patch.dict(os.environ, {"LOG_FORMAT": "xml"}):
+            with self.assertRaises(ValueError):
+                parse_config_file(CONFIG_FILE)
+
+
+if __name__ == "__main__":
+    unittest.main()
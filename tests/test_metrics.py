@@ -0,0 +1,140 @@
+import os
+import sys
+import array
+import tempfile
+import subprocess  # nosec
+
+import asynctest
+
+from unittest import mock
+
+from oidc_client.utils.metrics import Registry, Counter, Gauge, Histogram, instrument, worker_alive, REGISTRY
+
+
+async def run_stage(fail):
+    """Return from a stage, or fail."""
+    if fail:
+        raise ValueError("failed")
+    return "done"
+
+
+class TestMetrics(asynctest.TestCase):
+    """Test metrics registry and instrumentation."""
+
+    def setUp(self):
+        """Initialise registry with a counter and a histogram."""
+        self.registry = Registry()
+        self.counter = Counter("test_total", "Test counter.", {"kind": "test"}, registry=self.registry)
+        self.histogram = Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1.0), registry=self.registry)
+
+    def tearDown(self):
+        """Release metrics file."""
+        self.registry.close()
+
+    def test_render(self):
+        """Test exposition of counters and histograms."""
+        self.counter.inc()
+        self.counter.inc(2)
+        for value in (0.05, 0.1, 0.5, 5.0):
+            self.histogram.observe(value)
+        text = self.registry.render()
+        self.assertIn("# TYPE test_total counter", text)
+        self.assertIn('test_total{kind="test"} 3.0', text)
+        self.assertIn("# TYPE test_seconds histogram", text)
+        self.assertIn('test_seconds_bucket{le="0.1"} 2.0', text)
+        self.assertIn('test_seconds_bucket{le="1.0"} 3.0', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4.0', text)
+        self.assertIn("test_seconds_sum 5.65", text)
+        self.assertIn("test_seconds_count 4.0", text)
+
+    def test_gauge(self):
+        """Test exposition of gauges."""
+        gauge = Gauge("test_depth", "Test gauge.", registry=self.registry)
+        gauge.set(5)
+        gauge.inc(-2)
+        text = self.registry.render()
+        self.assertIn("# TYPE test_depth gauge", text)
+        self.assertIn("test_depth 3.0", text)
+
+    def test_render_families(self):
+        """Test that samples of a metric name are rendered together, after one description."""
+        Histogram("test_seconds", "Test histogram.", {"stage": "other"}, buckets=(0.1, 1.0), registry=self.registry)
+        Counter("test_total", "Test counter.", {"kind": "other"}, registry=self.registry)
+        text = self.registry.render()
+        self.assertLess(text.index('test_total{kind="other"}'), text.index("# HELP test_seconds"))
+        self.assertLess(text.index('test_seconds_bucket{le="0.1"}'), text.index('test_seconds_bucket{stage="other",le="0.1"}'))
+        self.assertEqual(text.count("# TYPE test_total counter"), 1)
+        self.assertEqual(text.count("# TYPE test_seconds histogram"), 1)
+
+    def test_exited_workers(self):
+        """Test that counters of exited workers are kept in the sums, but their gauges are left out."""
+        gauge = Gauge("test_depth", "Test gauge.", registry=self.registry)
+        process = subprocess.Popen([sys.executable, "-c", "pass"])  # nosec
+        process.wait()
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.open(directory)
+            gauge.set(1)
+            values = [0.0] * self.registry.size
+            values[self.counter.offset] = 5.0
+            values[gauge.offset] = 2.0
+            for pid in (os.getppid(), process.pid):
+                with open(os.path.join(directory, f"metrics_{pid}.db"), "wb") as f:
+                    f.write(array.array("d", values).tobytes())
+            text = self.registry.render()
+            self.registry.close()
+        self.assertIn('test_total{kind="test"} 10.0', text)
+        self.assertIn("test_depth 3.0", text)
+
+    def test_worker_alive(self):
+        """Test finding out whether the worker of a metrics file is running."""
+        self.assertTrue(worker_alive(f"metrics_{os.getpid()}.db"))
+        self.assertFalse(worker_alive("metrics_0.db"))
+        self.assertFalse(worker_alive("metrics_other.db"))
+        with mock.patch("oidc_client.utils.metrics.os.kill", side_effect=PermissionError):
+            self.assertTrue(worker_alive("metrics_1.db"))
+
+    def test_shared_workers(self):
+        """Test that metrics of all workers in the metrics directory are summed."""
+        self.counter.inc()
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.open(directory)
+            self.assertEqual(self.registry.path, os.path.join(directory, f"metrics_{os.getpid()}.db"))
+            # Values are kept when moved to file, and are written through to it
+            self.counter.inc()
+            with open(self.registry.path, "rb") as f:
+                self.assertEqual(array.array("d", f.read())[0], 2.0)
+            # Another worker
+            with open(os.path.join(directory, "metrics_1.db"), "wb") as f:
+                f.write(array.array("d", [5.0] + [0.0] * (self.registry.size - 1)).tobytes())
+            # A worker of a different application version and other files are ignored
+            with open(os.path.join(directory, "metrics_2.db"), "wb") as f:
+                f.write(array.array("d", [100.0]).tobytes())
+            open(os.path.join(directory, "unrelated"), "w").close()
+            self.assertIn('test_total{kind="test"} 7.0', self.registry.render())
+            self.registry.close()
+            self.registry.close()
+        self.counter.inc()
+        self.assertEqual(self.registry.values[self.counter.offset], 3.0)
+        self.assertIn('test_total{kind="test"} 3.0', self.registry.render())
+
+    def test_register_after_open(self):
+        """Test that metrics can't be added once values are shared."""
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.open(directory)
+            with self.assertRaises(RuntimeError):
+                Counter("late_total", "Too late.", registry=self.registry)
+            self.registry.close()
+
+    async def test_instrument(self):
+        """Test recording stage duration and errors."""
+        stage = instrument("test_stage")(run_stage)
+        self.assertEqual(await stage(False), "done")
+        with self.assertRaises(ValueError):
+            await stage(True)
+        text = REGISTRY.render()
+        self.assertIn('oidc_stage_duration_seconds_count{stage="test_stage"} 2.0', text)
+        self.assertIn('oidc_stage_errors_total{stage="test_stage"} 1.0', text)
+
+
+if __name__ == "__main__":
+    asynctest.main()
@@ -0,0 +1,145 @@
+import asyncio
+
+import asynctest
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from oidc_client.utils.logs import REQUEST_ID, REQUEST_SAMPLED, add_request_id
+from oidc_client.utils.middlewares import preserve_cookies, load_shedding, handler_profiling, request_logging, parse_route_limits, ConcurrencyLimiter
+from oidc_client.utils.monitor import HandlerProfiler
+
+
+async def redirect_with_cookie(request):
+    """Redirect with a cookie."""
+    response = web.HTTPSeeOther("/elsewhere")
+    response.set_cookie("flavour", "white chocolate")
+    raise response
+
+
+async def redirect(request):
+    """Redirect without cookies."""
+    raise web.HTTPSeeOther("/elsewhere")
+
+
+async def slow(request):
+    """Respond after a delay."""
+    await asyncio.sleep(0.05)
+    return web.Response(text="done")
+
+
+async def request_context(request):
+    """Respond with the correlation ID and sampling of the request."""
+    return web.json_response({"request_id": REQUEST_ID.get(), "sampled": REQUEST_SAMPLED.get()})
+
+
+class TestMiddlewares(asynctest.TestCase):
+    """Test web server middlewares."""
+
+    async def test_preserve_cookies(self):
+        """Test that cookies set on raised HTTP exceptions are sent."""
+        app = web.Application(middlewares=[preserve_cookies])
+        app.router.add_get("/cookie", redirect_with_cookie)
+        app.router.add_get("/plain", redirect)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get("/cookie", allow_redirects=False)
+            self.assertEqual(response.status, 303)
+            self.assertEqual(response.headers["Location"], "/elsewhere")
+            self.assertEqual(response.cookies["flavour"].value, "white chocolate")
+            response = await client.get("/plain", allow_redirects=False)
+            self.assertEqual(response.status, 303)
+            self.assertNotIn("Set-Cookie", response.headers)
+
+    async def test_handler_profiling(self):
+        """Test that handlers are timed by route."""
+        profiler = HandlerProfiler(0.01)
+        app = web.Application(middlewares=[handler_profiling(profiler)])
+        app.router.add_get("/slow/{name}", slow)
+        async with TestClient(TestServer(app)) as client:
+            await client.get("/slow/a")
+            await client.get("/slow/b")
+            response = await client.get("/missing")
+            self.assertEqual(response.status, 404)
+        self.assertEqual(profiler.handlers["GET /slow/{name}"]["count"], 2)
+        self.assertEqual(profiler.handlers["GET unmatched"]["count"], 1)
+        self.assertEqual([record["route"] for record in profiler.slow], ["GET /slow/{name}", "GET /slow/{name}"])
+
+    async def test_request_logging(self):
+        """Test that requests are given correlation IDs, and sampled for logging."""
+        for sample_rate, sampled in ((1.0, True), (0.0, False)):
+            app = web.Application(middlewares=[request_logging(sample_rate)])
+            app.router.add_get("/context", request_context)
+            app.router.add_get("/plain", redirect)
+            app.on_response_prepare.append(add_request_id)
+            async with TestClient(TestServer(app)) as client:
+                response = await client.get("/context", headers={"X-Request-ID": "req-1"})
+                self.assertEqual(await response.json(), {"request_id": "req-1", "sampled": sampled})
+                self.assertEqual(response.headers["X-Request-ID"], "req-1")
+                # Invalid IDs are replaced, also on raised responses
+                response = await client.get("/plain", headers={"X-Request-ID": "bad id\u00e4"}, allow_redirects=False)
+                self.assertEqual(len(response.headers["X-Request-ID"]), 16)
+                response = await client.get("/missing")
+                self.assertIn("X-Request-ID", response.headers)
+        self.assertIsNone(REQUEST_ID.get())
+
+    def test_parse_route_limits(self):
+        """Test parsing of route specific limits."""
+        self.assertEqual(parse_route_limits("/callback=50:100, /=0:0,/metrics=5"), {"/callback": (50, 100), "/": (0, 0), "/metrics": (5, 0)})
+        self.assertEqual(parse_route_limits(None), {})
+
+    async def test_load_shedding(self):
+        """Test that requests beyond the limits are shed with 503."""
+        app = web.Application(middlewares=[load_shedding(1, 1, 5, 3, "/free=0:0")])
+        app.router.add_get("/slow", slow)
+        app.router.add_get("/free", slow)
+        async with TestClient(TestServer(app)) as client:
+            # One request is processed, one waits and the rest are shed
+            responses = await asyncio.gather(*[client.get("/slow") for _ in range(4)])
+            statuses = sorted(response.status for response in responses)
+            self.assertEqual(statuses, [200, 200, 503, 503])
+            shed = [response for response in responses if response.status == 503][0]
+            self.assertEqual(shed.headers["Retry-After"], "3")
+            # Unlimited routes and unknown routes are not limited
+            responses = await asyncio.gather(*[client.get("/free") for _ in range(4)])
+            self.assertEqual([response.status for response in responses], [200] * 4)
+            response = await client.get("/missing")
+            self.assertEqual(response.status, 404)
+
+    async def test_queue_timeout(self):
+        """Test that requests waiting too long are shed."""
+        limiter = ConcurrencyLimiter(1, 10, 0.01)
+        self.assertTrue(await limiter.acquire())
+        self.assertFalse(await limiter.acquire())
+        self.assertEqual(len(limiter.waiters), 0)
+        limiter.release()
+        self.assertEqual(limiter.in_flight, 0)
+
+    async def test_queue_cancelled(self):
+        """Test that turns are passed on from cancelled requests."""
+        limiter = ConcurrencyLimiter(1, 10, 5)
+        self.assertTrue(await limiter.acquire())
+        # Test request cancelled while waiting
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(len(limiter.waiters), 0)
+        # Test request cancelled after it was given a turn
+        first = asyncio.ensure_future(limiter.acquire())
+        second = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(len(limiter.waiters), 2)
+        # The turn is handed to the first request, which is cancelled before it resumes
+        limiter.release()
+        first.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+        self.assertTrue(await second)
+        self.assertEqual(limiter.in_flight, 1)
+        limiter.release()
+        self.assertEqual(limiter.in_flight, 0)
+
+
+if __name__ == "__main__":
+    asynctest.main()
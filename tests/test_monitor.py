@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import unittest
+
+import asynctest
+
+from oidc_client.utils.metrics import LOOP_LAG, SLOW_HANDLERS
+from oidc_client.utils.monitor import LoopMonitor, HandlerProfiler, start_loop_monitor, close_loop_monitor
+from tests.helpers import value
+
+
+async def waiting_handler(delay):
+    """Wait without blocking the event loop."""
+    await asyncio.sleep(delay)
+    return "done"
+
+
+async def blocking_handler(delay):
+    """Block the event loop."""
+    threading.Event().wait(delay)
+    return "done"
+
+
+class TestLoopMonitor(asynctest.TestCase):
+    """Test event loop lag monitoring."""
+
+    async def test_lag(self):
+        """Test that lag of a blocked event loop is recorded."""
+        total = LOOP_LAG.registry.values[LOOP_LAG.sum]
+        monitor = LoopMonitor(interval=0.01)
+        app = {"loop_monitor": monitor}
+        await start_loop_monitor(app)
+        # Block the event loop past the due time of the measurement
+        threading.Event().wait(0.05)
+        await asyncio.sleep(0.02)
+        self.assertGreaterEqual(LOOP_LAG.registry.values[LOOP_LAG.sum], total + 0.03)
+        self.assertGreaterEqual(monitor.max_lag, 0.03)
+        await close_loop_monitor(app)
+        self.assertIsNone(monitor._timer)
+        monitor.close()
+
+
+class TestHandlerProfiler(asynctest.TestCase):
+    """Test timing and sampling of request handlers."""
+
+    async def test_stack_sample(self):
+        """Test that the stack of a slow handler is sampled."""
+        slow = value(SLOW_HANDLERS)
+        profiler = HandlerProfiler(0.02, records=2)
+        self.assertEqual(await profiler.run("GET /fast", waiting_handler, 0), "done")
+        for _ in range(3):
+            await profiler.run("GET /slow", waiting_handler, 0.05)
+        report = profiler.report()
+        self.assertEqual(report["handlers"]["GET /fast"]["count"], 1)
+        self.assertEqual(report["handlers"]["GET /slow"]["count"], 3)
+        self.assertGreaterEqual(report["handlers"]["GET /slow"]["max"], 0.05)
+        self.assertGreaterEqual(report["handlers"]["GET /slow"]["total"], 0.15)
+        # Only the latest slow handlers are kept
+        self.assertEqual(len(report["slow"]), 2)
+        self.assertEqual(value(SLOW_HANDLERS), slow + 3)
+        record = report["slow"][0]
+        self.assertEqual(record["route"], "GET /slow")
+        self.assertIn("waiting_handler", "\n".join(record["stack"]))
+        self.assertNotIn("profile", record)
+        # Handlers run outside of a task have no stack to sample
+        sample = []
+        profiler._sample_stack(None, sample)
+        self.assertEqual(sample, [])
+
+    async def test_profile(self):
+        """Test that slow handlers are profiled, one at a time."""
+        profiler = HandlerProfiler(0.02, profile=True)
+        await asyncio.gather(profiler.run("GET /waiting", waiting_handler, 0.05), profiler.run("GET /blocking", blocking_handler, 0.05))
+        records = {record["route"]: record for record in profiler.slow}
+        # The profile shows the handler, that blocked the event loop while the profiled handler waited
+        self.assertIn("blocking_handler", records["GET /waiting"]["profile"])
+        self.assertNotIn("profile", records["GET /blocking"])
+        # Errors of handlers are raised after timing
+        with self.assertRaises(ValueError):
+            await profiler.run("GET /error", int, "not a number")
+        self.assertEqual(profiler.handlers["GET /error"]["count"], 1)
+        self.assertIsNone(profiler._profiler)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import threading
+import unittest
+
+import asynctest
+
+from oidc_client.utils.metrics import CRYPTO_OFFLOADED
+from oidc_client.utils.offload import CryptoExecutor, close_crypto_executor
+from tests.helpers import value
+
+
+class TestCryptoExecutor(asynctest.TestCase):
+    """Test offloading of CPU-bound cryptography."""
+
+    async def test_inline(self):
+        """Test that work stays on the event loop without threads."""
+        executor = CryptoExecutor()
+        self.assertFalse(executor.offloading)
+        self.assertEqual(await executor.run(4096, threading.current_thread), threading.current_thread())
+        executor.close()
+
+    async def test_offloaded(self):
+        """Test that work of at least the threshold is done in the thread pool."""
+        offloaded = value(CRYPTO_OFFLOADED)
+        executor = CryptoExecutor(threads=2, threshold=512)
+        self.assertTrue(executor.offloading)
+        self.assertEqual(await executor.run(100, threading.current_thread), threading.current_thread())
+        thread = await executor.run(512, threading.current_thread)
+        self.assertTrue(thread.name.startswith("oidc-crypto"))
+        self.assertEqual(value(CRYPTO_OFFLOADED), offloaded + 1)
+        # Errors are raised to the caller
+        with self.assertRaises(ValueError):
+            await executor.run(1024, int, "not a number")
+        await close_crypto_executor({"crypto_executor": executor})
+        with self.assertRaises(RuntimeError):
+            await executor.run(1024, int, "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+
+import asynctest
+
+from pathlib import Path
+from unittest import mock
+
+from aiohttp import web
+
+from oidc_client.config import CONFIG, DEFAULT_PROVIDER, parse_config_file, index_issuers
+from oidc_client.utils.providers import Provider, get_provider, setup_providers, close_providers
+
+CONFIG_FILE = Path(__file__).resolve().parent.parent.joinpath("oidc_client", "config", "config.ini")
+
+PROVIDER_SECTION = """
+[aai:elixir-aai]
+client_id=elixir
+client_secret=secret
+iss=https://aai.example.org/
+url_discovery=https://aai.example.org/.well-known/openid-configuration
+jwk_timeout=2
+"""
+
+ENDPOINTS = """
+url_auth=https://aai.example.org/authorize
+url_token=https://aai.example.org/token
+jwk_server=https://aai.example.org/jwk
+"""
+
+
+def parse_providers(section):
+    """Parse configuration file with an additional provider section."""
+    with tempfile.NamedTemporaryFile("w", suffix=".ini") as config_file:
+        config_file.write(CONFIG_FILE.read_text() + section)
+        config_file.flush()
+        return parse_config_file(config_file.name).providers
+
+
+class TestProviders(asynctest.TestCase):
+    """Test AAI providers."""
+
+    def test_parse_providers(self):
+        """Test that provider sections are parsed, and missing variables are taken from [aai]."""
+        providers = parse_providers(PROVIDER_SECTION)
+        self.assertEqual(sorted(providers), [DEFAULT_PROVIDER, "elixir-aai"])
+        provider = providers["elixir-aai"]
+        self.assertEqual(provider["client_id"], "elixir")
+        self.assertEqual(provider["jwk_timeout"], 2.0)
+        self.assertEqual(provider["jwk_lifetime"], CONFIG.aai["jwk_lifetime"])
+        self.assertEqual(provider["url_callback"], CONFIG.aai["url_callback"])
+        self.assertIsNone(provider["url_token"])
+        # Test environment variables prefixed with the provider name
+        with mock.patch.dict(os.environ, {"ELIXIR_AAI_CLIENT_SECRET": "topsecret"}):
+            self.assertEqual(parse_providers(PROVIDER_SECTION)["elixir-aai"]["client_secret"], "topsecret")
+
+    def test_parse_providers_invalid(self):
+        """Test that providers must have credentials, endpoints and their own issuers."""
+        with self.assertRaises(ValueError):
+            parse_providers(PROVIDER_SECTION.replace("client_secret=secret", ""))
+        # Test endpoints without discovery
+        section = PROVIDER_SECTION.replace("url_discovery=https://aai.example.org/.well-known/openid-configuration", "")
+        self.assertEqual(parse_providers(section + ENDPOINTS)["elixir-aai"]["url_token"], "https://aai.example.org/token")
+        for endpoints in ("", ENDPOINTS.replace("url_token", "#url_token"), ENDPOINTS.replace("jwk_server", "#jwk_server")):
+            with self.assertRaises(ValueError):
+                parse_providers(section + endpoints)
+        with self.assertRaises(ValueError):
+            parse_providers(PROVIDER_SECTION.replace("https://aai.example.org/", CONFIG.aai["iss"].split(",")[0]))
+
+    def test_index_issuers(self):
+        """Test that issuers are mapped to the provider that trusts them."""
+        issuers = index_issuers({"a": {"iss": "https://a.example.org/, https://b.example.org/"}, "c": {"iss": "https://c.example.org/"}, "d": {"iss": None}})
+        self.assertEqual(issuers, {"https://a.example.org/": "a", "https://b.example.org/": "a", "https://c.example.org/": "c"})
+
+    async def test_get_provider(self):
+        """Test that providers are found by name and by the issuers they trust."""
+        app = web.Application()
+        aai = dict(CONFIG.aai, iss="https://other.example.org/", url_discovery=None)
+        sessions = {name: asynctest.MagicMock(close=asynctest.CoroutineMock()) for name in (DEFAULT_PROVIDER, "other")}
+        providers = {DEFAULT_PROVIDER: Provider(DEFAULT_PROVIDER, CONFIG.aai, sessions[DEFAULT_PROVIDER]), "other": Provider("other", aai, sessions["other"])}
+        setup_providers(app, providers)
+        self.assertIs(get_provider(app), app["provider"])
+        self.assertIs(get_provider(app, "other"), app["providers"]["other"])
+        self.assertIs(app["issuers"]["https://other.example.org/"], app["providers"]["other"])
+        with self.assertRaises(web.HTTPBadRequest):
+            get_provider(app, "unknown")
+        await close_providers(app)
+        sessions["other"].close.assert_called_once()
+
+
+if __name__ == "__main__":
+    asynctest.main()
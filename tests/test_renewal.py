@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+
+import asynctest
+
+from pathlib import Path
+from unittest import mock
+
+from aiohttp import web
+
+from oidc_client.app import init
+from oidc_client.config import CONFIG, DEFAULT_PROVIDER, parse_config_file
+from oidc_client.utils.renewal import TokenRenewer, start_token_renewer, close_token_renewer
+from oidc_client.utils.session import MemoryStorage
+from oidc_client.utils.providers import close_providers
+
+CONFIG_FILE = Path(__file__).resolve().parent.parent.joinpath("oidc_client", "config", "config.ini")
+
+
+class TestTokenRenewer(asynctest.TestCase):
+    """Test background token renewal."""
+
+    def setUp(self):
+        """Initialise renewer with a session that has a refresh token."""
+        self.storage = MemoryStorage()
+        self.server = {"providers": {DEFAULT_PROVIDER: mock.sentinel.provider, "other": mock.sentinel.other}}
+        self.app = {"token_renewer": TokenRenewer(self.server, self.storage, margin=300, batch_size=2, rate=1000)}
+        self.renewer = self.app["token_renewer"]
+
+    async def tearDown(self):
+        """Stop renewer."""
+        await self.renewer.close()
+
+    def test_due(self):
+        """Test that sessions are taken in batches in order of renewal time."""
+        now = time.time()
+        self.renewer.schedule("late", now + 400)
+        self.renewer.schedule("second", now + 200)
+        self.renewer.schedule("first", now + 100)
+        self.renewer.schedule("third", now + 250)
+        self.assertEqual(self.renewer.due(now), ["first", "second"])
+        self.assertEqual(self.renewer.due(now), ["third"])
+        self.assertEqual(self.renewer.due(now), [])
+
+    def test_due_rescheduled(self):
+        """Test that a rescheduled session is renewed once, at its latest renewal time."""
+        now = time.time()
+        self.renewer.schedule("session", now + 100)
+        self.renewer.schedule("session", now + 3600)
+        self.assertEqual(self.renewer.due(now), [])
+        self.assertEqual(self.renewer.due(now + 3600), ["session"])
+
+    @asynctest.mock.patch("oidc_client.utils.renewal.validate_token", return_value={"exp": 9999999999})
+    @asynctest.mock.patch("oidc_client.utils.renewal.refresh_access_token")
+    async def test_renew(self, m_refresh, m_validate):
+        """Test that tokens are refreshed and saved to session data."""
+        await self.storage.store("session", {"created": 1, "session": {"access_token": "old", "refresh_token": "refresh"}})
+        # Test refresh token kept when not rotated
+        m_refresh.return_value = {"access_token": "new"}
+        await self.renewer.renew("session")
+        m_refresh.assert_called_once_with(mock.sentinel.provider, "refresh")
+        self.assertEqual((await self.storage.load("session"))["session"], {"access_token": "new", "refresh_token": "refresh"})
+        self.assertEqual(self.renewer.scheduled["session"], 9999999999 - 300)
+        # Test rotated refresh token
+        m_refresh.return_value = {"access_token": "newer", "refresh_token": "rotated"}
+        await self.renewer.renew("session")
+        self.assertEqual((await self.storage.load("session"))["session"], {"access_token": "newer", "refresh_token": "rotated"})
+        # Test refresh at the provider the user logged in at
+        await self.storage.store("session", {"created": 1, "session": {"access_token": "old", "refresh_token": "refresh", "oidc_provider": "other"}})
+        await self.renewer.renew("session")
+        m_refresh.assert_called_with(mock.sentinel.other, "refresh")
+
+    @asynctest.mock.patch("oidc_client.utils.renewal.validate_token", return_value={"exp": 9999999999})
+    @asynctest.mock.patch("oidc_client.utils.renewal.refresh_access_token")
+    async def test_renew_logout(self, m_refresh, m_validate):
+        """Test that a session ended or changed while the AAI answers is not saved again."""
+        await self.storage.store("session", {"created": 1, "session": {"access_token": "old", "refresh_token": "refresh"}})
+
+        async def logout(provider, refresh_token):
+            """End the session while the token is being refreshed."""
+            await self.storage.store("session", {"created": 1, "session": {}})
+            return {"access_token": "new"}
+
+        async def expire(provider, refresh_token):
+            """Delete the session while the token is being refreshed."""
+            await self.storage.delete("session")
+            return {"access_token": "new"}
+
+        m_refresh.side_effect = logout
+        await self.renewer.renew("session")
+        self.assertEqual((await self.storage.load("session"))["session"], {})
+        self.assertEqual(self.renewer.scheduled, {})
+        # Test session deleted meanwhile
+        await self.storage.store("session", {"created": 1, "session": {"access_token": "old", "refresh_token": "refresh"}})
+        m_refresh.side_effect = expire
+        await self.renewer.renew("session")
+        self.assertIsNone(await self.storage.load("session"))
+        self.assertEqual(self.renewer.scheduled, {})
+
+    @asynctest.mock.patch("oidc_client.utils.renewal.refresh_access_token")
+    async def test_renew_cancelled(self, m_refresh):
+        """Test that ended sessions and sessions without refresh token are not renewed."""
+        await self.renewer.renew("missing")
+        await self.storage.store("session", {"created": 1, "session": {"access_token": "old"}})
+        await self.renewer.renew("session")
+        m_refresh.assert_not_called()
+        self.assertEqual(self.renewer.scheduled, {})
+
+    @asynctest.mock.patch("oidc_client.utils.renewal.refresh_access_token")
+    async def test_renew_failed(self, m_refresh):
+        """Test that sessions are not rescheduled after failed renewal."""
+        await self.storage.store("session", {"created": 1, "session": {"access_token": "old", "refresh_token": "refresh"}})
+        for error in (web.HTTPUnauthorized(text="Refresh token was rejected by AAI."), RuntimeError("Unexpected")):
+            m_refresh.side_effect = error
+            await self.renewer.renew("session")
+            self.assertEqual((await self.storage.load("session"))["session"]["access_token"], "old")
+            self.assertEqual(self.renewer.scheduled, {})
+
+    @asynctest.mock.patch("oidc_client.utils.renewal.validate_token", return_value={"exp": 9999999999})
+    @asynctest.mock.patch("oidc_client.utils.renewal.refresh_access_token", return_value={"access_token": "new"})
+    async def test_run(self, m_refresh, m_validate):
+        """Test that due sessions are renewed in the background."""
+        await self.storage.store("session", {"created": 1, "session": {"access_token": "old", "refresh_token": "refresh"}})
+        self.renewer.schedule("session", time.time())
+        await start_token_renewer(self.app)
+        await asyncio.sleep(0.05)
+        self.assertEqual((await self.storage.load("session"))["session"]["access_token"], "new")
+        await close_token_renewer(self.app)
+        self.assertIsNone(self.renewer._task)
+
+    async def test_init(self):
+        """Test that web server renews tokens when enabled."""
+        with mock.patch.dict(CONFIG.renewal, {"token_renewal": True}), mock.patch.dict(CONFIG.app, {"session_backend": "memory"}):
+            server = await init()
+        await close_providers(server)
+        self.assertIsInstance(server["token_renewer"], TokenRenewer)
+        self.assertIs(server["token_renewer"].storage, server["session_storage"])
+
+    def test_parse_renewal(self):
+        """Test that token renewal requires a server-side session backend."""
+        with mock.patch.dict(os.environ, {"TOKEN_RENEWAL": "True", "SESSION_BACKEND": "memory"}):
+            self.assertTrue(parse_config_file(CONFIG_FILE).renewal["token_renewal"])
+        with mock.patch.dict(os.environ, {"TOKEN_RENEWAL": "True", "SESSION_BACKEND": "cookie"}):
+            with self.assertRaises(ValueError):
+                parse_config_file(CONFIG_FILE)
+
+
+if __name__ == "__main__":
+    asynctest.main()
@@ -0,0 +1,183 @@
+import asyncio
+
+import asynctest
+
+from aiohttp import web
+
+from oidc_client.utils.revocation import RevocationQueue, start_revocation_queue, close_revocation_queue, revoke_tokens
+from oidc_client.utils.metrics import REVOCATION_QUEUE_DEPTH, REVOCATION_FAILURES, REVOCATION_REJECTED, REVOCATION_DROPPED
+from tests.helpers import value
+
+AAI_ERROR = web.HTTPBadGateway(text="Logout failed at AAI: 500.")
+REJECTED = web.HTTPBadRequest(text="Logout failed at AAI: 400.")
+PROVIDER = asynctest.sentinel.provider
+
+
+async def slow_revoke(provider, token, retry=True):
+    """Revoke token after a delay."""
+    await asyncio.sleep(1)
+
+
+async def stream(tokens):
+    """Yield tokens asynchronously."""
+    for token in tokens:
+        yield token
+
+
+async def broken_stream():
+    """Yield a token and fail."""
+    yield "token"
+    raise ConnectionResetError("Connection lost")
+
+
+async def failing_revoke(provider, token):
+    """Fail to revoke bad tokens."""
+    if token.startswith("bad"):
+        raise AAI_ERROR
+    if token.startswith("lost"):
+        raise ConnectionResetError("Connection lost")
+
+
+class TestRevocationQueue(asynctest.TestCase):
+    """Test background token revocation."""
+
+    def setUp(self):
+        """Initialise application with a revocation queue."""
+        self.app = web.Application()
+        self.app["revocation_queue"] = RevocationQueue(maxsize=2, workers=2, retries=2, backoff=0.001, drain_timeout=0.05)
+
+    async def tearDown(self):
+        """Stop revocation queue."""
+        await close_revocation_queue(self.app)
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token")
+    async def test_revoke(self, m_revoke):
+        """Test that queued tokens are revoked in the background."""
+        await start_revocation_queue(self.app)
+        queue = self.app["revocation_queue"]
+        self.assertTrue(queue.submit("token1", PROVIDER))
+        self.assertTrue(queue.submit("token2", PROVIDER))
+        self.assertEqual(value(REVOCATION_QUEUE_DEPTH), 2)
+        await queue.queue.join()
+        m_revoke.assert_has_calls([asynctest.call(PROVIDER, "token1", retry=False), asynctest.call(PROVIDER, "token2", retry=False)], any_order=True)
+        self.assertEqual(value(REVOCATION_QUEUE_DEPTH), 0)
+
+    async def test_queue_full(self):
+        """Test that tokens are dropped while the queue is full."""
+        queue = self.app["revocation_queue"]
+        dropped = value(REVOCATION_DROPPED)
+        self.assertTrue(queue.submit("token1", PROVIDER))
+        self.assertTrue(queue.submit("token2", PROVIDER))
+        self.assertFalse(queue.submit("token3", PROVIDER))
+        self.assertEqual(value(REVOCATION_DROPPED), dropped + 1)
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token")
+    async def test_retry(self, m_revoke):
+        """Test that failed revocations are retried, and given up after all retries."""
+        queue = self.app["revocation_queue"]
+        failures = value(REVOCATION_FAILURES)
+        # Test success after retries
+        m_revoke.side_effect = [AAI_ERROR, AAI_ERROR, None]
+        await queue.revoke("token", PROVIDER)
+        self.assertEqual(m_revoke.call_count, 3)
+        self.assertEqual(value(REVOCATION_FAILURES), failures)
+        # Test failure after all retries
+        m_revoke.side_effect = AAI_ERROR
+        await queue.revoke("token", PROVIDER)
+        self.assertEqual(m_revoke.call_count, 6)
+        self.assertEqual(value(REVOCATION_FAILURES), failures + 1)
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token", side_effect=REJECTED)
+    async def test_rejected(self, m_revoke):
+        """Test that tokens rejected by the AAI are not retried."""
+        queue = self.app["revocation_queue"]
+        rejected = value(REVOCATION_REJECTED)
+        await queue.revoke("token", PROVIDER)
+        m_revoke.assert_called_once_with(PROVIDER, "token", retry=False)
+        self.assertEqual(value(REVOCATION_REJECTED), rejected + 1)
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token", side_effect=slow_revoke)
+    async def test_close(self, m_revoke):
+        """Test that shutdown waits for queued tokens for a limited time."""
+        await start_revocation_queue(self.app)
+        queue = self.app["revocation_queue"]
+        queue.submit("token", PROVIDER)
+        await close_revocation_queue(self.app)
+        self.assertEqual(queue._tasks, [])
+        self.assertEqual(value(REVOCATION_QUEUE_DEPTH), 0)
+
+
+class TestRevokeTokens(asynctest.TestCase):
+    """Test bulk token revocation."""
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token", side_effect=failing_revoke)
+    async def test_revoke_tokens(self, m_revoke):
+        """Test that results of all tokens are reported."""
+        for tokens in (["good1", "bad", "good2", "lost"], stream(["good1", "bad", "good2", "lost"])):
+            results = [result async for result in revoke_tokens(PROVIDER, tokens, concurrency=2)]
+            self.assertEqual(
+                sorted(results, key=lambda result: result["index"]),
+                [
+                    {"index": 0, "revoked": True},
+                    {"index": 1, "revoked": False, "error": "Logout failed at AAI: 500."},
+                    {"index": 2, "revoked": True},
+                    {"index": 3, "revoked": False, "error": "ConnectionResetError('Connection lost')"},
+                ],
+            )
+        self.assertEqual(m_revoke.call_count, 8)
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token")
+    async def test_revoke_tokens_concurrency(self, m_revoke):
+        """Test that concurrent requests to AAI are limited."""
+        answered = asyncio.Event()
+
+        async def blocked_revoke(provider, token):
+            """Wait for the AAI to answer."""
+            await answered.wait()
+
+        m_revoke.side_effect = blocked_revoke
+        results = revoke_tokens(PROVIDER, [f"token{i}" for i in range(10)], concurrency=3)
+        task = asyncio.ensure_future(results.__anext__())
+        for _ in range(10):
+            await asyncio.sleep(0)
+        self.assertEqual(m_revoke.call_count, 3)
+        # Test that the results can be closed once read
+        answered.set()
+        self.assertEqual(await task, {"index": 0, "revoked": True})
+        await results.aclose()
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token")
+    async def test_revoke_tokens_stopped(self, m_revoke):
+        """Test that reading and revoking tokens is stopped, when the results are no longer read."""
+        cancelled = []
+
+        async def blocked_revoke(provider, token):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(token)
+                raise
+
+        m_revoke.side_effect = blocked_revoke
+        results = revoke_tokens(PROVIDER, [f"token{i}" for i in range(10)], concurrency=2)
+        task = asyncio.ensure_future(results.__anext__())
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # The reader is waiting for the workers, which are waiting for the AAI
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await asyncio.wait_for(task, 1)
+        self.assertEqual(sorted(cancelled), ["token0", "token1"])
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token")
+    async def test_revoke_tokens_broken_stream(self, m_revoke):
+        """Test that errors reading tokens are raised after the tokens read so far are revoked."""
+        results = []
+        with self.assertRaises(ConnectionResetError):
+            async for result in revoke_tokens(PROVIDER, broken_stream(), concurrency=2):
+                results.append(result)
+        self.assertEqual(results, [{"index": 0, "revoked": True}])
+
+
+if __name__ == "__main__":
+    asynctest.main()
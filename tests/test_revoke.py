@@ -0,0 +1,80 @@
+import io
+import json
+import tempfile
+
+import asynctest
+
+from aiohttp import web
+
+from oidc_client.revoke import read_tokens, revoke, main
+
+
+class TestRevokeCommand(asynctest.TestCase):
+    """Test bulk revocation command."""
+
+    def test_read_tokens(self):
+        """Test reading tokens from lines and from JSON array."""
+        self.assertEqual(list(read_tokens(io.StringIO("token1\n\n  token2  \ntoken3"))), ["token1", "token2", "token3"])
+        self.assertEqual(list(read_tokens(io.StringIO('\n["token1",\n "token2"]\n'))), ["token1", "token2"])
+        self.assertEqual(list(read_tokens(io.StringIO("\n"))), [])
+        # Test that JSON arrays are validated before tokens are read
+        for tokens in ('["token1", 2]', '["token1"', '["token1"] {}'):
+            with self.assertRaises(ValueError):
+                read_tokens(io.StringIO(tokens))
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token")
+    async def test_revoke(self, m_revoke):
+        """Test that results and summary are printed."""
+        m_revoke.side_effect = [None, web.HTTPBadRequest(text="Logout failed at AAI: 400.")]
+        out = io.StringIO()
+        summary = await revoke(iter(["token1", "token2"]), concurrency=1, out=out)
+        self.assertEqual(summary, {"revoked": 1, "failed": 1})
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(lines[0], {"index": 0, "revoked": True})
+        self.assertEqual(lines[1], {"index": 1, "revoked": False, "error": "Logout failed at AAI: 400."})
+        self.assertEqual(lines[2], {"done": True, "revoked": 1, "failed": 1})
+
+    @asynctest.mock.patch("oidc_client.utils.revocation.revoke_token")
+    async def test_revoke_broken_input(self, m_revoke):
+        """Test that an error reading tokens is printed last."""
+        out = io.StringIO()
+
+        def tokens():
+            yield "token1"
+            raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+        summary = await revoke(tokens(), concurrency=1, out=out)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(lines[0], {"index": 0, "revoked": True})
+        self.assertEqual(lines[1], dict(summary, done=False))
+        self.assertIn("UnicodeDecodeError", summary["error"])
+
+    @asynctest.mock.patch("oidc_client.revoke.revoke")
+    def test_main(self, m_revoke):
+        """Test command line, failed revocations exit with an error."""
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as f:
+            f.write("token1\ntoken2\n")
+            f.flush()
+            m_revoke.return_value = {"revoked": 2, "failed": 0}
+            main([f.name, "--concurrency", "5"])
+            tokens, concurrency = m_revoke.call_args[0]
+            self.assertEqual(list(tokens), ["token1", "token2"])
+            self.assertEqual(concurrency, 5)
+            m_revoke.return_value = {"revoked": 1, "failed": 1}
+            with self.assertRaises(SystemExit):
+                main([f.name])
+            m_revoke.return_value = {"revoked": 1, "failed": 0, "error": "Revocation stopped."}
+            with self.assertRaises(SystemExit):
+                main([f.name])
+        # Test that invalid JSON arrays are refused before revocation
+        m_revoke.reset_mock()
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            f.write('["token1", 2]')
+            f.flush()
+            with self.assertRaises(SystemExit), asynctest.mock.patch("sys.stderr"):
+                main([f.name])
+        m_revoke.assert_not_called()
+
+
+if __name__ == "__main__":
+    asynctest.main()
@@ -0,0 +1,230 @@
+import os
+import re
+
+import asynctest
+
+from pathlib import Path
+from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from aiohttp_session import setup as session_setup, get_session
+from aiohttp_session.cookie_storage import EncryptedCookieStorage
+
+from oidc_client.config import parse_config_file
+from oidc_client.utils.offload import CryptoExecutor
+from oidc_client.utils.session import MemoryStorage, RedisStorage, OffloadedCookieStorage, create_session_storage, close_session_storage
+from oidc_client.utils.session import ServerSideStorage, CookieStorage, regenerate_session
+from oidc_client.utils.metrics import REGISTRY
+
+CONFIG_FILE = Path(__file__).resolve().parent.parent.joinpath("oidc_client", "config", "config.ini")
+
+
+class FakeRedis:
+    """Local stand-in for an asyncio Redis client."""
+
+    def __init__(self):
+        """Initialise empty store."""
+        self.data = {}
+        self.expiry = {}
+        self.closed = False
+
+    async def get(self, key):
+        """Get a value."""
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        """Set a value with expiry."""
+        self.data[key] = value.encode("utf-8")
+        self.expiry[key] = ex
+
+    async def delete(self, key):
+        """Delete a value."""
+        self.data.pop(key, None)
+
+    async def close(self):
+        """Close connections."""
+        self.closed = True
+
+
+def stage_count(stage):
+    """Return the number of times a stage of request processing was timed."""
+    return float(re.search(rf'oidc_stage_duration_seconds_count{{stage="{stage}"}} (\S+)', REGISTRY.render()).group(1))
+
+
+async def save_handler(request):
+    """Save a value to session."""
+    session = await get_session(request)
+    session["value"] = request.query["value"]
+    return web.Response()
+
+
+async def load_handler(request):
+    """Read a value from session."""
+    session = await get_session(request)
+    return web.Response(text=session.get("value", "missing"))
+
+
+async def login_handler(request):
+    """Move the session to a new session ID, as at login."""
+    session = await regenerate_session(request)
+    session["logged_in"] = "True"
+    return web.Response()
+
+
+async def clear_handler(request):
+    """Empty the session."""
+    session = await get_session(request)
+    session.clear()
+    return web.Response()
+
+
+class TestSessionStorage(asynctest.TestCase):
+    """Test server-side session storage."""
+
+    async def session_client(self, storage):
+        """Start a test server using the given session storage."""
+        app = web.Application()
+        session_setup(app, storage)
+        app.router.add_get("/save", save_handler)
+        app.router.add_get("/load", load_handler)
+        app.router.add_get("/login", login_handler)
+        app.router.add_get("/clear", clear_handler)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        self.addCleanup(client.close)
+        return client
+
+    async def assert_session_round_trip(self, client):
+        """Save, read and clear a session value, the cookie carrying only a session ID."""
+        await client.get("/save", params={"value": "fluffy bunnies"})
+        session_id = client.session.cookie_jar.filter_cookies(client.make_url("/"))["AIOHTTP_SESSION"].value
+        self.assertNotIn("bunnies", session_id)
+        response = await client.get("/load")
+        self.assertEqual(await response.text(), "fluffy bunnies")
+        await client.get("/clear")
+        response = await client.get("/load", cookies={"AIOHTTP_SESSION": session_id})
+        self.assertEqual(await response.text(), "missing")
+        return session_id
+
+    async def test_memory_storage(self):
+        """Test in-process session storage."""
+        storage = MemoryStorage(maxsize=10, lifetime=60)
+        client = await self.session_client(storage)
+        await self.assert_session_round_trip(client)
+        self.assertEqual(len(storage.sessions), 0)
+        # Unknown session IDs start a new session
+        response = await client.get("/load", cookies={"AIOHTTP_SESSION": "forged"})
+        self.assertEqual(await response.text(), "missing")
+
+    async def test_regenerate_session(self):
+        """Test that a new session ID is issued at login, and the old one is forgotten."""
+        storage = MemoryStorage(maxsize=10, lifetime=60)
+        client = await self.session_client(storage)
+        await client.get("/save", params={"value": "fluffy bunnies"})
+        session_id = client.session.cookie_jar.filter_cookies(client.make_url("/"))["AIOHTTP_SESSION"].value
+        await client.get("/login")
+        new_session_id = client.session.cookie_jar.filter_cookies(client.make_url("/"))["AIOHTTP_SESSION"].value
+        self.assertNotEqual(new_session_id, session_id)
+        self.assertIsNone(await storage.load(session_id))
+        self.assertEqual((await storage.load(new_session_id))["session"], {"value": "fluffy bunnies", "logged_in": "True"})
+        # Session IDs of cookie sessions are not regenerated
+        client = await self.session_client(EncryptedCookieStorage(b"x" * 32))
+        await client.get("/save", params={"value": "fluffy bunnies"})
+        await client.get("/login")
+        response = await client.get("/load")
+        self.assertEqual(await response.text(), "fluffy bunnies")
+
+    def test_abstract_storage(self):
+        """Test that server-side storages must implement loading, storing and deleting."""
+        with self.assertRaises(TypeError):
+            ServerSideStorage()
+
+    async def test_redis_storage(self):
+        """Test Redis session storage with a local stand-in."""
+        redis = FakeRedis()
+        storage = RedisStorage(redis, lifetime=60)
+        client = await self.session_client(storage)
+        await client.get("/save", params={"value": "fluffy bunnies"})
+        self.assertEqual(list(redis.expiry.values()), [60])
+        await client.get("/clear")
+        self.assertEqual(redis.data, {})
+        await self.assert_session_round_trip(client)
+        # Undecodable session data starts a new session
+        await client.get("/save", params={"value": "fluffy bunnies"})
+        redis.data = {key: b"not json" for key in redis.data}
+        response = await client.get("/load")
+        self.assertEqual(await response.text(), "missing")
+        await storage.close()
+        self.assertTrue(redis.closed)
+
+    async def test_offloaded_cookie_storage(self):
+        """Test encrypted cookie storage, that encrypts in a thread pool."""
+        executor = CryptoExecutor(threads=1)
+        self.addCleanup(executor.close)
+        storage = OffloadedCookieStorage(b"a" * 32, executor=executor)
+        client = await self.session_client(storage)
+        await client.get("/save", params={"value": "fluffy bunnies"})
+        cookie = client.session.cookie_jar.filter_cookies(client.make_url("/"))["AIOHTTP_SESSION"].value
+        self.assertNotIn("bunnies", cookie)
+        response = await client.get("/load")
+        self.assertEqual(await response.text(), "fluffy bunnies")
+        # Cookies are readable by the storage encrypting on the event loop
+        cookie = EncryptedCookieStorage(b"a" * 32)._fernet.encrypt(b'{"session": {"value": "x"}}').decode()
+        response = await client.get("/load", cookies={"AIOHTTP_SESSION": cookie})
+        self.assertEqual(await response.text(), "x")
+        # Forged cookies start a new session
+        response = await client.get("/load", cookies={"AIOHTTP_SESSION": "forged"})
+        self.assertEqual(await response.text(), "missing")
+        await client.get("/clear")
+        response = await client.get("/load")
+        self.assertEqual(await response.text(), "missing")
+
+    async def test_timed_stages(self):
+        """Test that loading and saving sessions are timed, for cookie and server-side sessions."""
+        for storage in (CookieStorage(b"a" * 32), MemoryStorage(maxsize=10, lifetime=60)):
+            client = await self.session_client(storage)
+            loaded, saved = stage_count("session_load"), stage_count("session_save")
+            await client.get("/save", params={"value": "fluffy bunnies"})
+            await client.get("/load")
+            self.assertEqual(stage_count("session_load"), loaded + 2)
+            self.assertEqual(stage_count("session_save"), saved + 1)
+
+    async def test_create_session_storage(self):
+        """Test choosing session storage from configuration."""
+        with mock.patch.dict("oidc_client.utils.session.CONFIG.app", {"session_backend": "cookie"}):
+            self.assertIsInstance(create_session_storage(), CookieStorage)
+            self.assertNotIsInstance(create_session_storage(CryptoExecutor()), OffloadedCookieStorage)
+            executor = CryptoExecutor(threads=1)
+            self.assertIsInstance(create_session_storage(executor), OffloadedCookieStorage)
+            executor.close()
+        with mock.patch.dict("oidc_client.utils.session.CONFIG.app", {"session_backend": "memory", "session_max_entries": 5}):
+            storage = create_session_storage()
+            self.assertIsInstance(storage, MemoryStorage)
+            self.assertEqual(storage.sessions.maxsize, 5)
+            await close_session_storage({"session_storage": storage})
+        with mock.patch.dict("oidc_client.utils.session.CONFIG.app", {"session_backend": "redis"}):
+            redis_asyncio = mock.MagicMock(from_url=mock.MagicMock(return_value=FakeRedis()))
+            with mock.patch.dict("sys.modules", {"redis": mock.MagicMock(asyncio=redis_asyncio), "redis.asyncio": redis_asyncio}):
+                storage = create_session_storage()
+            self.assertIsInstance(storage, RedisStorage)
+            await close_session_storage({"session_storage": storage})
+            self.assertTrue(storage.redis.closed)
+
+    def test_parse_session_backend(self):
+        """Test that unknown session backends are rejected."""
+        with mock.patch.dict(os.environ, {"SESSION_BACKEND": "memory"}):
+            self.assertEqual(parse_config_file(CONFIG_FILE).app["session_backend"], "memory")
+        with mock.patch.dict(os.environ, {"SESSION_BACKEND": "floppy"}):
+            with self.assertRaises(ValueError):
+                parse_config_file(CONFIG_FILE)
+        # Test that the memory backend is refused with multiple workers
+        with mock.patch.dict(os.environ, {"SESSION_BACKEND": "memory", "WEB_CONCURRENCY": "1"}):
+            self.assertEqual(parse_config_file(CONFIG_FILE).app["session_backend"], "memory")
+        with mock.patch.dict(os.environ, {"SESSION_BACKEND": "memory", "WEB_CONCURRENCY": "4"}):
+            with self.assertRaises(ValueError):
+                parse_config_file(CONFIG_FILE)
+
+
+if __name__ == "__main__":
+    asynctest.main()
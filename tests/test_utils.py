@@ -1,4 +1,7 @@
 import re
+import base64
+import asyncio
+import hashlib
 
 import aiohttp
 import asynctest
@@ -8,13 +11,23 @@ from unittest.mock import MagicMock
 
 from aiohttp import web
 from aioresponses import aioresponses
-from authlib.jose import jwt
+from authlib.jose import JsonWebKey, jwt
 
 from multidict import MultiDict
 
 from oidc_client.utils.utils import generate_state, get_from_cookies, save_to_cookies
 from oidc_client.utils.utils import request_token, query_params, get_jwk, validate_token
 from oidc_client.utils.utils import revoke_token, get_from_session, save_to_session
+from oidc_client.utils.utils import create_client_session, token_header, token_issuer, token_provider
+from oidc_client.utils.utils import introspection_params, introspect_token
+from oidc_client.utils.utils import refresh_access_token, save_tokens, pop_from_session
+from oidc_client.utils.utils import get_discovery, cache_lifetime, request_userinfo, get_userinfo
+from oidc_client.utils.utils import check_admin, check_introspection, revocation_params, AAIRequest
+from oidc_client.utils.utils import generate_pkce, validate_id_token
+from oidc_client.config import CONFIG, DEFAULT_PROVIDER
+from oidc_client.utils.jwks import KeyCache
+from oidc_client.utils.cache import LRUCache, create_shared_cache
+from oidc_client.utils.providers import Provider, setup_providers
 
 # Mock URLs in functions to replace the real request, checks for http/https/localhost in the beginning
 MOCK_URL = re.compile(r"^(http|localhost)")
@@ -38,7 +51,7 @@ class MockResponse:
         self.cookies.update({key: value, "domain": domain, "max_age": max_age, "secure": secure, "httponly": httponly})
 
 
-def mock_token(iss=None, aud=None, iat=None, exp=None):
+def mock_token(iss=None, aud=None, iat=None, exp=None, nonce=None, nbf=None):
     """Mock ELIXIR AAI token."""
     pem = {"kty": "oct", "kid": "018c0ae5-4d9b-471b-bfd6-eef314bc7037", "use": "sig", "alg": "HS256", "k": "hJtXIZ2uSN5kbQfbtTNWbpdmhkV8FJG-Onbc6mxCcYg"}
     header = {"jku": "https://login.elixir-czech.org/oidc/jwk", "kid": "018c0ae5-4d9b-471b-bfd6-eef314bc7037", "alg": "HS256"}
@@ -51,6 +64,10 @@ def mock_token(iss=None, aud=None, iat=None, exp=None):
         payload["iat"] = iat
     if exp is not None:
         payload["exp"] = exp
+    if nonce is not None:
+        payload["nonce"] = nonce
+    if nbf is not None:
+        payload["nbf"] = nbf
     token = jwt.encode(header, payload, pem).decode("utf-8")
     return token, pem
 
@@ -58,12 +75,43 @@ def mock_token(iss=None, aud=None, iat=None, exp=None):
 class TestUtils(asynctest.TestCase):
     """Test supporting utility functions."""
 
-    async def test_generate_state(self):
+    async def setUp(self):
+        """Initialise application with a pooled client session."""
+        self.config = asynctest.mock.patch.dict(CONFIG.client, {"aai_retry_backoff": 0.001})
+        self.config.start()
+        self.app = web.Application()
+        self.provider = Provider(DEFAULT_PROVIDER, CONFIG.aai, await create_client_session())
+        setup_providers(self.app, {DEFAULT_PROVIDER: self.provider})
+        self.app["token_cache"] = LRUCache()
+        self.app["userinfo_cache"] = LRUCache()
+        self.app["shared_cache"] = None
+
+    async def tearDown(self):
+        """Close pooled client session."""
+        self.config.stop()
+        await self.provider.close()
+
+    async def test_client_session(self):
+        """Test pooled client session creation."""
+        client_session = await create_client_session()
+        connector = client_session.connector
+        self.assertEqual(connector.limit, 100)
+        self.assertEqual(connector.limit_per_host, 50)
+        await client_session.close()
+
+    def test_generate_state(self):
         """Test state generation."""
-        state = await generate_state()
+        state = generate_state()
         assert type(state) == str
         assert len(state) == 64
 
+    def test_generate_pkce(self):
+        """Test PKCE code verifier and challenge generation."""
+        code_verifier, code_challenge = generate_pkce()
+        self.assertEqual(len(code_verifier), 43)
+        expected = base64.urlsafe_b64encode(hashlib.sha256(code_verifier.encode()).digest()).decode().rstrip("=")
+        self.assertEqual(code_challenge, expected)
+
     async def test_get_from_cookies(self):
         """Test retrieving values from cookies by key."""
         request = mock_request_with_cookies({"flavour": "white chocolate"})
@@ -85,21 +133,133 @@ class TestUtils(asynctest.TestCase):
         expected_cookies = {"summer": "unbearable", "domain": "localhost:8080", "httponly": True, "max_age": 3600, "secure": True}
         assert response_with_cookies.cookies == expected_cookies
 
+    @aioresponses()
+    async def test_aai_request(self, m):
+        """Test requests to AAI with retries and circuit breaker."""
+        # Test idempotent request is retried after server errors and connection errors
+        m.get(MOCK_URL, status=503)
+        m.get(MOCK_URL, exception=aiohttp.ClientConnectionError("Connection refused"))
+        m.get(MOCK_URL, status=200, payload={"ok": True})
+        async with AAIRequest(self.provider, "GET", "https://aai/keys", idempotent=True) as response:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(await response.json(), {"ok": True})
+        self.assertEqual(self.provider.breaker.failures, 0)
+        # Test non-idempotent request is not retried, and server error is returned to caller
+        m.post(MOCK_URL, status=502)
+        async with AAIRequest(self.provider, "POST", "https://aai/token") as response:
+            self.assertEqual(response.status, 502)
+        # Test connection errors after all retries
+        for _ in range(3):
+            m.get(MOCK_URL, exception=asyncio.TimeoutError())
+        with self.assertRaises(web.HTTPBadGateway):
+            async with AAIRequest(self.provider, "GET", "https://aai/keys", idempotent=True):
+                pass
+        # Test that requests are refused without reaching AAI once the circuit opens
+        self.assertEqual(self.provider.breaker.failures, 4)
+        m.post(MOCK_URL, exception=aiohttp.ClientConnectionError("Connection refused"))
+        with self.assertRaises(web.HTTPBadGateway):
+            async with AAIRequest(self.provider, "POST", "https://aai/token"):
+                pass
+        with self.assertRaises(web.HTTPServiceUnavailable) as refused:
+            async with AAIRequest(self.provider, "POST", "https://aai/token"):
+                pass
+        self.assertEqual(refused.exception.headers["Retry-After"], "30")
+
     @aioresponses()
     async def test_request_token(self, m):
         """Test token request."""
         # Test token received
-        m.post(MOCK_URL, status=200, payload={"access_token": "secret"})
-        token = await request_token("123")
-        assert token == "secret"
+        m.post(MOCK_URL, status=200, payload={"access_token": "secret", "refresh_token": "refresh"})
+        tokens = await request_token(self.provider, "123")
+        self.assertEqual(tokens, {"access_token": "secret", "refresh_token": "refresh"})
         # Test request OK, but token not received
         m.post(MOCK_URL, status=200, payload={})
         with self.assertRaises(web.HTTPBadRequest):
-            await request_token("123")
+            await request_token(self.provider, "123")
         # Test failed request
         m.post(MOCK_URL, status=400)
         with self.assertRaises(web.HTTPBadRequest):
-            await request_token("123")
+            await request_token(self.provider, "123")
+        # Test PKCE code verifier is sent
+        m.post(MOCK_URL, status=200, payload={"access_token": "secret"})
+        await request_token(self.provider, "123", "verifier")
+        request = list(m.requests.values())[0][-1]
+        self.assertEqual(request.kwargs["data"]["code_verifier"], "verifier")
+
+    @aioresponses()
+    async def test_refresh_access_token(self, m):
+        """Test token refresh."""
+        # Test token received
+        m.post(MOCK_URL, status=200, payload={"access_token": "secret"})
+        tokens = await refresh_access_token(self.provider, "refresh")
+        self.assertEqual(tokens, {"access_token": "secret"})
+        # Test request OK, but token not received
+        m.post(MOCK_URL, status=200, payload={})
+        with self.assertRaises(web.HTTPBadRequest):
+            await refresh_access_token(self.provider, "refresh")
+        # Test refresh token rejected
+        m.post(MOCK_URL, status=400)
+        with self.assertRaises(web.HTTPUnauthorized):
+            await refresh_access_token(self.provider, "refresh")
+        # Test failed request
+        m.post(MOCK_URL, status=500)
+        with self.assertRaises(web.HTTPBadRequest):
+            await refresh_access_token(self.provider, "refresh")
+
+    @asynctest.mock.patch("oidc_client.utils.utils.get_session")
+    async def test_save_tokens(self, m_session):
+        """Test saving tokens to session, and scheduling renewal."""
+        session = MagicMock(identity="session-id")
+        session_data = {}
+        session.__setitem__.side_effect = session_data.__setitem__
+        m_session.return_value = session
+        request = MagicMock(app={"token_renewer": MagicMock()})
+        # Test without refresh token
+        await save_tokens(request, {"access_token": "secret"}, {"exp": 9999999999})
+        self.assertEqual(session_data, {"access_token": "secret"})
+        request.app["token_renewer"].schedule.assert_not_called()
+        # Test with refresh token
+        await save_tokens(request, {"access_token": "secret", "refresh_token": "refresh"}, {"exp": 9999999999})
+        self.assertEqual(session_data, {"access_token": "secret", "refresh_token": "refresh"})
+        request.app["token_renewer"].schedule.assert_called_once_with("session-id", 9999999999)
+
+    @aioresponses()
+    async def test_request_userinfo(self, m):
+        """Test userinfo request."""
+        # Test userinfo received
+        m.get(MOCK_URL, status=200, payload={"sub": "smth@elixir-europe.org"})
+        self.assertEqual(await request_userinfo(self.provider, "token"), {"sub": "smth@elixir-europe.org"})
+        # Test token rejected
+        m.get(MOCK_URL, status=401)
+        with self.assertRaises(web.HTTPUnauthorized):
+            await request_userinfo(self.provider, "token")
+        # Test failed request, which is retried
+        for _ in range(3):
+            m.get(MOCK_URL, status=500)
+        with self.assertRaises(web.HTTPBadRequest):
+            await request_userinfo(self.provider, "token")
+
+    @asynctest.mock.patch("oidc_client.utils.utils.request_userinfo", return_value={"sub": "smth@elixir-europe.org"})
+    @asynctest.mock.patch("oidc_client.utils.utils.validate_token")
+    async def test_get_userinfo(self, m_validate, m_userinfo):
+        """Test that userinfo responses are cached until the token expires."""
+        m_validate.return_value = {"iss": "https://login.elixir-czech.org/oidc/", "sub": "smth@elixir-europe.org", "exp": 9999999999}
+        for _ in range(3):
+            self.assertEqual(await get_userinfo(self.app, "good.token"), {"sub": "smth@elixir-europe.org"})
+        m_userinfo.assert_called_once_with(self.provider, "good.token")
+        # Test that responses for different tokens are cached separately
+        await get_userinfo(self.app, "other.token")
+        self.assertEqual(m_userinfo.call_count, 2)
+        # Test that responses are not cached past token expiry
+        m_validate.return_value = {"iss": "https://login.elixir-czech.org/oidc/", "sub": "smth@elixir-europe.org", "exp": 1111111111}
+        await get_userinfo(self.app, "expiring.token")
+        await get_userinfo(self.app, "expiring.token")
+        self.assertEqual(m_userinfo.call_count, 4)
+        # Test that invalid tokens are not sent to AAI
+        m_validate.side_effect = web.HTTPUnauthorized(text="Could not validate access token: Expired signature")
+        with self.assertRaises(web.HTTPUnauthorized):
+            await get_userinfo(self.app, "bad.token")
+        self.assertEqual(m_userinfo.call_count, 4)
 
     async def test_query_params(self):
         """Test parsing of query params."""
@@ -117,52 +277,303 @@ class TestUtils(asynctest.TestCase):
         with self.assertRaises(web.HTTPBadRequest):
             await query_params(miss_request)
 
+    async def test_introspection_params(self):
+        """Test parsing of introspection request body."""
+        # Test form body with one or more tokens
+        request = MagicMock(content_type="application/x-www-form-urlencoded")
+        request.post = asynctest.CoroutineMock(return_value=MultiDict([("token", "a")]))
+        self.assertEqual(await introspection_params(request), (["a"], False))
+        request.post.return_value = MultiDict([("token", "a"), ("token", "b")])
+        self.assertEqual(await introspection_params(request), (["a", "b"], True))
+        # Test JSON body with one token, a list of tokens or an array
+        request = MagicMock(content_type="application/json")
+        request.json = asynctest.CoroutineMock(return_value={"token": "a"})
+        self.assertEqual(await introspection_params(request), (["a"], False))
+        request.json.return_value = {"tokens": ["a", "b"]}
+        self.assertEqual(await introspection_params(request), (["a", "b"], True))
+        request.json.return_value = ["a"]
+        self.assertEqual(await introspection_params(request), (["a"], True))
+        # Test missing or malformed tokens
+        for body in [{}, {"tokens": "a"}, {"tokens": []}, [1, 2], "a"]:
+            request.json.return_value = body
+            with self.assertRaises(web.HTTPBadRequest):
+                await introspection_params(request)
+        request.json.side_effect = ValueError
+        with self.assertRaises(web.HTTPBadRequest):
+            await introspection_params(request)
+        # Test too many tokens
+        request.json.side_effect = None
+        request.json.return_value = ["a"] * 101
+        with self.assertRaises(web.HTTPBadRequest):
+            await introspection_params(request)
+
+    @asynctest.mock.patch("oidc_client.utils.utils.validate_token")
+    async def test_introspect_token(self, m_validate):
+        """Test local token introspection."""
+        m_validate.return_value = {"sub": "smth@elixir-europe.org", "exp": 9999999999}
+        self.assertEqual(await introspect_token(self.app, "token"), {"active": True, "sub": "smth@elixir-europe.org", "exp": 9999999999})
+        m_validate.side_effect = web.HTTPUnauthorized()
+        self.assertEqual(await introspect_token(self.app, "token"), {"active": False})
+        m_validate.side_effect = web.HTTPInternalServerError()
+        with self.assertRaises(web.HTTPInternalServerError):
+            await introspect_token(self.app, "token")
+
     @aioresponses()
     async def test_get_jwk(self, m):
         """Test getting JWK."""
         # Test getting key from server
         m.get(MOCK_URL, status=200, payload={"hello": "there"})
-        key = await get_jwk()
+        key = await get_jwk(self.provider)
         self.assertEqual({"hello": "there"}, key)
+        # Test failed request
+        m.get(MOCK_URL, exception=aiohttp.ClientConnectionError())
+        with self.assertRaises(web.HTTPInternalServerError):
+            await get_jwk(self.provider)
+
+    async def test_check_admin(self):
+        """Test authorisation of admin requests."""
+        request = MagicMock(headers={"Authorization": "Bearer admin-secret"})
+        # Test admin endpoints disabled
+        with asynctest.mock.patch.dict(CONFIG.app, {"admin_token": None}):
+            with self.assertRaises(web.HTTPForbidden):
+                await check_admin(request)
+        with asynctest.mock.patch.dict(CONFIG.app, {"admin_token": "admin-secret"}):
+            # Test correct token
+            await check_admin(request)
+            # Test wrong token, wrong scheme and missing header
+            for headers in ({"Authorization": "Bearer wrong"}, {"Authorization": "Basic admin-secret"}, {}):
+                with self.assertRaises(web.HTTPUnauthorized):
+                    await check_admin(MagicMock(headers=headers))
+
+    async def test_check_introspection(self):
+        """Test authentication of introspection requests."""
+        # Test introspection disabled
+        with asynctest.mock.patch.dict(CONFIG.app, {"introspection_token": None, "admin_token": None}):
+            with self.assertRaises(web.HTTPForbidden):
+                await check_introspection(MagicMock(headers={"Authorization": "Bearer secret"}))
+        with asynctest.mock.patch.dict(CONFIG.app, {"introspection_token": "introspection-secret", "admin_token": "admin-secret"}):
+            # Test introspection token and admin token
+            for token in ("introspection-secret", "admin-secret"):
+                await check_introspection(MagicMock(headers={"Authorization": f"Bearer {token}"}))
+            # Test wrong token and missing header
+            for headers in ({"Authorization": "Bearer wrong"}, {}):
+                with self.assertRaises(web.HTTPUnauthorized):
+                    await check_introspection(MagicMock(headers=headers))
+
+    async def test_revocation_params(self):
+        """Test parsing of tokens for bulk revocation."""
+        # Test JSON array
+        request = MagicMock(content_type="application/json")
+        request.json = asynctest.CoroutineMock(return_value=["token1", "token2"])
+        self.assertEqual(await revocation_params(request), ["token1", "token2"])
+        # Test bad JSON
+        for error in ({"json": ValueError()}, {"return_value": {"token": "token1"}}, {"return_value": ["token1", 2]}):
+            request.json = asynctest.CoroutineMock(side_effect=error.get("json"), return_value=error.get("return_value"))
+            with self.assertRaises(web.HTTPBadRequest):
+                await revocation_params(request)
+        # Test lines streamed from body
+        stream = aiohttp.StreamReader(MagicMock(), limit=65536, loop=self.loop)
+        stream.feed_data(b"token1\n\n  token2\r\ntoken3")
+        stream.feed_eof()
+        tokens = await revocation_params(MagicMock(content_type="text/plain", content=stream))
+        self.assertEqual([token async for token in tokens], ["token1", "token2", "token3"])
 
-    @asynctest.mock.patch("oidc_client.utils.utils.get_jwk")
+    @aioresponses()
+    async def test_get_discovery(self, m):
+        """Test retrieving discovery document."""
+        # Test document with lifetime
+        m.get(MOCK_URL, status=200, payload={"issuer": "https://aai/"}, headers={"Cache-Control": "public, max-age=600", "Age": "100"})
+        metadata, lifetime = await get_discovery(self.provider, "https://aai/.well-known/openid-configuration")
+        self.assertEqual(metadata, {"issuer": "https://aai/"})
+        self.assertEqual(lifetime, 500)
+        # Test document without lifetime
+        m.get(MOCK_URL, status=200, payload={"issuer": "https://aai/"})
+        self.assertEqual(await get_discovery(self.provider, "https://aai/.well-known/openid-configuration"), ({"issuer": "https://aai/"}, None))
+        # Test failed request, which is retried, and malformed document
+        for _ in range(3):
+            m.get(MOCK_URL, status=500)
+        with self.assertRaises(web.HTTPInternalServerError):
+            await get_discovery(self.provider, "https://aai/.well-known/openid-configuration")
+        m.get(MOCK_URL, status=200, payload=["issuer"])
+        with self.assertRaises(web.HTTPInternalServerError):
+            await get_discovery(self.provider, "https://aai/.well-known/openid-configuration")
+
+    def test_cache_lifetime(self):
+        """Test reading cache lifetime from Cache-Control and Age headers."""
+        self.assertEqual(cache_lifetime("max-age=3600"), 3600)
+        self.assertEqual(cache_lifetime('public, MAX-AGE="60"', "10"), 50)
+        self.assertEqual(cache_lifetime("max-age=60", "120"), 0)
+        self.assertEqual(cache_lifetime("max-age=60", "yesterday"), 60)
+        self.assertEqual(cache_lifetime("no-cache, max-age=60"), 0)
+        self.assertEqual(cache_lifetime("no-store"), 0)
+        self.assertIsNone(cache_lifetime("public"))
+        self.assertIsNone(cache_lifetime("max-age=forever"))
+        self.assertIsNone(cache_lifetime(""))
+
+    async def test_token_header(self):
+        """Test reading unverified token header."""
+        token, _ = mock_token()
+        self.assertEqual(token_header(token)["kid"], "018c0ae5-4d9b-471b-bfd6-eef314bc7037")
+        self.assertEqual(token_header("not a token"), {})
+        self.assertEqual(token_header("MQ.e30.sig"), {})
+
+    async def test_token_provider(self):
+        """Test finding the provider of a token by its issuer."""
+        token, _ = mock_token(iss="https://aai.example.org/")
+        self.assertEqual(token_issuer(token), "https://aai.example.org/")
+        self.assertIsNone(token_issuer(mock_token()[0]))
+        self.assertIsNone(token_issuer("not a token"))
+        self.assertIsNone(token_issuer("e30.WzFd.sig"))
+        other = Provider("other", dict(CONFIG.aai, iss="https://aai.example.org/"), self.provider.client_session)
+        setup_providers(self.app, {DEFAULT_PROVIDER: self.provider, "other": other})
+        self.assertIs(token_provider(self.app, token), other)
+        # Test that tokens of unknown issuers are left to the default provider
+        self.assertIs(token_provider(self.app, mock_token(iss="https://evil.example.org/")[0]), self.provider)
+        self.assertIs(token_provider(self.app, "not a token"), self.provider)
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
     async def test_validate_token(self, m_jwk):
         """Test token validation."""
         # Test token passes (raises no exceptions)
         token, pem = mock_token(iss="https://login.elixir-czech.org/oidc/", aud="audience1", iat=1111111111, exp=9999999999)
         m_jwk.return_value = pem
-        self.assertEqual(await validate_token(token), None)
+        claims = await validate_token(self.app, token)
+        self.assertEqual(claims["sub"], "smth@elixir-europe.org")
         # Test for a missing claim
         token, pem = mock_token(iss="https://login.elixir-czech.org/oidc/", aud="audience1", exp=9999999999)
         m_jwk.return_value = pem
         with self.assertRaises(web.HTTPUnauthorized):
-            await validate_token(token)
+            await validate_token(self.app, token)
         # Test for expired token
         token, pem = mock_token(iss="https://login.elixir-czech.org/oidc/", aud="audience1", iat=1111111111, exp=1111111111)
         m_jwk.return_value = pem
         with self.assertRaises(web.HTTPUnauthorized):
-            await validate_token(token)
+            await validate_token(self.app, token)
         # Test for invalid claim value
         token, pem = mock_token(iss="https://login.elixir-czech.org/oidc/", aud="wrong_audience", iat=1111111111, exp=9999999999)
         m_jwk.return_value = pem
         with self.assertRaises(web.HTTPForbidden):
-            await validate_token(token)
+            await validate_token(self.app, token)
         # Test for bad key/signature
+        token, pem = mock_token(iss="https://login.elixir-czech.org/oidc/", aud="audience1", iat=1111111111, exp=9999999999)
+        m_jwk.return_value = dict(pem, k="YW5vdGhlciBrZXk")
+        self.provider.jwks = KeyCache(self.provider)
+        self.app["token_cache"] = LRUCache()
+        with self.assertRaises(web.HTTPForbidden):
+            await validate_token(self.app, token)
+        # Test for token, that is not valid yet
+        token, pem = mock_token(iss="https://login.elixir-czech.org/oidc/", aud="audience1", iat=1111111111, exp=9999999999, nbf=9999999999)
+        m_jwk.return_value = pem
+        self.provider.jwks = KeyCache(self.provider)
+        with self.assertRaises(web.HTTPUnauthorized):
+            await validate_token(self.app, token)
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_introspect_rejected_token(self, m_jwk):
+        """Test that tokens rejected by authlib are introspected as inactive."""
+        # Test for token, that is not valid yet
+        token, m_jwk.return_value = mock_token(iss="https://login.elixir-czech.org/oidc/", aud="audience1", iat=1111111111, exp=9999999999, nbf=9999999999)
+        self.assertEqual(await introspect_token(self.app, token), {"active": False})
+        # Test for HS256 token checked against the RSA key of the provider
         token, _ = mock_token(iss="https://login.elixir-czech.org/oidc/", aud="audience1", iat=1111111111, exp=9999999999)
-        m_jwk.return_value = "another key"
+        m_jwk.return_value = JsonWebKey.generate_key("RSA", 2048).as_dict()
+        self.provider.jwks = KeyCache(self.provider)
+        self.app["token_cache"] = LRUCache()
+        self.assertEqual(await introspect_token(self.app, token), {"active": False})
+
+    @asynctest.mock.patch("oidc_client.utils.jwks.get_jwk")
+    async def test_validate_id_token(self, m_jwk):
+        """Test ID token validation."""
+        iss = "https://login.elixir-czech.org/oidc/"
+        # Test ID token issued to this client for this login
+        token, m_jwk.return_value = mock_token(iss=iss, aud=CONFIG.aai["client_id"], iat=1111111111, exp=9999999999, nonce="nonce")
+        claims = await validate_id_token(self.provider, token, "nonce")
+        self.assertEqual(claims["nonce"], "nonce")
+        # Test ID token of another login
+        with self.assertRaises(web.HTTPForbidden):
+            await validate_id_token(self.provider, token, "another")
+        # Test ID token without nonce
+        token, m_jwk.return_value = mock_token(iss=iss, aud=CONFIG.aai["client_id"], iat=1111111111, exp=9999999999)
+        with self.assertRaises(web.HTTPUnauthorized) as missing:
+            await validate_id_token(self.provider, token, "nonce")
+        self.assertIn("Could not validate ID token", missing.exception.text)
+        # Test access token is not accepted as ID token
+        token, m_jwk.return_value = mock_token(iss=iss, aud="audience1", iat=1111111111, exp=9999999999, nonce="nonce")
         with self.assertRaises(web.HTTPForbidden):
-            await validate_token(token)
+            await validate_id_token(self.provider, token, "nonce")
+
+    @asynctest.mock.patch("oidc_client.utils.utils.decode_token")
+    async def test_validate_token_cached(self, m_decode):
+        """Test that token validation results are cached."""
+        # Test successful validation is cached
+        m_decode.return_value = {"sub": "smth@elixir-europe.org", "exp": 9999999999}
+        for _ in range(3):
+            claims = await validate_token(self.app, "good.token")
+            self.assertEqual(claims["sub"], "smth@elixir-europe.org")
+        m_decode.assert_called_once()
+        self.assertEqual(self.app["token_cache"].hits, 2)
+        # Test failed validation is cached with the same error
+        m_decode.side_effect = web.HTTPForbidden(text="bad token")
+        for _ in range(3):
+            with self.assertRaises(web.HTTPForbidden) as e:
+                await validate_token(self.app, "bad.token")
+            self.assertEqual(e.exception.text, "bad token")
+        self.assertEqual(m_decode.call_count, 2)
+        # Test that expired tokens are not cached
+        m_decode.side_effect = None
+        m_decode.return_value = {"sub": "smth@elixir-europe.org", "exp": 1111111111}
+        await validate_token(self.app, "old.token")
+        await validate_token(self.app, "old.token")
+        self.assertEqual(m_decode.call_count, 4)
+        # Test that server errors are not cached
+        m_decode.side_effect = web.HTTPInternalServerError()
+        with self.assertRaises(web.HTTPInternalServerError):
+            await validate_token(self.app, "another.token")
+        self.assertIsNone(self.app["token_cache"].get(hashlib.sha256(b"another.token").digest()))
+
+    @asynctest.mock.patch("oidc_client.utils.utils.decode_token")
+    async def test_validate_token_shared(self, m_decode):
+        """Test that token validation results are shared by workers through the shared cache."""
+        with asynctest.mock.patch.dict(CONFIG.cache, {"shared_cache_url": "memory://"}):
+            self.app["shared_cache"] = create_shared_cache()
+        worker = web.Application()
+        worker.update(self.app)
+        worker["token_cache"] = LRUCache()
+        # Test that a token validated by one worker is not validated again by another
+        m_decode.return_value = {"sub": "smth@elixir-europe.org", "exp": 9999999999}
+        await validate_token(self.app, "good.token")
+        self.assertEqual(await validate_token(worker, "good.token"), m_decode.return_value)
+        self.assertEqual(await validate_token(worker, "good.token"), m_decode.return_value)
+        self.assertEqual(worker["token_cache"].hits, 1)
+        # Test that failed validation is shared with the same error
+        m_decode.side_effect = web.HTTPUnauthorized(text="expired token")
+        with self.assertRaises(web.HTTPUnauthorized):
+            await validate_token(self.app, "bad.token")
+        with self.assertRaises(web.HTTPUnauthorized) as e:
+            await validate_token(worker, "bad.token")
+        self.assertEqual(e.exception.text, "expired token")
+        m_decode.assert_called_with(self.provider, "bad.token")
+        self.assertEqual(m_decode.call_count, 2)
+        # Test that tokens unknown to both caches are validated
+        m_decode.side_effect = None
+        await validate_token(worker, "new.token")
+        self.assertEqual(m_decode.call_count, 3)
+        await self.app["shared_cache"].cache.clear()
 
     @aioresponses()
     async def test_revoke_token(self, m):
         """Test token revocation."""
         # Test successful revocation of token
         m.get(MOCK_URL, status=200)
-        await revoke_token("token")
+        await revoke_token(self.provider, "token")
         # Test failed revocation of token
         m.get(MOCK_URL, status=400)
         with self.assertRaises(web.HTTPBadRequest):
-            await revoke_token("what")
+            await revoke_token(self.provider, "what")
+        # Test server error at AAI without retries
+        m.get(MOCK_URL, status=500)
+        with self.assertRaises(web.HTTPBadGateway):
+            await revoke_token(self.provider, "what", retry=False)
 
     @asynctest.mock.patch("oidc_client.utils.utils.get_session", return_value={})
     async def test_save_to_session(self, m_session):
@@ -175,6 +586,12 @@ class TestUtils(asynctest.TestCase):
         value = await get_from_session("request", "hello")
         self.assertEqual(value, "there")
 
+    @asynctest.mock.patch("oidc_client.utils.utils.get_session", return_value={"hello": "there"})
+    async def test_pop_from_session(self, m_session):
+        """Test removing from session."""
+        self.assertEqual(await pop_from_session("request", "hello"), "there")
+        self.assertIsNone(await pop_from_session("request", "hello"))
+
     @asynctest.mock.patch("oidc_client.utils.utils.get_session", return_value={})
     async def test_get_from_session_not_found(self, m_session):
         """Test reading from session, key not found."""